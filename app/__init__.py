@@ -6,8 +6,10 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
 from core.configuration.configuration import get_app_version
+from core.managers.analytics_manager import AnalyticsManager
 from core.managers.config_manager import ConfigManager
 from core.managers.error_handler_manager import ErrorHandlerManager
+from core.managers.job_manager import JobManager
 from core.managers.logging_manager import LoggingManager
 from core.managers.module_manager import ModuleManager
 
@@ -30,6 +32,14 @@ def create_app(config_name="development"):
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Set up the write-behind buffer for view and download records
+    analytics_manager = AnalyticsManager(app)
+    analytics_manager.setup_analytics()
+
+    # Set up the background job queue
+    job_manager = JobManager(app)
+    job_manager.setup_jobs()
+
     # Register modules
     module_manager = ModuleManager(app)
     module_manager.register_modules()
@@ -0,0 +1,154 @@
+"""
+Single pass ingestion of uploaded CSV files. The upload is copied to its destination while the bytes that go
+through are hashed and parsed, so the checksum, the header, the row count, the validation errors and the
+statistics of the numeric columns are all known once the file is on disk, without reading it again. They are
+saved in a small manifest next to the file, which create_from_form uses instead of opening the file once more,
+and the parsed columns in a columnar sidecar (see app.modules.hubfile.columnar) when a sidecar directory is
+given. Bulk imports run the same ingestion over files already on disk, in a pool of processes.
+"""
+import hashlib
+import io
+import json
+import os
+
+from app.modules.flamapy.validation import ColumnarCsvValidator
+from app.modules.hubfile.columnar import get_sidecar_path, write_sidecar
+from app.modules.hubfile.statistics import compute_statistics
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Errors kept in the manifest, the total is always counted
+MAX_STORED_ERRORS = 100
+
+
+class IngestingReader(io.RawIOBase):
+    """
+    Reads from `source` and, on the way, writes every chunk to `destination` (when given) and into the MD5 and
+    size of the content.
+    """
+
+    def __init__(self, source, destination=None):
+        self.source = source
+        self.destination = destination
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.source.read(min(len(buffer), COPY_CHUNK_SIZE))
+        if not chunk:
+            return 0
+        if self.destination is not None:
+            self.destination.write(chunk)
+        self.md5.update(chunk)
+        self.size += len(chunk)
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    def drain(self):
+        while self.read(COPY_CHUNK_SIZE):
+            pass
+
+
+def get_manifest_path(file_path):
+    directory, filename = os.path.split(file_path)
+    return os.path.join(directory, f".{filename}.ingest.json")
+
+
+def ingest_csv(source, file_path=None, sidecar_dir=None):
+    """
+    Reads a CSV file from the binary stream `source`, copying it to `file_path` when given, and returns its
+    manifest: checksum, size, columns, row_count, error_count, the first MAX_STORED_ERRORS errors and the
+    statistics of the numeric columns. The file is written under a temporary name and only renamed to
+    `file_path` once complete. With `sidecar_dir`, the columnar sidecar of the content is written there too.
+    """
+    temporary_path = f"{file_path}.part" if file_path else None
+    destination = open(temporary_path, "wb") if temporary_path else None
+    try:
+        reader = IngestingReader(source, destination)
+        validator, report = parse_csv(reader)
+        # Parsing may stop early, the rest of the file still has to be copied and hashed
+        reader.drain()
+    except BaseException:
+        if destination is not None:
+            destination.close()
+            os.remove(temporary_path)
+        raise
+
+    if destination is not None:
+        destination.close()
+        os.replace(temporary_path, file_path)
+
+    checksum, values = reader.md5.hexdigest(), validator.get_values()
+    if sidecar_dir is not None:
+        write_sidecar(get_sidecar_path(sidecar_dir, checksum), checksum, reader.size, validator.get_names(), values)
+
+    return {
+        "checksum": checksum,
+        "size": reader.size,
+        "columns": validator.columns,
+        "row_count": report.row_count,
+        "error_count": report.error_count,
+        "errors": report.messages()[:MAX_STORED_ERRORS],
+        "statistics": compute_statistics(values),
+    }
+
+
+def parse_csv(reader):
+    validator = ColumnarCsvValidator(collect_values=True)
+    return validator, validator.validate(reader)
+
+
+def save_manifest(file_path, manifest):
+    with open(get_manifest_path(file_path), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def load_manifest(file_path):
+    """
+    The manifest saved when the file was uploaded, or None when there is none or the file changed since.
+    """
+    try:
+        with open(get_manifest_path(file_path)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("size") != os.path.getsize(file_path):
+        return None
+    return manifest
+
+
+def get_manifest(file_path, sidecar_dir=None):
+    """
+    The manifest of a file already on disk, ingesting it (without copying it) when it has none.
+    """
+    manifest = load_manifest(file_path)
+    if manifest is None:
+        with open(file_path, "rb") as source:
+            manifest = ingest_csv(source, sidecar_dir=sidecar_dir)
+        save_manifest(file_path, manifest)
+    return manifest
+
+
+def ingest_file(file_path, sidecar_dir=None):
+    """
+    The manifest of a file on disk, without saving it. Top level so that process pools can run it.
+    """
+    with open(file_path, "rb") as source:
+        return ingest_csv(source, sidecar_dir=sidecar_dir)
+
+
+def find_dataset_folders(root):
+    """
+    Yields (folder, CSV file paths) for every folder under root with CSV files, in a stable order. Hidden files,
+    such as manifests, are left out.
+    """
+    for folder, subfolders, filenames in os.walk(root):
+        subfolders.sort()
+        csv_files = sorted(
+            filename for filename in filenames if filename.lower().endswith(".csv") and not filename.startswith(".")
+        )
+        if csv_files:
+            yield folder, [os.path.join(folder, filename) for filename in csv_files]
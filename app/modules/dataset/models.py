@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 from enum import Enum
 
@@ -15,6 +16,19 @@ class PublicationType(Enum):
     OTHER = "other"
 
 
+class PublishJobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    RETRYING = "retrying"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+def get_nbahub_doi_url(dataset_doi: str) -> str:
+    domain = os.getenv("DOMAIN", "localhost")
+    return f"http://{domain}/doi/{dataset_doi}"
+
+
 class Author(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -91,14 +105,17 @@ class DataSet(db.Model):
         return SizeService().get_human_readable_size(self.get_file_total_size())
 
     def get_nbahub_doi(self):
-        from app.modules.dataset.services import DataSetService
-
-        return DataSetService().get_nbahub_doi(self)
+        return get_nbahub_doi_url(self.ds_meta_data.dataset_doi)
 
     def get_download_count(self) -> int:
         return self.download_count
 
     def to_dict(self):
+        from app.modules.dataset.services import SizeService
+
+        files = self.files()
+        total_size = sum(file.size for file in files)
+
         return {
             "title": self.ds_meta_data.title,
             "id": self.id,
@@ -113,10 +130,10 @@ class DataSet(db.Model):
             "url": self.get_nbahub_doi(),
             "download": f'{request.host_url.rstrip("/")}/dataset/download/{self.id}',
             "zenodo": self.get_zenodo_url(),
-            "files": [file.to_dict() for fm in self.feature_models for file in fm.files],
-            "files_count": self.get_files_count(),
-            "total_size_in_bytes": self.get_file_total_size(),
-            "total_size_in_human_format": self.get_file_total_size_for_human(),
+            "files": [file.to_dict() for file in files],
+            "files_count": len(files),
+            "total_size_in_bytes": total_size,
+            "total_size_in_human_format": SizeService().get_human_readable_size(total_size),
         }
 
     def __repr__(self):
@@ -139,6 +156,83 @@ class DSDownloadRecord(db.Model):
         )
 
 
+class DSDownloadDailyCount(db.Model):
+    """
+    Number of download records of a dataset per day, kept up to date as downloads are recorded.
+    """
+
+    __tablename__ = "ds_download_daily_count"
+    __table_args__ = (db.Index("ix_ds_download_daily_count_day_dataset", "day", "dataset_id"),)
+
+    dataset_id = db.Column(db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DownloadDailyCount dataset_id={self.dataset_id} day={self.day} count={self.count}>"
+
+
+class DSRelatedFeature(db.Model):
+    """
+    Normalized tag or author of a synchronized dataset, with the weight it has when comparing datasets.
+    """
+
+    __tablename__ = "ds_related_feature"
+    __table_args__ = (db.Index("ix_ds_related_feature_feature_dataset", "feature", "dataset_id"),)
+
+    dataset_id = db.Column(db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), primary_key=True)
+    feature = db.Column(db.String(128), primary_key=True)
+    weight = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<RelatedFeature dataset_id={self.dataset_id} feature={self.feature} weight={self.weight}>"
+
+
+class DSNeighbor(db.Model):
+    """
+    One of the datasets most related to another one, precomputed so the dataset page reads them directly.
+    """
+
+    __tablename__ = "ds_neighbor"
+
+    dataset_id = db.Column(db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), primary_key=True)
+    neighbor_id = db.Column(
+        db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<Neighbor dataset_id={self.dataset_id} neighbor_id={self.neighbor_id} score={self.score}>"
+
+
+class DSPublishJob(db.Model):
+    """
+    State of the background job that deposits a dataset and gets its DOI. There is one per dataset, so publishing
+    a dataset again reuses it instead of queueing a second job.
+    """
+
+    __tablename__ = "ds_publish_job"
+
+    dataset_id = db.Column(db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), primary_key=True)
+    status = db.Column(SQLAlchemyEnum(PublishJobStatus), nullable=False, default=PublishJobStatus.QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "dataset_id": self.dataset_id,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f"<PublishJob dataset_id={self.dataset_id} status={self.status.value} attempts={self.attempts}>"
+
+
 class DSViewRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
@@ -1,13 +1,28 @@
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional
 import uuid
 import pytz
 
 from flask_login import current_user
-from sqlalchemy import desc, func, or_
+from sqlalchemy import bindparam, delete, desc, func, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import selectinload
 
-from app.modules.dataset.models import Author, DataSet, DOIMapping, DSDownloadRecord, DSMetaData, DSViewRecord
+from app.modules.dataset.models import (
+    Author,
+    DataSet,
+    DOIMapping,
+    DSDownloadDailyCount,
+    DSDownloadRecord,
+    DSMetaData,
+    DSNeighbor,
+    DSPublishJob,
+    DSRelatedFeature,
+    DSViewRecord,
+    PublishJobStatus,
+)
+from app.modules.featuremodel.models import FeatureModel
 from core.repositories.BaseRepository import BaseRepository
 
 logger = logging.getLogger(__name__)
@@ -23,8 +38,7 @@ class DSDownloadRecordRepository(BaseRepository):
         super().__init__(DSDownloadRecord)
 
     def total_dataset_downloads(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
     
     def create_new_record(self, dataset: DataSet, user_cookie: str) -> DSDownloadRecord:
         return self.create(
@@ -35,6 +49,182 @@ class DSDownloadRecordRepository(BaseRepository):
         )
 
 
+class DSDownloadDailyCountRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DSDownloadDailyCount)
+
+    def add_counts(self, counts: dict[tuple[int, date], int], connection=None):
+        """
+        Adds counts[(dataset_id, day)] to the matching buckets, creating the ones that do not exist yet.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        rows = [{"dataset_id": dataset_id, "day": day, "count": count} for (dataset_id, day), count in counts.items()]
+        if not rows:
+            return
+
+        if connection.dialect.name == "mysql":
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update(count=table.c["count"] + statement.inserted["count"])
+            connection.execute(statement, rows)
+            return
+
+        # Backends without INSERT ... ON DUPLICATE KEY UPDATE
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(table.c.dataset_id == row["dataset_id"], table.c.day == row["day"])
+                .values(count=table.c["count"] + row["count"])
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table), row)
+
+    def rebuild(self) -> int:
+        """
+        Recomputes every bucket from the raw download records. Returns the number of buckets.
+        """
+        day = func.date(DSDownloadRecord.download_date)
+        self.session.execute(delete(self.model))
+        self.session.execute(
+            insert(self.model).from_select(
+                ["dataset_id", "day", "count"],
+                select(DSDownloadRecord.dataset_id, day, func.count(DSDownloadRecord.id))
+                .where(DSDownloadRecord.dataset_id.isnot(None))
+                .group_by(DSDownloadRecord.dataset_id, day),
+            )
+        )
+        self.session.commit()
+        return self.count()
+
+
+class DSNeighborRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DSNeighbor)
+
+    def get_dataset_ids_by_ds_meta_data(self, ds_meta_data_ids, connection=None) -> set[int]:
+        connection = connection or self.session.connection()
+        return set(
+            connection.execute(select(DataSet.id).where(DataSet.ds_meta_data_id.in_(ds_meta_data_ids))).scalars()
+        )
+
+    def get_feature_sources(self, dataset_ids, connection=None) -> dict[int, tuple[Optional[str], list[str]]]:
+        """
+        Tags and author names of the given datasets as {dataset_id: (tags, [author_name, ...])}. Only
+        synchronized datasets are returned, the others are never related to anything.
+        """
+        connection = connection or self.session.connection()
+        sources = {}
+
+        rows = connection.execute(
+            select(DataSet.id, DSMetaData.tags)
+            .join(DSMetaData, DataSet.ds_meta_data_id == DSMetaData.id)
+            .where(DataSet.id.in_(dataset_ids), DSMetaData.dataset_doi.isnot(None))
+        )
+        for dataset_id, tags in rows:
+            sources[dataset_id] = (tags, [])
+
+        author_rows = connection.execute(
+            select(DataSet.id, Author.name)
+            .join(Author, Author.ds_meta_data_id == DataSet.ds_meta_data_id)
+            .where(DataSet.id.in_(list(sources)))
+        )
+        for dataset_id, name in author_rows:
+            sources[dataset_id][1].append(name)
+
+        return sources
+
+    def replace_features(self, dataset_ids, features: dict[int, dict[str, float]], connection=None):
+        connection = connection or self.session.connection()
+        connection.execute(delete(DSRelatedFeature).where(DSRelatedFeature.dataset_id.in_(dataset_ids)))
+        rows = [
+            {"dataset_id": dataset_id, "feature": feature, "weight": weight}
+            for dataset_id, dataset_features in features.items()
+            for feature, weight in dataset_features.items()
+        ]
+        if rows:
+            connection.execute(insert(DSRelatedFeature), rows)
+
+    def get_total_weights(self, dataset_ids, connection=None) -> dict[int, float]:
+        connection = connection or self.session.connection()
+        rows = connection.execute(
+            select(DSRelatedFeature.dataset_id, func.sum(DSRelatedFeature.weight))
+            .where(DSRelatedFeature.dataset_id.in_(dataset_ids))
+            .group_by(DSRelatedFeature.dataset_id)
+        )
+        return {dataset_id: float(total) for dataset_id, total in rows}
+
+    def get_shared_weights(self, dataset_id, connection=None) -> dict[int, float]:
+        """
+        Total weight of the features each other dataset shares with the given one, for the datasets that
+        share at least one.
+        """
+        connection = connection or self.session.connection()
+        own = DSRelatedFeature.__table__.alias("own")
+        other = DSRelatedFeature.__table__.alias("other")
+        rows = connection.execute(
+            select(other.c.dataset_id, func.sum(other.c.weight))
+            .join(own, own.c.feature == other.c.feature)
+            .where(own.c.dataset_id == dataset_id, other.c.dataset_id != dataset_id)
+            .group_by(other.c.dataset_id)
+        )
+        return {other_id: float(shared) for other_id, shared in rows}
+
+    def get_neighbors(self, dataset_ids, connection=None) -> dict[int, dict[int, float]]:
+        connection = connection or self.session.connection()
+        neighbors = {dataset_id: {} for dataset_id in dataset_ids}
+        rows = connection.execute(
+            select(self.model.dataset_id, self.model.neighbor_id, self.model.score)
+            .where(self.model.dataset_id.in_(dataset_ids))
+        )
+        for dataset_id, neighbor_id, score in rows:
+            neighbors[dataset_id][neighbor_id] = score
+        return neighbors
+
+    def get_dataset_ids_with_neighbor(self, neighbor_ids, connection=None) -> set[int]:
+        connection = connection or self.session.connection()
+        return set(
+            connection.execute(
+                select(self.model.dataset_id).where(self.model.neighbor_id.in_(neighbor_ids))
+            ).scalars()
+        )
+
+    def replace_neighbors(self, neighbors: dict[int, dict[int, float]], connection=None):
+        connection = connection or self.session.connection()
+        connection.execute(delete(self.model).where(self.model.dataset_id.in_(list(neighbors))))
+        rows = [
+            {"dataset_id": dataset_id, "neighbor_id": neighbor_id, "score": score}
+            for dataset_id, dataset_neighbors in neighbors.items()
+            for neighbor_id, score in dataset_neighbors.items()
+        ]
+        if rows:
+            connection.execute(insert(self.model), rows)
+
+    def remove_datasets(self, dataset_ids, connection=None):
+        """
+        Drops every row about the given datasets, for backends that do not cascade the deletes themselves.
+        """
+        connection = connection or self.session.connection()
+        connection.execute(delete(DSRelatedFeature).where(DSRelatedFeature.dataset_id.in_(dataset_ids)))
+        connection.execute(
+            delete(self.model).where(
+                or_(self.model.dataset_id.in_(dataset_ids), self.model.neighbor_id.in_(dataset_ids))
+            )
+        )
+
+    def get_related_datasets(self, dataset_id: int, limit: int = 4):
+        return (
+            DataSet.query.join(self.model, self.model.neighbor_id == DataSet.id)
+            .filter(self.model.dataset_id == dataset_id)
+            .order_by(self.model.score.desc(), DataSet.download_count.desc(), DataSet.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def get_all_dataset_ids(self, connection=None) -> list[int]:
+        connection = connection or self.session.connection()
+        return list(connection.execute(select(DataSet.id).order_by(DataSet.id)).scalars())
+
+
 class DSMetaDataRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSMetaData)
@@ -43,13 +233,32 @@ class DSMetaDataRepository(BaseRepository):
         return self.model.query.filter_by(dataset_doi=doi).first()
 
 
+class DSPublishJobRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DSPublishJob)
+
+    def get_stale(self, updated_before: datetime) -> list[DSPublishJob]:
+        """
+        The jobs still queued, running or retrying that have not changed since updated_before.
+        """
+        return list(
+            self.session.execute(
+                select(self.model).where(
+                    self.model.status.in_(
+                        [PublishJobStatus.QUEUED, PublishJobStatus.RUNNING, PublishJobStatus.RETRYING]
+                    ),
+                    self.model.updated_at < updated_before,
+                )
+            ).scalars()
+        )
+
+
 class DSViewRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSViewRecord)
 
     def total_dataset_views(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
 
     def the_record_exists(self, dataset: DataSet, user_cookie: str):
         return self.model.query.filter_by(
@@ -73,6 +282,36 @@ class DataSetRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
 
+    @staticmethod
+    def serialization_options() -> tuple:
+        """
+        Loader options for everything DataSet.to_dict walks (metadata, authors, feature models and their files), to put
+        on queries whose datasets are serialized.
+        """
+        return (
+            selectinload(DataSet.ds_meta_data).selectinload(DSMetaData.authors),
+            selectinload(DataSet.feature_models).selectinload(FeatureModel.files),
+        )
+
+    def load_for_serialization(self, datasets: list[DataSet]) -> list[DataSet]:
+        """
+        Loads everything DataSet.to_dict walks (metadata, authors, feature models and their files) for all the
+        given datasets at once, so the number of queries does not depend on how many datasets or files there are.
+        """
+        dataset_ids = [dataset.id for dataset in datasets]
+        if not dataset_ids:
+            return []
+
+        loaded_datasets = self.session.execute(
+            select(DataSet)
+            .where(DataSet.id.in_(dataset_ids))
+            .options(*self.serialization_options())
+            .execution_options(populate_existing=True)
+        ).scalars().all()
+
+        datasets_by_id = {dataset.id: dataset for dataset in loaded_datasets}
+        return [datasets_by_id[dataset_id] for dataset_id in dataset_ids if dataset_id in datasets_by_id]
+
     def find_by_id(self, dataset_id: int) -> DataSet:
         return self.model.query.filter_by(id=dataset_id).first(
         )
@@ -110,6 +349,7 @@ class DataSetRepository(BaseRepository):
         return (
             self.model.query.join(DSMetaData)
             .filter(DSMetaData.dataset_doi.isnot(None))
+            .options(*self.serialization_options())
             .order_by(desc(self.model.id))
             .limit(5)
             .all()
@@ -119,48 +359,71 @@ class DataSetRepository(BaseRepository):
             {DataSet.download_count: DataSet.download_count + 1}
         )
         self.session.commit()
+
+    def increment_download_counts(self, increments: dict[int, int], connection=None):
+        """
+        Adds increments[dataset_id] to the download count of each dataset in a single executemany, without committing.
+        """
+        connection = connection or self.session.connection()
+        table = DataSet.__table__
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("target_id"))
+            .values(download_count=table.c.download_count + bindparam("increment")),
+            [{"target_id": dataset_id, "increment": increment} for dataset_id, increment in increments.items()],
+        )
     
-    def get_top5_trending_datasets_last_30_days(self):
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    def get_trending_datasets(self, days: int = 30, limit: int = 5):
+        """
+        Most downloaded datasets in the last `days` days (today included), as (dataset, downloads) pairs. Sums at most
+        `days` daily buckets per dataset instead of counting raw download records.
+        """
+        first_day = datetime.utcnow().date() - timedelta(days=days - 1)
         trending_datasets = (
             self.session.query(
                 DataSet,
-                func.count(DSDownloadRecord.id).label("download_count")
+                func.sum(DSDownloadDailyCount.count).label("download_count")
             )
-            .join(DSDownloadRecord, DataSet.id == DSDownloadRecord.dataset_id)
-            .filter(DSDownloadRecord.download_date >= thirty_days_ago)
+            .join(DSDownloadDailyCount, DataSet.id == DSDownloadDailyCount.dataset_id)
+            .filter(DSDownloadDailyCount.day >= first_day)
             .group_by(DataSet.id)
+            .options(*self.serialization_options())
             .order_by(desc("download_count"), desc(DataSet.created_at))
-            .limit(5)
+            .limit(limit)
             .all()
         )
-        return trending_datasets
-        
-    def get_related_datasets(self, dataset_id, tags_list, author_names):
-        conditions = []
-        if tags_list:
-            conditions.extend([DSMetaData.tags.ilike(f"%{tag}%") for tag in tags_list])
-            
-        if author_names:
-            conditions.extend([Author.name.ilike(f"%{name}%") for name in author_names])
-
-        if not conditions:
-            return []
+        return [(dataset, int(download_count)) for dataset, download_count in trending_datasets]
+
+    def get_similarity_texts(self, dataset_ids=None, connection=None):
+        """
+        (id, title, description, extra_fields) of the synchronized datasets, all of them or the given ones.
+        """
+        connection = connection or self.session.connection()
+        statement = (
+            select(DataSet.id, DSMetaData.title, DSMetaData.description, DSMetaData.extra_fields)
+            .join(DSMetaData, DataSet.ds_meta_data_id == DSMetaData.id)
+            .where(DSMetaData.dataset_doi.isnot(None))
+            .order_by(DataSet.id)
+        )
+        if dataset_ids is not None:
+            statement = statement.where(DataSet.id.in_(dataset_ids))
+        return connection.execute(statement).all()
+
+    def get_synchronized_by_ids(self, dataset_ids):
+        """
+        The given datasets that are still synchronized, in the order of dataset_ids.
+        """
+        datasets = {
+            dataset.id: dataset
+            for dataset in self.model.query.join(DSMetaData).filter(
+                self.model.id.in_(dataset_ids), DSMetaData.dataset_doi.isnot(None)
+            )
+        }
+        return [datasets[dataset_id] for dataset_id in dataset_ids if dataset_id in datasets]
+
+    def get_top5_trending_datasets_last_30_days(self):
+        return self.get_trending_datasets(days=30, limit=5)
 
-        return (self.model.query
-                .join(DSMetaData)
-                .outerjoin(Author, DSMetaData.id == Author.ds_meta_data_id)
-                .filter(
-                    self.model.id != dataset_id, 
-                    or_(*conditions)             
-                )
-                .distinct() 
-                .order_by(
-                    self.model.download_count.desc(), 
-                    self.model.created_at.desc()    
-                )
-                .limit(4)
-                .all())
 
 class DOIMappingRepository(BaseRepository):
     def __init__(self):
@@ -1,20 +1,18 @@
-import json
 import logging
 import os
 import shutil
-import tempfile
 import uuid
 from datetime import datetime, timezone
-from zipfile import ZipFile
 
 from flask import (
+    Response,
     abort,
+    current_app,
     jsonify,
     make_response,
     redirect,
     render_template,
     request,
-    send_from_directory,
     url_for,
 )
 from flask_login import current_user, login_required
@@ -22,33 +20,39 @@ from flask_login import current_user, login_required
 from app.modules.dataset import dataset_bp
 
 from app.modules.dataset.forms import DataSetForm
-from app.modules.dataset.models import DSDownloadRecord
+from app.modules.dataset.ingestion import get_manifest_path, ingest_csv, save_manifest
 from app.modules.dataset.services import (
     AuthorService,
+    ChunkedUploadService,
+    DataSetArchiveService,
+    DataSetPublishService,
     DataSetService,
     DOIMappingService,
     DSDownloadRecordService,
     DSMetaDataService,
     DSViewRecordService,
+    get_unique_filename,
 )
 
 from app.modules.comment.services import CommentService
+from core.services.FileDeliveryService import FileDeliveryService
 
 # from app.modules.zenodo.services import ZenodoService
-from app.modules.fakenodo.services import FakenodoService
 
 logger = logging.getLogger(__name__)
 
 
 dataset_service = DataSetService()
+dataset_publish_service = DataSetPublishService()
 author_service = AuthorService()
 dsmetadata_service = DSMetaDataService()
 # zenodo_service = ZenodoService()
-fakenodo_service = FakenodoService()
 doi_mapping_service = DOIMappingService()
 ds_view_record_service = DSViewRecordService()
 comment_service = CommentService()
 
+TRENDING_WINDOWS = (7, 30, 90)
+
 @dataset_bp.route("/dataset/upload", methods=["GET", "POST"])
 @login_required
 def create_dataset():
@@ -69,42 +73,8 @@ def create_dataset():
             logger.exception(f"Exception while create dataset data in local {exc}")
             return jsonify({"Exception while create dataset data in local: ": str(exc)}), 400
 
-        # send dataset as deposition to Zenodo
-        data = {}
-        try:
-            fakenodo_response_json = fakenodo_service.create_new_deposition(dataset)
-            response_data = json.dumps(fakenodo_response_json)
-            data = json.loads(response_data)
-        except Exception as exc:
-            data = {}
-            fakenodo_response_json = {}
-            logger.exception(f"Exception while create dataset data in Fakenodo {exc}")
-
-        if data.get("conceptrecid"):
-            deposition_id = data.get("id")
-
-            # update dataset with deposition id in Zenodo
-            dataset_service.update_dsmetadata(dataset.ds_meta_data_id, deposition_id=deposition_id)
-
-            try:
-                # iterate for each feature model (one feature model = one request to Zenodo)
-                for feature_model in dataset.feature_models:
-                    fakenodo_service.upload_file(dataset, deposition_id, feature_model)
-
-                # publish deposition
-                fakenodo_service.publish_deposition(deposition_id)
-
-                # update DOI
-                # deposition_doi = zenodo_service.get_doi(deposition_id)
-                deposition_doi = fakenodo_service.get_doi(deposition_id)
-                dataset_service.update_dsmetadata(
-                    dataset.ds_meta_data_id,
-                    dataset_doi=deposition_doi,
-                    publication_doi=deposition_doi
-                )
-            except Exception as e:
-                msg = f"it has not been possible upload feature models in Zenodo and update the DOI: {e}"
-                return jsonify({"message": msg}), 200
+        # The deposition, the uploads to Fakenodo and the DOI update run in a background job
+        publish_job = dataset_publish_service.enqueue(dataset)
 
         # Delete temp folder
         file_path = current_user.temp_folder()
@@ -112,11 +82,30 @@ def create_dataset():
             shutil.rmtree(file_path)
 
         msg = "Everything works!"
-        return jsonify({"message": msg}), 200
+        return (
+            jsonify(
+                {
+                    "message": msg,
+                    "publish_status": publish_job.status.value,
+                    "publish_status_url": url_for("dataset.publish_status", dataset_id=dataset.id),
+                }
+            ),
+            200,
+        )
 
     return render_template("dataset/upload_dataset.html", form=form)
 
 
+@dataset_bp.route("/dataset/<int:dataset_id>/publish/status", methods=["GET"])
+@login_required
+def publish_status(dataset_id):
+    dataset = dataset_service.get_or_404(dataset_id)
+    job = dataset_publish_service.get_job(dataset_id)
+    if dataset.user_id != current_user.id or job is None:
+        return jsonify({"message": "Publication not found"}), 404
+    return jsonify({**job.to_dict(), "dataset_doi": dataset.ds_meta_data.dataset_doi}), 200
+
+
 @dataset_bp.route("/dataset/list", methods=["GET", "POST"])
 @login_required
 def list_dataset():
@@ -140,21 +129,13 @@ def upload():
     if not os.path.exists(temp_folder):
         os.makedirs(temp_folder)
 
-    file_path = os.path.join(temp_folder, file.filename)
-
-    if os.path.exists(file_path):
-        # Generate unique filename (by recursion)
-        base_name, extension = os.path.splitext(file.filename)
-        i = 1
-        while os.path.exists(os.path.join(temp_folder, f"{base_name} ({i}){extension}")):
-            i += 1
-        new_filename = f"{base_name} ({i}){extension}"
-        file_path = os.path.join(temp_folder, new_filename)
-    else:
-        new_filename = file.filename
+    new_filename = get_unique_filename(temp_folder, file.filename)
+    file_path = os.path.join(temp_folder, new_filename)
 
     try:
-        file.save(file_path)
+        # Written, hashed, parsed and validated in a single pass over the upload
+        manifest = ingest_csv(file.stream, file_path, current_app.config["COLUMNAR_DIR"])
+        save_manifest(file_path, manifest)
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
@@ -163,6 +144,70 @@ def upload():
             {
                 "message": "UVL uploaded and validated successfully",
                 "filename": new_filename,
+                "row_count": manifest["row_count"],
+                "error_count": manifest["error_count"],
+                "errors": manifest["errors"],
+            }
+        ),
+        200,
+    )
+
+
+@dataset_bp.route("/dataset/file/upload/chunked", methods=["POST"])
+@login_required
+def initiate_chunked_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        status = ChunkedUploadService(current_user.temp_folder()).initiate(
+            data.get("filename"), data.get("size"), chunk_size=data.get("chunk_size"), checksum=data.get("checksum")
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return jsonify(status), 201
+
+
+@dataset_bp.route("/dataset/file/upload/chunked/<upload_id>", methods=["GET"])
+@login_required
+def chunked_upload_status(upload_id):
+    status = ChunkedUploadService(current_user.temp_folder()).get_status(upload_id)
+    if status is None:
+        return jsonify({"message": "Upload not found"}), 404
+    return jsonify(status), 200
+
+
+@dataset_bp.route("/dataset/file/upload/chunked/<upload_id>/<int:index>", methods=["PUT"])
+@login_required
+def upload_chunk(upload_id, index):
+    try:
+        status = ChunkedUploadService(current_user.temp_folder()).write_chunk(
+            upload_id, index, request.stream, request.headers.get("X-Chunk-Checksum")
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if status is None:
+        return jsonify({"message": "Upload not found"}), 404
+    return jsonify(status), 200
+
+
+@dataset_bp.route("/dataset/file/upload/chunked/<upload_id>/finalize", methods=["POST"])
+@login_required
+def finalize_chunked_upload(upload_id):
+    try:
+        result = ChunkedUploadService(current_user.temp_folder()).finalize(upload_id)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if result is None:
+        return jsonify({"message": "Upload not found"}), 404
+
+    filename, manifest = result
+    return (
+        jsonify(
+            {
+                "message": "UVL uploaded and validated successfully",
+                "filename": filename,
+                "row_count": manifest["row_count"],
+                "error_count": manifest["error_count"],
+                "errors": manifest["errors"],
             }
         ),
         200,
@@ -178,6 +223,8 @@ def delete():
 
     if os.path.exists(filepath):
         os.remove(filepath)
+        if os.path.exists(get_manifest_path(filepath)):
+            os.remove(get_manifest_path(filepath))
         return jsonify({"message": "File deleted successfully"})
 
     return jsonify({"error": "Error: File not found"})
@@ -187,54 +234,42 @@ def delete():
 def download_dataset(dataset_id):
     dataset = dataset_service.get_or_404(dataset_id)
 
-    file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, f"dataset_{dataset_id}.zip")
-
-    with ZipFile(zip_path, "w") as zipf:
-        for subdir, dirs, files in os.walk(file_path):
-            for file in files:
-                full_path = os.path.join(subdir, file)
-
-                relative_path = os.path.relpath(full_path, file_path)
-
-                zipf.write(
-                    full_path,
-                    arcname=os.path.join(os.path.basename(zip_path[:-4]), relative_path),
-                )
+    archive_service = DataSetArchiveService()
+    digest = archive_service.get_archive_digest(dataset)
+    last_modified = archive_service.get_last_modified(dataset)
+
+    # The archive digest is a strong ETag: it only changes when the files of the dataset do
+    cached_archive = archive_service.get_cached_archive(dataset, digest)
+    if cached_archive:
+        # Answers conditional and byte-range requests from the prebuilt archive
+        resp = FileDeliveryService().send(
+            cached_archive,
+            download_name=f"dataset_{dataset_id}.zip",
+            mimetype="application/zip",
+            etag=digest,
+            last_modified=last_modified,
+        )
+    else:
+        # The archive is generated while it is sent and cached once complete. Its length is not known in
+        # advance, so only conditional requests are honoured here and ranges get the full archive.
+        resp = Response(
+            archive_service.stream_archive(dataset, digest=digest),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=dataset_{dataset_id}.zip"},
+        )
+        resp.set_etag(digest)
+        resp.last_modified = last_modified
+        resp.make_conditional(request)
 
     user_cookie = request.cookies.get("download_cookie")
     if not user_cookie:
         user_cookie = str(uuid.uuid4())  # Generate a new unique identifier if it does not exist
         # Save the cookie to the user's browser
-        resp = make_response(
-            send_from_directory(
-                temp_dir,
-                f"dataset_{dataset_id}.zip",
-                as_attachment=True,
-                mimetype="application/zip",
-            )
-        )
         resp.set_cookie("download_cookie", user_cookie)
-    else:
-        resp = send_from_directory(
-            temp_dir,
-            f"dataset_{dataset_id}.zip",
-            as_attachment=True,
-            mimetype="application/zip",
-        )
-
-    # Check if the download record already exists for this cookie
-    existing_record = DSDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        dataset_id=dataset_id,
-        download_cookie=user_cookie,
-    ).first()
 
-    if not existing_record:
-        DSDownloadRecordService().create_new_record(dataset=dataset, user_cookie=user_cookie)
-        dataset_service.increment_download_count(dataset_id)
+    # Revalidations and resumed downloads are not counted again
+    if FileDeliveryService.is_download(resp):
+        DSDownloadRecordService().record_download(dataset=dataset, user_cookie=user_cookie)
 
     return resp
 
@@ -244,15 +279,7 @@ def download_file(dataset_id):
     user_cookie = request.cookies.get("download_cookie")
     if not user_cookie:
         user_cookie = str(uuid.uuid4())
-    existing_record = DSDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        dataset_id=dataset_id,
-        download_cookie=user_cookie,
-    ).first()
-
-    if not existing_record:
-        DSDownloadRecordService().create_new_record(dataset=dataset, user_cookie=user_cookie)
-        dataset_service.increment_download_count(dataset_id)
+    DSDownloadRecordService().record_download(dataset=dataset, user_cookie=user_cookie)
 
     return jsonify({"success": True}), 200
 
@@ -308,6 +335,7 @@ def subdomain_index(doi):
 
     dataset = ds_meta_data.data_set
     related_datasets = dataset_service.get_related_datasets(dataset.id)
+    similar_datasets = dataset_service.get_similar_datasets(dataset.id)
     parent_comments_count= comment_service.get_parent_comments_for_dataset_count(dataset.id)
     parent_comments= comment_service.get_parent_comments_for_dataset(dataset.id)
     
@@ -319,7 +347,8 @@ def subdomain_index(doi):
                             parent_comments_count= parent_comments_count,
                             parent_comments= parent_comments,
                             comment_form= comment_form,
-                            related_datasets=related_datasets
+                            related_datasets=related_datasets,
+                            similar_datasets=similar_datasets
     ))
     resp.set_cookie("view_cookie", user_cookie)
 
@@ -351,8 +380,17 @@ def get_unsynchronized_dataset(dataset_id):
 
 @dataset_bp.route("/dataset/trending", methods=["GET"])
 def trending_datasets():
-    res = dataset_service.get_top5_trending_datasets_last_30_days()
+    days = request.args.get("days", 30, type=int)
+    if days not in TRENDING_WINDOWS:
+        days = 30
+    res = dataset_service.get_trending_datasets(days=days)
     datasets = [d[0] for d in res]
     downloads = [d[1] for d in res]
-    return render_template('dataset/trending_datasets.html', trending_datasets=datasets, downloads=downloads)
+    return render_template(
+        'dataset/trending_datasets.html',
+        trending_datasets=datasets,
+        downloads=downloads,
+        days=days,
+        windows=TRENDING_WINDOWS,
+    )
 
@@ -6,8 +6,10 @@ from dotenv import load_dotenv
 
 from app.modules.auth.models import User
 from app.modules.dataset.models import Author, DataSet, DSMetaData, DSMetrics, PublicationType
+from app.modules.dataset.services import calculate_checksum_and_size
 from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from app.modules.hubfile.models import Hubfile
+from app.modules.hubfile.services import HubfileBlobService
 from core.seeders.BaseSeeder import BaseSeeder
 
 
@@ -279,6 +281,7 @@ class DataSetSeeder(BaseSeeder):
             "Pau-Gasol-teams", "playoffs-2004-05", "season-2023-24", "spurs-ring-winners"
         ]
 
+        blob_service = HubfileBlobService()
         for i, folder_name in enumerate(nba_dataset_names):
             dataset = seeded_datasets[i]
             user_id = dataset.user_id
@@ -320,13 +323,16 @@ class DataSetSeeder(BaseSeeder):
                     shutil.copy(src_file_path, dest_folder)
 
                     dest_file_path = os.path.join(dest_folder, csv_filename)
+                    checksum, size = calculate_checksum_and_size(dest_file_path)
                     hub_file = Hubfile(
                         name=csv_filename,
-                        checksum=f"checksum_{csv_filename}",
-                        size=os.path.getsize(dest_file_path),
+                        checksum=checksum,
+                        size=size,
                         feature_model_id=seeded_feature_model.id
                     )
                     self.seed([hub_file])
+                    # The same CSV is seeded into several datasets, every copy after the first becomes a hardlink
+                    blob_service.store(dest_file_path, checksum)
 
             else:
                 print(f"ADVERTENCIA: No se encontró la carpeta: {dataset_folder_path}")
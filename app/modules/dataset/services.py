@@ -1,51 +1,96 @@
-import csv
+import fcntl
+import glob
 import hashlib
+import itertools
+import json
 import logging
 import os
+import re
 import shutil
+import threading
+import time
 import uuid
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from typing import Optional
 
-from flask import request
+import unidecode
+from flask import current_app, has_app_context, request
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
 
 from app.modules.auth.services import AuthenticationService
-from app.modules.dataset.models import DataSet, DSMetaData, DSViewRecord, DSDownloadRecord
+from app.modules.dataset.ingestion import (
+    COPY_CHUNK_SIZE,
+    find_dataset_folders,
+    get_manifest,
+    ingest_csv,
+    ingest_file,
+    save_manifest,
+)
+from app.modules.dataset.models import (
+    Author,
+    DataSet,
+    DSDownloadRecord,
+    DSMetaData,
+    DSPublishJob,
+    DSViewRecord,
+    PublicationType,
+    PublishJobStatus,
+    get_nbahub_doi_url,
+)
 from app.modules.dataset.repositories import (
     AuthorRepository,
     DataSetRepository,
     DOIMappingRepository,
+    DSDownloadDailyCountRepository,
     DSDownloadRecordRepository,
     DSMetaDataRepository,
+    DSNeighborRepository,
+    DSPublishJobRepository,
     DSViewRecordRepository,
 )
+from app.modules.dataset.similarity import ContentSimilarityIndex
+from app.modules.explore.services import tokenize
+from app.modules.fakenodo.services import FakenodoService
+from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from app.modules.featuremodel.repositories import FeatureModelRepository, FMMetaDataRepository
+from app.modules.hubfile.models import Hubfile
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository,
 )
+from app.modules.hubfile.services import HubfileBlobService, HubfileStatisticsService
+from core.configuration.configuration import uploads_folder_name
+from core.managers.analytics_manager import AnalyticsManager, get_analytics
+from core.managers.job_manager import JobManager, get_jobs
 from core.services.BaseService import BaseService
 
 logger = logging.getLogger(__name__)
 
 
 def calculate_checksum_and_size(file_path):
-    file_size = os.path.getsize(file_path)
+    hash_md5 = hashlib.md5()
     with open(file_path, "rb") as file:
-        content = file.read()
-        hash_md5 = hashlib.md5(content).hexdigest()
-        return hash_md5, file_size
+        for chunk in iter(lambda: file.read(COPY_CHUNK_SIZE), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest(), os.path.getsize(file_path)
 
 
-def extract_csv_columns(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader)
-            return [h.strip() for h in headers]
-    except Exception as e:
-        logger.error(f"Error extracting columns from {file_path}: {e}")
-        return []
+def serialize_datasets(datasets):
+    """
+    Batch version of DataSet.to_dict: the relationships of all the datasets are loaded up front in a fixed number
+    of queries instead of lazily, dataset by dataset and file by file.
+    """
+    return [dataset.to_dict() for dataset in DataSetRepository().load_for_serialization(datasets)]
 
 
 def get_non_common_columns(columns):
@@ -56,18 +101,11 @@ def get_non_common_columns(columns):
     return [col for col in columns if col.lower() not in common_columns_lower]
 
 
-def aggregate_dataset_columns(temp_folder, feature_models_data):
+def aggregate_dataset_columns(manifests):
     all_specific_columns = set()
-    
-    for feature_model in feature_models_data:
-        csv_filename = feature_model.csv_filename.data
-        file_path = os.path.join(temp_folder, csv_filename)
-        
-        if os.path.exists(file_path):
-            all_columns = extract_csv_columns(file_path)
-            specific_columns = get_non_common_columns(all_columns)
-            all_specific_columns.update(specific_columns)
-    
+    for manifest in manifests:
+        all_specific_columns.update(get_non_common_columns(manifest["columns"]))
+
     if all_specific_columns:
         return ', '.join(sorted(all_specific_columns))
     return None
@@ -85,6 +123,7 @@ class DataSetService(BaseService):
         self.hubfilerepository = HubfileRepository()
         self.dsviewrecord_repostory = DSViewRecordRepository()
         self.hubfileviewrecord_repository = HubfileViewRecordRepository()
+        self.ds_neighbor_repository = DSNeighborRepository()
 
     def move_feature_models(self, dataset: DataSet):
         current_user = AuthenticationService().get_authenticated_user()
@@ -95,9 +134,13 @@ class DataSetService(BaseService):
 
         os.makedirs(dest_dir, exist_ok=True)
 
+        blob_service = HubfileBlobService()
         for feature_model in dataset.feature_models:
             csv_filename = feature_model.fm_meta_data.csv_filename
             shutil.move(os.path.join(source_dir, csv_filename), dest_dir)
+            # Files already uploaded to another dataset end up as hardlinks to the same blob
+            for hubfile in feature_model.files:
+                blob_service.store(os.path.join(dest_dir, hubfile.name), hubfile.checksum)
 
     def find_by_id(self, dataset_id: int) -> DataSet:
         return self.repository.find_by_id(dataset_id)
@@ -147,37 +190,38 @@ class DataSetService(BaseService):
         try:
             logger.info(f"Creating dsmetadata...: {form.get_dsmetadata()}")
 
-            temp_folder = current_user.temp_folder()
-            extra_fields = aggregate_dataset_columns(temp_folder, form.feature_models)
+            # Checksum, size and columns of every file were worked out when it was uploaded
+            temp_folder, sidecar_dir = current_user.temp_folder(), current_app.config["COLUMNAR_DIR"]
+            manifests = [
+                get_manifest(os.path.join(temp_folder, feature_model.csv_filename.data), sidecar_dir)
+                for feature_model in form.feature_models
+            ]
+            extra_fields = aggregate_dataset_columns(manifests)
             dsmetadata_dict = form.get_dsmetadata()
             dsmetadata_dict['extra_fields'] = extra_fields
 
-            dsmetadata = self.dsmetadata_repository.create(**dsmetadata_dict)
-            for author_data in [main_author] + form.get_authors():
-                author = self.author_repository.create(commit=False, ds_meta_data_id=dsmetadata.id, **author_data)
-                dsmetadata.authors.append(author)
-
-            dataset = self.create(commit=False, user_id=current_user.id, ds_meta_data_id=dsmetadata.id)
-
-            for feature_model in form.feature_models:
-                csv_filename = feature_model.csv_filename.data
-                fmmetadata = self.fmmetadata_repository.create(commit=False, **feature_model.get_fmmetadata())
-                for author_data in feature_model.get_authors():
-                    author = self.author_repository.create(commit=False, fm_meta_data_id=fmmetadata.id, **author_data)
-                    fmmetadata.authors.append(author)
-
-                fm = self.feature_model_repository.create(
-                    commit=False, data_set_id=dataset.id, fm_meta_data_id=fmmetadata.id
-                )
-
-                # associated files in feature model
-                file_path = os.path.join(current_user.temp_folder(), csv_filename)
-                checksum, size = calculate_checksum_and_size(file_path)
-
-                file = self.hubfilerepository.create(
-                    commit=False, name=csv_filename, checksum=checksum, size=size, feature_model_id=fm.id
-                )
-                fm.files.append(file)
+            feature_models = [
+                {
+                    "fmmetadata": feature_model.get_fmmetadata(),
+                    "authors": feature_model.get_authors(),
+                    "file": {
+                        "name": feature_model.csv_filename.data,
+                        "checksum": manifest["checksum"],
+                        "size": manifest["size"],
+                        "row_count": manifest["row_count"],
+                    },
+                }
+                for feature_model, manifest in zip(form.feature_models, manifests)
+            ]
+
+            # Built in memory and inserted by the commit, with one INSERT per table whatever the number of files
+            dataset = self.build_dataset(
+                current_user.id, dsmetadata_dict, [main_author] + form.get_authors(), feature_models
+            )
+            self.repository.session.add(dataset)
+            HubfileStatisticsService().add_statistics(
+                {manifest["checksum"]: manifest.get("statistics") for manifest in manifests}
+            )
             self.repository.session.commit()
         except Exception as exc:
             logger.info(f"Exception creating dataset from form...: {exc}")
@@ -185,29 +229,42 @@ class DataSetService(BaseService):
             raise exc
         return dataset
 
+    def build_dataset(self, user_id: int, dsmetadata: dict, authors: list[dict], feature_models: list[dict]) -> DataSet:
+        """
+        A new dataset with its metadata, authors, feature models and files, not added to the session yet. Each
+        feature model is a dict with its `fmmetadata`, `authors` and `file`. Nothing is flushed while the graph is
+        built, so any number of datasets added together are inserted with one multi-row INSERT per table.
+        """
+        dataset = DataSet(
+            user_id=user_id,
+            ds_meta_data=DSMetaData(**dsmetadata, authors=[Author(**author) for author in authors]),
+        )
+        for feature_model in feature_models:
+            fmmetadata = FMMetaData(
+                **feature_model["fmmetadata"], authors=[Author(**author) for author in feature_model["authors"]]
+            )
+            dataset.feature_models.append(
+                FeatureModel(fm_meta_data=fmmetadata, files=[Hubfile(**feature_model["file"])])
+            )
+        return dataset
+
     def update_dsmetadata(self, id, **kwargs):
         return self.dsmetadata_repository.update(id, **kwargs)
 
     def get_nbahub_doi(self, dataset: DataSet) -> str:
-        domain = os.getenv("DOMAIN", "localhost")
-        return f"http://{domain}/doi/{dataset.ds_meta_data.dataset_doi}"
+        return get_nbahub_doi_url(dataset.ds_meta_data.dataset_doi)
     
     def get_top5_trending_datasets_last_30_days(self):
         return self.repository.get_top5_trending_datasets_last_30_days()
 
-    def get_related_datasets(self, dataset_id: int):
-        
-        dataset = self.repository.find_by_id(dataset_id)
-        if not dataset:
-            return []
-
-        tags = []
-        if dataset.ds_meta_data.tags:
-            tags = [t.strip() for t in dataset.ds_meta_data.tags.split(',') if t.strip()]
+    def get_trending_datasets(self, days: int = 30, limit: int = 5):
+        return self.repository.get_trending_datasets(days=days, limit=limit)
 
-        authors = [author.name for author in dataset.ds_meta_data.authors]
+    def get_related_datasets(self, dataset_id: int, limit: int = 4):
+        return self.ds_neighbor_repository.get_related_datasets(dataset_id, limit)
 
-        return self.repository.get_related_datasets(dataset_id, tags, authors)
+    def get_similar_datasets(self, dataset_id: int, limit: int = 4):
+        return ContentSimilarityService().get_similar_datasets(dataset_id, limit)
 
 
 class AuthorService(BaseService):
@@ -223,6 +280,20 @@ class DSDownloadRecordService(BaseService):
 
         return self.repository.create_new_record(dataset, user_cookie)
 
+    def record_download(self, dataset: DataSet, user_cookie: str) -> bool:
+        """
+        Queues the download in the analytics buffer. The record and the download count of the dataset are written
+        in the next flush, only if this user and cookie had not downloaded the dataset yet.
+        """
+        return get_analytics().record(
+            "dataset_download",
+            user_id=current_user.id if current_user.is_authenticated else None,
+            dataset_id=dataset.id,
+            download_date=datetime.now(timezone.utc),
+            download_cookie=user_cookie,
+        )
+
+
 class DSMetaDataService(BaseService):
     def __init__(self):
         super().__init__(DSMetaDataRepository())
@@ -250,10 +321,14 @@ class DSViewRecordService(BaseService):
         if not user_cookie:
             user_cookie = str(uuid.uuid4())
 
-        existing_record = self.the_record_exists(dataset=dataset, user_cookie=user_cookie)
-
-        if not existing_record:
-            self.create_new_record(dataset=dataset, user_cookie=user_cookie)
+        # Written in bulk by the analytics buffer, which also skips views already recorded for this cookie
+        get_analytics().record(
+            "dataset_view",
+            user_id=current_user.id if current_user.is_authenticated else None,
+            dataset_id=dataset.id,
+            view_date=datetime.now(timezone.utc),
+            view_cookie=user_cookie,
+        )
 
         return user_cookie
     def dataset_view_count(self, dataset: DataSet) -> int:
@@ -272,6 +347,1071 @@ class DOIMappingService(BaseService):
             return None
 
 
+def count_downloads_by_day(download_records):
+    return Counter(
+        (record["dataset_id"], record["download_date"].date())
+        for record in download_records
+        if record["dataset_id"] is not None
+    )
+
+
+def record_dataset_downloads(connection, download_records):
+    """
+    Keeps the download count of each dataset and its daily buckets in step with the records just inserted.
+    """
+    DataSetRepository().increment_download_counts(
+        Counter(record["dataset_id"] for record in download_records), connection=connection
+    )
+    DSDownloadDailyCountRepository().add_counts(count_downloads_by_day(download_records), connection=connection)
+
+
+AnalyticsManager.register_stream("dataset_view", DSViewRecord, ("user_id", "dataset_id", "view_cookie"))
+AnalyticsManager.register_stream(
+    "dataset_download",
+    DSDownloadRecord,
+    ("user_id", "dataset_id", "download_cookie"),
+    on_insert=record_dataset_downloads,
+)
+
+
+@event.listens_for(Session, "after_flush")
+def update_download_daily_counts(session, flush_context):
+    """
+    Download records added through the session (rather than the analytics buffer) also feed the daily buckets.
+    """
+    download_records = [
+        {"dataset_id": instance.dataset_id, "download_date": instance.download_date}
+        for instance in session.new
+        if isinstance(instance, DSDownloadRecord)
+    ]
+    if download_records:
+        DSDownloadDailyCountRepository().add_counts(
+            count_downloads_by_day(download_records), connection=session.connection()
+        )
+
+
+# Weight of a shared feature depending on its kind
+RELATED_FEATURE_WEIGHTS = {
+    "tag": 1.0,
+    "author": 2.0,
+}
+
+# Neighbors stored per dataset
+RELATED_NEIGHBORS = 10
+
+MAX_FEATURE_LENGTH = 120
+
+
+def normalize_related_term(text):
+    normalized_text = unidecode.unidecode(text or "").lower()
+    return " ".join(re.findall(r"[a-z0-9]+", normalized_text))[:MAX_FEATURE_LENGTH]
+
+
+def get_related_features(tags, author_names):
+    features = {}
+    for kind, terms in (("tag", (tags or "").split(",")), ("author", author_names)):
+        for term in terms:
+            term = normalize_related_term(term)
+            if term:
+                features[f"{kind}:{term}"] = RELATED_FEATURE_WEIGHTS[kind]
+    return features
+
+
+def top_neighbors(scores):
+    best = sorted((item for item in scores.items() if item[1] > 0), key=lambda item: (-item[1], -item[0]))
+    return dict(best[:RELATED_NEIGHBORS])
+
+
+class RelatedDataSetService(BaseService):
+    """
+    Keeps the RELATED_NEIGHBORS most related datasets of every synchronized dataset in ds_neighbor. Two datasets
+    are related by the weighted Jaccard similarity of their normalized tags and authors: the weight of the
+    features they share over the weight of all their features.
+    """
+
+    def __init__(self):
+        super().__init__(DSNeighborRepository())
+
+    def get_scores(self, dataset_id, connection=None) -> dict[int, float]:
+        shared = self.repository.get_shared_weights(dataset_id, connection=connection)
+        if not shared:
+            return {}
+        totals = self.repository.get_total_weights([dataset_id, *shared], connection=connection)
+        return {
+            other_id: shared_weight / (totals[dataset_id] + totals[other_id] - shared_weight)
+            for other_id, shared_weight in shared.items()
+        }
+
+    def update(self, dataset_ids, connection=None):
+        """
+        Refreshes the features and neighbors of the given datasets after they are created, published or retagged,
+        and the neighbor lists of the datasets related to them before or after the change.
+        """
+        dataset_ids = sorted(set(dataset_ids))
+        if not dataset_ids:
+            return
+
+        sources = self.repository.get_feature_sources(dataset_ids, connection=connection)
+        features = {dataset_id: get_related_features(*source) for dataset_id, source in sources.items()}
+        self.repository.replace_features(dataset_ids, features, connection=connection)
+
+        neighbors, recompute = {}, set()
+        for dataset_id in dataset_ids:
+            scores = self.get_scores(dataset_id, connection=connection)
+            neighbors[dataset_id] = top_neighbors(scores)
+
+            # The similarity is symmetric, so the other datasets only have to place this one in their own list.
+            # A dataset that drops in someone's list may leave room for another one, which needs a recompute.
+            other_ids = set(scores) | self.repository.get_dataset_ids_with_neighbor([dataset_id], connection=connection)
+            other_ids -= set(dataset_ids) | recompute
+            stored = self.repository.get_neighbors(other_ids - set(neighbors), connection=connection)
+            for other_id in other_ids:
+                other_neighbors = dict(neighbors.get(other_id, stored.get(other_id, {})))
+                previous_score, score = other_neighbors.get(dataset_id), scores.get(other_id, 0.0)
+                if previous_score is not None and score < previous_score:
+                    recompute.add(other_id)
+                    neighbors.pop(other_id, None)
+                    continue
+                other_neighbors[dataset_id] = score
+                other_neighbors = top_neighbors(other_neighbors)
+                if other_neighbors != stored.get(other_id):
+                    neighbors[other_id] = other_neighbors
+
+        for dataset_id in recompute:
+            neighbors[dataset_id] = top_neighbors(self.get_scores(dataset_id, connection=connection))
+
+        self.repository.replace_neighbors(neighbors, connection=connection)
+
+    def remove(self, dataset_ids, referrer_ids, connection=None):
+        """
+        Forgets deleted datasets and recomputes the lists they were part of.
+        """
+        self.repository.remove_datasets(dataset_ids, connection=connection)
+        neighbors = {
+            dataset_id: top_neighbors(self.get_scores(dataset_id, connection=connection))
+            for dataset_id in set(referrer_ids) - set(dataset_ids)
+        }
+        if neighbors:
+            self.repository.replace_neighbors(neighbors, connection=connection)
+
+    def rebuild(self, batch_size=500, connection=None):
+        """
+        Recomputes the features of every dataset and then every neighbor list. Without a connection each batch
+        of neighbor lists is committed on its own.
+        """
+        dataset_ids = self.repository.get_all_dataset_ids(connection=connection)
+        batches = [dataset_ids[start:start + batch_size] for start in range(0, len(dataset_ids), batch_size)]
+        for batch in batches:
+            sources = self.repository.get_feature_sources(batch, connection=connection)
+            features = {dataset_id: get_related_features(*source) for dataset_id, source in sources.items()}
+            self.repository.replace_features(batch, features, connection=connection)
+        for batch in batches:
+            self.repository.replace_neighbors(
+                {dataset_id: top_neighbors(self.get_scores(dataset_id, connection=connection)) for dataset_id in batch},
+                connection=connection,
+            )
+            if connection is None:
+                self.repository.session.commit()
+        return len(dataset_ids)
+
+    def touched_dataset_ids(self, session):
+        dataset_ids, ds_meta_data_ids = set(), set()
+
+        for instance in session.new:
+            if isinstance(instance, DataSet):
+                dataset_ids.add(instance.id)
+            elif isinstance(instance, DSMetaData):
+                ds_meta_data_ids.add(instance.id)
+            elif isinstance(instance, Author):
+                ds_meta_data_ids.add(instance.ds_meta_data_id)
+
+        for instance in session.dirty:
+            if isinstance(instance, DataSet):
+                history = get_history(instance, "ds_meta_data_id")
+                if history.has_changes():
+                    dataset_ids.add(instance.id)
+            elif isinstance(instance, DSMetaData):
+                if get_history(instance, "tags").has_changes() or get_history(instance, "dataset_doi").has_changes():
+                    ds_meta_data_ids.add(instance.id)
+            elif isinstance(instance, Author):
+                history = get_history(instance, "ds_meta_data_id")
+                if history.has_changes() or get_history(instance, "name").has_changes():
+                    ds_meta_data_ids.update(history.sum())
+
+        for instance in session.deleted:
+            if isinstance(instance, Author):
+                ds_meta_data_ids.add(instance.ds_meta_data_id)
+
+        ds_meta_data_ids.discard(None)
+        if ds_meta_data_ids:
+            dataset_ids.update(
+                self.repository.get_dataset_ids_by_ds_meta_data(ds_meta_data_ids, connection=session.connection())
+            )
+
+        dataset_ids.discard(None)
+        return dataset_ids
+
+
+@event.listens_for(Session, "before_flush")
+def remember_related_of_deleted_datasets(session, flush_context, instances):
+    """
+    The neighbor rows of a deleted dataset go away with it, so the datasets that listed it are looked up first.
+    """
+    deleted_ids = {instance.id for instance in session.deleted if isinstance(instance, DataSet) and instance.id}
+    if deleted_ids:
+        referrer_ids = DSNeighborRepository().get_dataset_ids_with_neighbor(
+            deleted_ids, connection=session.connection()
+        )
+        session.info.setdefault("related_deleted_ids", set()).update(deleted_ids)
+        session.info.setdefault("related_referrer_ids", set()).update(referrer_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def update_related_datasets(session, flush_context):
+    """
+    Keeps the neighbor table in sync with every flush that publishes, retags or removes datasets, in the same
+    transaction.
+    """
+    related_service = RelatedDataSetService()
+    deleted_ids = session.info.pop("related_deleted_ids", set())
+    referrer_ids = session.info.pop("related_referrer_ids", set())
+    if deleted_ids:
+        related_service.remove(deleted_ids, referrer_ids, connection=session.connection())
+
+    dataset_ids = related_service.touched_dataset_ids(session) - deleted_ids
+    if dataset_ids:
+        related_service.update(dataset_ids, connection=session.connection())
+
+
+def get_similarity_document(title, description, extra_fields):
+    return tokenize(title) + tokenize(description) + tokenize(extra_fields)
+
+
+class ContentSimilarityService:
+    """
+    "More like this" recommendations from the TF-IDF similarity of the title, description and extra fields of
+    the synchronized datasets. The index is built in bulk by rosemary dataset:build-similar and saved under
+    SIMILARITY_INDEX_DIR; datasets published afterwards are appended to it as they are published.
+    """
+
+    _loaded = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.index_dir = current_app.config["SIMILARITY_INDEX_DIR"]
+        self.repository = DataSetRepository()
+
+    def get_index(self) -> Optional[ContentSimilarityIndex]:
+        """
+        The current index, memory-mapped once per process and reopened when a newer version or segment is saved.
+        """
+        version = ContentSimilarityIndex.current_version(self.index_dir)
+        if version is None:
+            return None
+        with ContentSimilarityService._lock:
+            loaded_version, index = ContentSimilarityService._loaded.get(self.index_dir, (None, None))
+            if loaded_version != version:
+                try:
+                    index = ContentSimilarityIndex.load(version[0])
+                except FileNotFoundError:
+                    # Replaced by a newer version while reading the pointer
+                    return index
+                ContentSimilarityService._loaded[self.index_dir] = (version, index)
+            return index
+
+    def get_similar_datasets(self, dataset_id: int, limit: int = 4):
+        index = self.get_index()
+        if index is None:
+            return []
+        similar_ids = [similar_id for similar_id, _ in index.similar(dataset_id, limit)]
+        return self.repository.get_synchronized_by_ids(similar_ids)
+
+    def build(self) -> int:
+        rows = self.repository.get_similarity_texts()
+        documents = [get_similarity_document(*texts) for _, *texts in rows]
+        with self._index_lock():
+            ContentSimilarityIndex.build([dataset_id for dataset_id, *_ in rows], documents).save(self.index_dir)
+        return len(rows)
+
+    def add(self, dataset_ids, connection=None) -> int:
+        """
+        Appends the given datasets to the current index as a new segment, skipping the ones it already has.
+        Once there are more than SIMILARITY_MAX_SEGMENTS segments they are merged into a new version. Does
+        nothing until the index has been built once.
+        """
+        if ContentSimilarityIndex.current_path(self.index_dir) is None:
+            return 0
+        with self._index_lock():
+            index = ContentSimilarityIndex.load(ContentSimilarityIndex.current_path(self.index_dir))
+            known_ids = set(index.dataset_ids.tolist())
+            rows = [
+                row
+                for row in self.repository.get_similarity_texts(sorted(set(dataset_ids)), connection=connection)
+                if row[0] not in known_ids
+            ]
+            if rows:
+                documents = [get_similarity_document(*texts) for _, *texts in rows]
+                index = index.add([dataset_id for dataset_id, *_ in rows], documents)
+                if len(index.segments) > current_app.config["SIMILARITY_MAX_SEGMENTS"]:
+                    index.save(self.index_dir)
+                else:
+                    index.save_segment()
+            return len(rows)
+
+    @contextmanager
+    def _index_lock(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@event.listens_for(Session, "after_flush")
+def remember_published_datasets(session, flush_context):
+    """
+    Datasets created or given a DOI by this flush. The ones that end up without a DOI are skipped when added.
+    """
+    dataset_ids = {instance.id for instance in session.new if isinstance(instance, DataSet)}
+    ds_meta_data_ids = {
+        instance.id
+        for instance in itertools.chain(session.new, session.dirty)
+        if isinstance(instance, DSMetaData)
+        and instance.dataset_doi is not None
+        and get_history(instance, "dataset_doi").has_changes()
+    }
+    if ds_meta_data_ids:
+        dataset_ids.update(
+            DSNeighborRepository().get_dataset_ids_by_ds_meta_data(ds_meta_data_ids, connection=session.connection())
+        )
+    if dataset_ids:
+        session.info.setdefault("similarity_published_ids", set()).update(dataset_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def add_published_datasets_to_similarity_index(session):
+    """
+    Newly published datasets join the "more like this" index once they are committed. A failure here only
+    delays them until the next build.
+    """
+    dataset_ids = session.info.pop("similarity_published_ids", None)
+    if not dataset_ids or not has_app_context() or not current_app.config["SIMILARITY_INDEX_INCREMENTAL"]:
+        return
+    try:
+        with session.get_bind().connect() as connection:
+            ContentSimilarityService().add(dataset_ids, connection=connection)
+    except Exception:
+        logger.exception("Error adding datasets %s to the similarity index", sorted(dataset_ids))
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_published_datasets(session):
+    session.info.pop("similarity_published_ids", None)
+
+
+class _ZipStreamSink:
+    """
+    Write-only, unseekable target for ZipFile. ZipFile then writes sizes and CRCs in data descriptors after each
+    member, so everything it produces can be handed to the client as soon as it is written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class DataSetPublishService(BaseService):
+    """
+    Publishes datasets in the background: the deposition in Fakenodo, the upload of every feature model, the
+    publication and the DOI update run as a "publish_dataset" job after the request that created the dataset.
+    Every step checks what previous attempts already did, so a retried job picks up where the failed one stopped.
+    """
+
+    def __init__(self):
+        super().__init__(DSPublishJobRepository())
+        self.dataset_repository = DataSetRepository()
+        self.dsmetadata_repository = DSMetaDataRepository()
+
+    def get_job(self, dataset_id: int) -> Optional[DSPublishJob]:
+        return self.repository.get_by_id(dataset_id)
+
+    def enqueue(self, dataset: DataSet) -> DSPublishJob:
+        """
+        Queues the publication of the dataset, unless it is already queued, running or done.
+        """
+        job = self.get_job(dataset.id)
+        if job is not None and job.status != PublishJobStatus.FAILED:
+            return job
+
+        try:
+            if job is None:
+                job = self.repository.create(commit=False, dataset_id=dataset.id)
+            job.status, job.attempts, job.last_error = PublishJobStatus.QUEUED, 0, None
+            self.repository.session.commit()
+        except IntegrityError:
+            # Queued meanwhile by another request
+            self.repository.session.rollback()
+            return self.get_job(dataset.id)
+
+        get_jobs().enqueue("publish_dataset", dataset.id)
+        return job
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """
+        Queues again the publications still queued, running or retrying after stale_after seconds without a
+        change, which a restart of the web process or the job worker lost, and returns how many.
+        """
+        jobs = self.repository.get_stale(datetime.utcnow() - timedelta(seconds=stale_after))
+        for job in jobs:
+            # Touched, so the next sweep does not queue it once more while it waits
+            job.status, job.updated_at = PublishJobStatus.QUEUED, datetime.utcnow()
+        self.repository.session.commit()
+
+        for job in jobs:
+            get_jobs().enqueue("publish_dataset", job.dataset_id)
+        return len(jobs)
+
+    def run(self, dataset_id: int):
+        job = self.get_job(dataset_id)
+        if job is None or job.status == PublishJobStatus.SUCCEEDED:
+            return
+
+        job.status, job.attempts = PublishJobStatus.RUNNING, job.attempts + 1
+        self.repository.session.commit()
+
+        try:
+            self.publish(self.dataset_repository.get_by_id(dataset_id))
+        except Exception as exc:
+            self.repository.session.rollback()
+            job = self.get_job(dataset_id)
+            out_of_attempts = job.attempts >= get_jobs().max_attempts
+            job.status = PublishJobStatus.FAILED if out_of_attempts else PublishJobStatus.RETRYING
+            job.last_error = str(exc)
+            self.repository.session.commit()
+            raise
+
+        job.status, job.last_error = PublishJobStatus.SUCCEEDED, None
+        self.repository.session.commit()
+
+    def publish(self, dataset: DataSet):
+        ds_meta_data = dataset.ds_meta_data
+        if ds_meta_data.dataset_doi:
+            return
+
+        fakenodo_service = FakenodoService()
+        deposition_id = ds_meta_data.deposition_id
+        if deposition_id is None:
+            deposition = fakenodo_service.create_new_deposition(dataset)
+            if not deposition.get("conceptrecid"):
+                raise RuntimeError(f"The deposition of dataset {dataset.id} was not created")
+            deposition_id = deposition.get("id")
+            self.dsmetadata_repository.update(ds_meta_data.id, deposition_id=deposition_id)
+
+        # iterate for each feature model (one feature model = one request to Zenodo)
+        for feature_model in dataset.feature_models:
+            fakenodo_service.upload_file(dataset, deposition_id, feature_model, user=dataset.user)
+
+        fakenodo_service.publish_deposition(deposition_id)
+        deposition_doi = fakenodo_service.get_doi(deposition_id)
+        self.dsmetadata_repository.update(
+            ds_meta_data.id, dataset_doi=deposition_doi, publication_doi=deposition_doi
+        )
+
+
+def publish_dataset(dataset_id: int):
+    DataSetPublishService().run(dataset_id)
+
+
+def requeue_stale_publications(stale_after: float) -> int:
+    return DataSetPublishService().requeue_stale(stale_after)
+
+
+JobManager.register_task("publish_dataset", publish_dataset)
+JobManager.register_recovery("publish_dataset", requeue_stale_publications)
+
+
+class DataSetArchiveService:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self):
+        self.cache_dir = current_app.config["ARCHIVE_CACHE_DIR"]
+        self.cache_max_bytes = current_app.config["ARCHIVE_CACHE_MAX_BYTES"]
+
+    def get_dataset_folder(self, dataset: DataSet) -> str:
+        working_dir = os.getenv("WORKING_DIR", "")
+        return os.path.join(working_dir, uploads_folder_name(), f"user_{dataset.user_id}", f"dataset_{dataset.id}")
+
+    def get_archive_entries(self, dataset: DataSet) -> list[tuple[str, str]]:
+        """
+        Returns the (arcname, path) of every file of the dataset, in the layout of the downloaded archive.
+        """
+        dataset_folder = self.get_dataset_folder(dataset)
+        blob_service = HubfileBlobService()
+        return [
+            (
+                os.path.join(f"dataset_{dataset.id}", hubfile.name),
+                blob_service.resolve(os.path.join(dataset_folder, hubfile.name), hubfile.checksum),
+            )
+            for hubfile in sorted(dataset.files(), key=lambda hubfile: hubfile.name)
+        ]
+
+    def get_archive_digest(self, dataset: DataSet) -> str:
+        """
+        Digest of the names, checksums and sizes of the dataset files: it changes whenever the archive would.
+        """
+        digest = hashlib.sha256()
+        for hubfile in sorted(dataset.files(), key=lambda hubfile: hubfile.name):
+            digest.update(f"{hubfile.name}\0{hubfile.checksum}\0{hubfile.size}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_cached_archive_path(self, dataset: DataSet, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"dataset_{dataset.id}_{digest}.zip")
+
+    def get_last_modified(self, dataset: DataSet) -> datetime:
+        """
+        Latest modification time of the dataset files, or its creation date when none of them is on disk.
+        """
+        mtimes = []
+        for _, path in self.get_archive_entries(dataset):
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except FileNotFoundError:
+                continue
+        if not mtimes:
+            return dataset.created_at.replace(tzinfo=timezone.utc)
+        return datetime.fromtimestamp(max(mtimes), tz=timezone.utc)
+
+    def get_cached_archive(self, dataset: DataSet, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the path of the prebuilt archive of the dataset if there is one for its current files.
+        """
+        path = self.get_cached_archive_path(dataset, digest or self.get_archive_digest(dataset))
+        try:
+            # The modification time is the recency used by the LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def stream_archive(self, dataset: DataSet, cache: bool = True, digest: Optional[str] = None):
+        """
+        Returns a generator with the bytes of the dataset ZIP. Files are read and deflated in CHUNK_SIZE blocks and
+        their CRCs computed on the fly, so memory use does not depend on the size of the dataset. The list of files
+        is resolved now, while the database session is still available.
+
+        With cache set, the bytes sent are also written to the cache, and the archive is only kept there once the
+        whole stream went through. A download cut short leaves nothing behind, and while one is in progress other
+        workers generate the same archive without caching it.
+        """
+        entries = self.get_archive_entries(dataset)
+        if not cache:
+            return self._generate_archive(entries)
+        digest = digest or self.get_archive_digest(dataset)
+        return self._stream_to_cache(dataset.id, self.get_cached_archive_path(dataset, digest), digest, entries)
+
+    def build_archive(self, dataset: DataSet, digest: Optional[str] = None, entries=None) -> Optional[str]:
+        """
+        Builds the archive of the dataset into the cache and returns its path, or None when another worker is
+        already building the same archive.
+        """
+        digest = digest or self.get_archive_digest(dataset)
+        path = self.get_cached_archive_path(dataset, digest)
+        with self._build_lock(digest) as locked:
+            if not locked:
+                return None
+            # Another worker may have finished the archive between the cache lookup and the lock
+            if not os.path.exists(path):
+                chunks = self._generate_archive(entries or self.get_archive_entries(dataset))
+                for _ in self._write_to_cache(dataset.id, path, chunks):
+                    pass
+        return path
+
+    def invalidate(self, dataset_id: int, keep: Optional[str] = None):
+        for path in glob.glob(os.path.join(self.cache_dir, f"dataset_{dataset_id}_*.zip")):
+            if path != keep:
+                self._remove(path)
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Removes the least recently used archives until the cache fits in ARCHIVE_CACHE_MAX_BYTES.
+        """
+        archives = []
+        for path in glob.glob(os.path.join(self.cache_dir, "dataset_*.zip")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            archives.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total_size <= self.cache_max_bytes:
+                break
+            if path != keep:
+                self._remove(path)
+                total_size -= size
+
+    @contextmanager
+    def _build_lock(self, digest: str):
+        """
+        Holds the lock of the archive with the given digest, yielding False when another worker holds it.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lock_path = os.path.join(self.cache_dir, f".{digest}.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                self._remove(lock_path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stream_to_cache(self, dataset_id: int, path: str, digest: str, entries):
+        with self._build_lock(digest) as locked:
+            if locked and not os.path.exists(path):
+                yield from self._write_to_cache(dataset_id, path, self._generate_archive(entries))
+                return
+        if locked:
+            yield from self._read_archive(path)
+        else:
+            yield from self._generate_archive(entries)
+
+    def _write_to_cache(self, dataset_id: int, path: str, chunks):
+        """
+        Yields the chunks while writing them to a temporary file, which becomes the cached archive at path once
+        the last chunk went through. Closing the generator earlier removes the temporary file.
+        """
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+                    yield chunk
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            # Readers only ever see complete archives
+            os.replace(tmp_path, path)
+        finally:
+            self._remove(tmp_path)
+
+        self.invalidate(dataset_id, keep=path)
+        self.evict(keep=path)
+
+    def _read_archive(self, path):
+        with open(path, "rb") as archive:
+            while chunk := archive.read(self.CHUNK_SIZE):
+                yield chunk
+
+    def _generate_archive(self, entries):
+        sink = _ZipStreamSink()
+
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+            for arcname, path in entries:
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                except FileNotFoundError:
+                    logger.warning(f"File {path} not found, skipping it in the archive")
+                    continue
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+
+                with open(path, "rb") as source, zipf.open(zinfo, "w") as target:
+                    while chunk := source.read(self.CHUNK_SIZE):
+                        target.write(chunk)
+                        data = sink.pop()
+                        if data:
+                            yield data
+
+        # Data descriptor of the last member and central directory
+        yield sink.pop()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_archive_cache(session, flush_context):
+    """
+    Drops the prebuilt archives of the datasets whose files were added or removed in this flush.
+    """
+    dataset_ids, feature_model_ids = set(), set()
+    for instance in itertools.chain(session.new, session.deleted):
+        if isinstance(instance, Hubfile):
+            feature_model_ids.add(instance.feature_model_id)
+        elif isinstance(instance, FeatureModel):
+            dataset_ids.add(instance.data_set_id)
+
+    feature_model_ids.discard(None)
+    if feature_model_ids:
+        dataset_ids.update(
+            session.connection().execute(
+                select(FeatureModel.data_set_id).where(FeatureModel.id.in_(feature_model_ids))
+            ).scalars()
+        )
+
+    dataset_ids.discard(None)
+    if dataset_ids:
+        archive_service = DataSetArchiveService()
+        for dataset_id in dataset_ids:
+            archive_service.invalidate(dataset_id)
+
+
+def get_unique_filename(folder, filename):
+    """
+    filename, or "name (i).ext" with the first i that is free when a file with that name is already in folder.
+    """
+    if not os.path.exists(os.path.join(folder, filename)):
+        return filename
+    base_name, extension = os.path.splitext(filename)
+    i = 1
+    while os.path.exists(os.path.join(folder, f"{base_name} ({i}){extension}")):
+        i += 1
+    return f"{base_name} ({i}){extension}"
+
+
+class ChunkedUploadService:
+    """
+    Uploads a file as numbered chunks that can be sent in any order, in parallel, and sent again after a dropped
+    connection. Every upload has its own folder in the temp folder of the user with upload.json (name, size and
+    chunk size), the data file, preallocated and written in place at the offset of each chunk, and a marker for
+    every chunk received whole and with the right checksum. A chunk is checked in a file of its own before it is
+    copied into the data file, so a chunk sent again with wrong bytes leaves the one already received as it was.
+    Finalizing moves the data file next to the regular uploads of the user, with its ingestion manifest. Uploads
+    without a new chunk for UPLOAD_EXPIRY seconds are removed when the user starts another one.
+    """
+
+    UPLOADS_FOLDER = ".chunked"
+
+    def __init__(self, temp_folder):
+        self.temp_folder = temp_folder
+        self.default_chunk_size = current_app.config["UPLOAD_CHUNK_SIZE"]
+        self.max_chunk_size = current_app.config["UPLOAD_MAX_CHUNK_SIZE"]
+        self.max_size = current_app.config["UPLOAD_MAX_SIZE"]
+        self.expiry = current_app.config["UPLOAD_EXPIRY"]
+
+    def get_upload_folder(self, upload_id: str) -> Optional[str]:
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            return None
+        return os.path.join(self.temp_folder, self.UPLOADS_FOLDER, upload_id)
+
+    def initiate(self, filename: str, size: int, chunk_size: Optional[int] = None,
+                 checksum: Optional[str] = None) -> dict:
+        filename = os.path.basename(filename or "")
+        if not filename.endswith(".csv"):
+            raise ValueError("No valid file")
+        if not isinstance(size, int) or size < 0 or size > self.max_size:
+            raise ValueError(f"size must be an integer between 0 and {self.max_size}")
+        chunk_size = chunk_size or self.default_chunk_size
+        if not isinstance(chunk_size, int) or chunk_size < 1 or chunk_size > self.max_chunk_size:
+            raise ValueError(f"chunk_size must be an integer between 1 and {self.max_chunk_size}")
+
+        self.remove_expired()
+        upload_id = uuid.uuid4().hex
+        upload_folder = self.get_upload_folder(upload_id)
+        os.makedirs(os.path.join(upload_folder, "received"))
+        with open(os.path.join(upload_folder, "data"), "wb") as data_file:
+            data_file.truncate(size)
+        with open(os.path.join(upload_folder, "upload.json"), "w") as upload_file:
+            json.dump({"filename": filename, "size": size, "chunk_size": chunk_size, "checksum": checksum}, upload_file)
+
+        return self.get_status(upload_id)
+
+    def get_status(self, upload_id: str) -> Optional[dict]:
+        """
+        The upload and the chunks already received, or None when there is no such upload.
+        """
+        upload_folder = self.get_upload_folder(upload_id)
+        try:
+            with open(os.path.join(upload_folder, "upload.json")) as upload_file:
+                upload = json.load(upload_file)
+            received = sorted(int(index) for index in os.listdir(os.path.join(upload_folder, "received")))
+        except (TypeError, FileNotFoundError):
+            return None
+
+        return {
+            "upload_id": upload_id,
+            "filename": upload["filename"],
+            "size": upload["size"],
+            "chunk_size": upload["chunk_size"],
+            "total_chunks": max(-(-upload["size"] // upload["chunk_size"]), 1),
+            "received": received,
+        }
+
+    def remove_expired(self) -> int:
+        """
+        Removes the uploads of the temp folder without activity for the last UPLOAD_EXPIRY seconds, and returns
+        how many.
+        """
+        uploads_folder = os.path.join(self.temp_folder, self.UPLOADS_FOLDER)
+        try:
+            upload_ids = os.listdir(uploads_folder)
+        except FileNotFoundError:
+            return 0
+        removed, now = 0, time.time()
+        for upload_id in upload_ids:
+            upload_folder = os.path.join(uploads_folder, upload_id)
+            try:
+                # Every chunk creates and removes a file in the folder of the upload
+                if now - os.path.getmtime(upload_folder) < self.expiry:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(upload_folder, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def write_chunk(self, upload_id: str, index: int, stream, checksum: str) -> Optional[dict]:
+        """
+        Reads chunk `index` from `stream` in small pieces, so memory does not grow with the chunk size, into a
+        file of its own. Only when it has the expected length and its MD5 is `checksum` is it copied into the data
+        file and marked as received, otherwise it has to be sent again.
+        """
+        status = self.get_status(upload_id)
+        if status is None:
+            return None
+        if not 0 <= index < status["total_chunks"]:
+            raise ValueError(f"Chunk index must be between 0 and {status['total_chunks'] - 1}")
+        if not checksum:
+            raise ValueError("Missing chunk checksum")
+
+        offset = index * status["chunk_size"]
+        expected_size = min(status["chunk_size"], status["size"] - offset)
+        upload_folder = self.get_upload_folder(upload_id)
+
+        # Parallel requests for the same chunk, from any thread or process, each have their own file
+        chunk_path = os.path.join(upload_folder, f"{index}.{uuid.uuid4().hex}.part")
+        hash_md5, written = hashlib.md5(), 0
+        try:
+            with open(chunk_path, "wb") as chunk_file:
+                while written <= expected_size:
+                    piece = stream.read(min(COPY_CHUNK_SIZE, expected_size + 1 - written))
+                    if not piece:
+                        break
+                    chunk_file.write(piece)
+                    hash_md5.update(piece)
+                    written += len(piece)
+
+            if written != expected_size:
+                raise ValueError(f"Chunk {index} must have {expected_size} bytes")
+            if hash_md5.hexdigest() != checksum.lower():
+                raise ValueError(f"Checksum mismatch in chunk {index}")
+
+            # The chunk is not marked as received while the data file has part of it only
+            marker_path = os.path.join(upload_folder, "received", str(index))
+            try:
+                os.remove(marker_path)
+            except FileNotFoundError:
+                pass
+            with open(chunk_path, "rb") as chunk_file:
+                data_fd = os.open(os.path.join(upload_folder, "data"), os.O_WRONLY)
+                try:
+                    position = offset
+                    while piece := chunk_file.read(COPY_CHUNK_SIZE):
+                        os.pwrite(data_fd, piece, position)
+                        position += len(piece)
+                finally:
+                    os.close(data_fd)
+            with open(marker_path, "w") as marker:
+                marker.write(checksum.lower())
+        finally:
+            try:
+                os.remove(chunk_path)
+            except FileNotFoundError:
+                pass
+
+        status["received"] = sorted(set(status["received"]) | {index})
+        return status
+
+    def finalize(self, upload_id: str) -> Optional[tuple[str, dict]]:
+        """
+        Moves the assembled file to the temp folder and returns its final name and ingestion manifest.
+        """
+        status = self.get_status(upload_id)
+        if status is None:
+            return None
+        missing = sorted(set(range(status["total_chunks"])) - set(status["received"]))
+        if missing:
+            raise ValueError(f"Missing chunks: {', '.join(map(str, missing))}")
+
+        upload_folder = self.get_upload_folder(upload_id)
+        data_path = os.path.join(upload_folder, "data")
+        with open(data_path, "rb") as source:
+            manifest = ingest_csv(source, sidecar_dir=current_app.config["COLUMNAR_DIR"])
+        with open(os.path.join(upload_folder, "upload.json")) as upload_file:
+            expected_checksum = json.load(upload_file).get("checksum")
+        if expected_checksum and expected_checksum.lower() != manifest["checksum"]:
+            # There is no telling which chunk is wrong, so the upload cannot be resumed
+            shutil.rmtree(upload_folder, ignore_errors=True)
+            raise ValueError("Checksum mismatch in the assembled file, the upload has to start again")
+
+        filename = get_unique_filename(self.temp_folder, status["filename"])
+        file_path = os.path.join(self.temp_folder, filename)
+        os.replace(data_path, file_path)
+        save_manifest(file_path, manifest)
+        shutil.rmtree(upload_folder, ignore_errors=True)
+        return filename, manifest
+
+
+def get_import_title(name):
+    return re.sub(r"[-_\s]+", " ", name).strip().title()[:120]
+
+
+class DataSetImportService:
+    """
+    Bulk import of a directory tree of CSV files, each folder with CSV files becoming a dataset of the given user.
+    A pool of processes hashes and parses the files while the datasets of the files already read are inserted,
+    `batch_size` datasets per transaction with one multi-row INSERT per table, so a whole catalog costs a handful
+    of round trips to the database instead of several per file. Files already in the blob store are hardlinked
+    instead of copied.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 100):
+        self.dataset_service = DataSetService()
+        self.blob_service = HubfileBlobService()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def import_tree(self, root, user, publication_type=PublicationType.OTHER, tags=None, progress=None) -> dict:
+        """
+        Imports every dataset folder under root. `progress(result)` is called after each folder with the running
+        totals. Returns the totals: datasets, files, bytes, rows, invalid_files, seconds and the dataset_ids.
+        """
+        folders = list(find_dataset_folders(root))
+        file_paths = [file_path for _, folder_files in folders for file_path in folder_files]
+        result = {"datasets": 0, "files": 0, "bytes": 0, "rows": 0, "invalid_files": 0, "seconds": 0.0}
+        result["total_files"], result["dataset_ids"] = len(file_paths), []
+
+        start = time.perf_counter()
+        batch = []
+        with ProcessPoolExecutor(self.workers) as executor:
+            # Small chunks keep every worker busy, large ones save round trips with lots of small files
+            chunksize = max(1, min(64, len(file_paths) // (self.workers * 4)))
+            ingest = partial(ingest_file, sidecar_dir=current_app.config["COLUMNAR_DIR"])
+            manifests = executor.map(ingest, file_paths, chunksize=chunksize)
+            for folder, folder_files in folders:
+                folder_manifests = [next(manifests) for _ in folder_files]
+                batch.append((folder, folder_files, folder_manifests))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(root, user, batch, publication_type, tags, result)
+                    batch = []
+
+                result["files"] += len(folder_files)
+                result["bytes"] += sum(manifest["size"] for manifest in folder_manifests)
+                result["rows"] += sum(manifest["row_count"] for manifest in folder_manifests)
+                result["invalid_files"] += sum(1 for manifest in folder_manifests if manifest["error_count"])
+                result["seconds"] = time.perf_counter() - start
+                if progress:
+                    progress(result)
+
+            if batch:
+                self._import_batch(root, user, batch, publication_type, tags, result)
+
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def build_dataset(self, root, user, folder, folder_files, manifests, publication_type, tags) -> DataSet:
+        relative_folder = os.path.relpath(folder, root)
+        title = get_import_title(os.path.basename(os.path.abspath(folder)))
+        authors = []
+        if user.profile:
+            authors.append(
+                {
+                    "name": f"{user.profile.surname}, {user.profile.name}",
+                    "affiliation": user.profile.affiliation,
+                    "orcid": user.profile.orcid,
+                }
+            )
+
+        feature_models = []
+        for file_path, manifest in zip(folder_files, manifests):
+            filename = os.path.basename(file_path)
+            feature_models.append(
+                {
+                    "fmmetadata": {
+                        "csv_filename": filename,
+                        "title": get_import_title(os.path.splitext(filename)[0]),
+                        "description": f"Data file {filename} belonging to {title}",
+                        "publication_type": publication_type,
+                        "tags": tags,
+                    },
+                    "authors": [],
+                    "file": {
+                        "name": filename,
+                        "checksum": manifest["checksum"],
+                        "size": manifest["size"],
+                        "row_count": manifest["row_count"],
+                    },
+                }
+            )
+
+        dsmetadata = {
+            "title": title,
+            "description": f"Imported from {relative_folder}" if relative_folder != "." else f"Imported {title}",
+            "publication_type": publication_type,
+            "tags": tags,
+            "extra_fields": aggregate_dataset_columns(manifests),
+        }
+        return self.dataset_service.build_dataset(user.id, dsmetadata, authors, feature_models)
+
+    def _import_batch(self, root, user, batch, publication_type, tags, result):
+        datasets = [
+            self.build_dataset(root, user, folder, folder_files, manifests, publication_type, tags)
+            for folder, folder_files, manifests in batch
+        ]
+
+        session = self.dataset_service.repository.session
+        working_dir = os.getenv("WORKING_DIR", "")
+        copied = []
+        try:
+            session.add_all(datasets)
+            session.flush()
+            dataset_ids = [dataset.id for dataset in datasets]
+            HubfileStatisticsService().add_statistics(
+                {
+                    manifest["checksum"]: manifest.get("statistics")
+                    for _, _, manifests in batch
+                    for manifest in manifests
+                }
+            )
+            # The files are copied inside the transaction, so a failed batch leaves neither rows nor files behind
+            for dataset_id, (_, folder_files, manifests) in zip(dataset_ids, batch):
+                dest_dir = os.path.join(working_dir, "uploads", f"user_{user.id}", f"dataset_{dataset_id}")
+                os.makedirs(dest_dir, exist_ok=True)
+                for file_path, manifest in zip(folder_files, manifests):
+                    dest_path = os.path.join(dest_dir, os.path.basename(file_path))
+                    self.blob_service.copy(file_path, dest_path, manifest["checksum"])
+                    copied.append((dest_path, manifest["checksum"]))
+            session.commit()
+        except Exception:
+            session.rollback()
+            for dest_path, checksum in copied:
+                self.blob_service.discard(dest_path, checksum)
+            raise
+
+        result["datasets"] += len(dataset_ids)
+        result["dataset_ids"].extend(dataset_ids)
+
+
 class SizeService:
 
     def __init__(self):
@@ -0,0 +1,500 @@
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+# Neighbors kept per dataset
+DEFAULT_NEIGHBORS = 10
+
+# Terms used by more than this fraction of the datasets say nothing about any of them
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+# Upper bound for the dense block of scores computed at once (rows x datasets)
+MAX_BLOCK_CELLS = 4_000_000
+
+# Terms in at least this fraction of the datasets are scored with a dense matrix product instead of walking
+# their postings, which would cost the square of their document frequency
+DENSE_TERM_FRACTION = 0.02
+MAX_DENSE_TERMS = 512
+
+
+class SparseRows:
+    """
+    Rows of a sparse matrix in CSR layout: the entries of row i are indices[indptr[i]:indptr[i + 1]] with
+    values data[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, indptr, indices, data):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row_ids(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def transpose(self, columns):
+        """
+        Same matrix with rows and columns swapped, as used to walk the datasets that contain a term.
+        """
+        order = np.argsort(self.indices, kind="stable")
+        counts = np.bincount(self.indices, minlength=columns)
+        indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return SparseRows(indptr, self.row_ids()[order].astype(np.int32), self.data[order])
+
+    def slice(self, start, stop):
+        begin, end = self.indptr[start], self.indptr[stop]
+        return SparseRows(self.indptr[start:stop + 1] - begin, self.indices[begin:end], self.data[begin:end])
+
+    def split_columns(self, dense_positions, dense_count):
+        """
+        Splits the matrix in the entries of the columns with a dense position, returned as a dense
+        (rows x dense_count) array, and a sparse matrix with the rest.
+        """
+        row_ids = self.row_ids()
+        positions = dense_positions[self.indices]
+        in_dense = positions >= 0
+        dense = np.zeros((len(self), dense_count), dtype=np.float32)
+        dense[row_ids[in_dense], positions[in_dense]] = self.data[in_dense]
+
+        in_sparse = ~in_dense
+        counts = np.bincount(row_ids[in_sparse], minlength=len(self))
+        indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return SparseRows(indptr, self.indices[in_sparse], self.data[in_sparse]), dense
+
+    @staticmethod
+    def concatenate(first, second):
+        indptr = np.concatenate((first.indptr, second.indptr[1:] + first.indptr[-1]))
+        return SparseRows(
+            indptr, np.concatenate((first.indices, second.indices)), np.concatenate((first.data, second.data))
+        )
+
+
+def fit_vocabulary(documents, max_document_frequency=MAX_DOCUMENT_FREQUENCY):
+    """
+    Vocabulary ({term: column}) and inverse document frequencies of a list of tokenized documents.
+    """
+    term_ids = {}
+    ids = np.fromiter(
+        (term_ids.setdefault(token, len(term_ids)) for document in documents for token in document), dtype=np.int64
+    )
+    lengths = np.fromiter((len(document) for document in documents), dtype=np.int64, count=len(documents))
+    rows = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+
+    # Number of documents containing each term
+    pairs = np.unique(rows * max(len(term_ids), 1) + ids)
+    document_frequency = np.bincount(pairs % max(len(term_ids), 1), minlength=len(term_ids))
+
+    keep = document_frequency <= max(max_document_frequency * len(documents), 1)
+    terms = np.array(list(term_ids), dtype=object)[keep] if term_ids else np.array([], dtype=object)
+    vocabulary = {term: column for column, term in enumerate(terms)}
+    idf = np.log((1 + len(documents)) / (1 + document_frequency[keep])) + 1
+    return vocabulary, idf.astype(np.float32)
+
+
+def transform(documents, vocabulary, idf) -> SparseRows:
+    """
+    TF-IDF vectors of the given documents with a sublinear term frequency, normalized to unit length. Terms
+    outside the vocabulary are ignored.
+    """
+    columns = max(len(vocabulary), 1)
+    known = [[vocabulary[token] for token in document if token in vocabulary] for document in documents]
+    ids = np.fromiter((column for document in known for column in document), dtype=np.int64)
+    lengths = np.fromiter((len(document) for document in known), dtype=np.int64, count=len(known))
+    rows = np.repeat(np.arange(len(known), dtype=np.int64), lengths)
+
+    keys, term_frequency = np.unique(rows * columns + ids, return_counts=True)
+    rows, terms = keys // columns, keys % columns
+    weights = (1 + np.log(term_frequency)) * idf[terms]
+    norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=len(known)))
+    data = weights / norms[rows] if len(rows) else weights
+
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(known))))).astype(np.int64)
+    return SparseRows(indptr, terms.astype(np.int32), data.astype(np.float32))
+
+
+def posting_scores(queries: SparseRows, corpus_by_term: SparseRows, corpus_size: int) -> np.ndarray:
+    """
+    Dot products of every query row with every corpus row, as a dense (queries x corpus) array. Each query
+    entry is multiplied with the postings of its term and the products are summed per (query, row).
+    """
+    rows, terms, weights = queries.row_ids(), queries.indices, queries.data
+    starts, lengths = corpus_by_term.indptr[terms], np.diff(corpus_by_term.indptr)[terms]
+    total = int(lengths.sum())
+
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    products = np.repeat(weights, lengths) * corpus_by_term.data[offsets]
+    cells = np.repeat(rows, lengths) * corpus_size + corpus_by_term.indices[offsets]
+    scores = np.bincount(cells, weights=products, minlength=len(queries) * corpus_size)
+    return scores.astype(np.float32).reshape(len(queries), corpus_size)
+
+
+class CosineScorer:
+    """
+    Cosine similarity of any batch of unit-length rows with a fixed corpus. The most frequent terms go
+    through a dense matrix product and the long tail through the term postings.
+    """
+
+    def __init__(self, corpus: SparseRows, columns: int):
+        self.size = len(corpus)
+        document_frequency = np.bincount(corpus.indices, minlength=columns)
+        frequent = np.flatnonzero(document_frequency >= max(DENSE_TERM_FRACTION * self.size, 2))
+        frequent = frequent[np.argsort(-document_frequency[frequent], kind="stable")[:MAX_DENSE_TERMS]]
+
+        self.dense_positions = np.full(columns, -1, dtype=np.int64)
+        self.dense_positions[frequent] = np.arange(len(frequent))
+        sparse, dense = corpus.split_columns(self.dense_positions, len(frequent))
+        self.corpus_by_term = sparse.transpose(columns)
+        self.corpus_dense_transposed = np.ascontiguousarray(dense.T)
+
+    def block_size(self):
+        return max(1, MAX_BLOCK_CELLS // max(self.size, 1))
+
+    def scores(self, queries: SparseRows) -> np.ndarray:
+        sparse, dense = queries.split_columns(self.dense_positions, self.corpus_dense_transposed.shape[0])
+        scores = posting_scores(sparse, self.corpus_by_term, self.size)
+        scores += dense @ self.corpus_dense_transposed
+        return scores
+
+    def top_k(self, queries: SparseRows, k: int, first_query_row=0):
+        """
+        Top-k most similar corpus rows of every query row, processed in blocks so the dense scores stay under
+        MAX_BLOCK_CELLS. Query i is corpus row first_query_row + i, which is never its own neighbor.
+        """
+        block_size = self.block_size()
+        candidates = np.broadcast_to(np.arange(self.size, dtype=np.int32), (block_size, self.size))
+
+        neighbors = np.empty((len(queries), k), dtype=np.int32)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), block_size):
+            stop = min(start + block_size, len(queries))
+            block = self.scores(queries.slice(start, stop))
+            block[np.arange(stop - start), first_query_row + np.arange(start, stop)] = -np.inf
+            neighbors[start:stop], scores[start:stop] = select_top(block, candidates[: stop - start], k)
+        return neighbors, scores
+
+
+def select_top(scores, candidates, k):
+    """
+    The k best (candidate, score) of every row, best first. Missing or non-positive neighbors are -1 with
+    score 0.
+    """
+    k_available = min(k, scores.shape[1])
+    if k_available == 0:
+        return np.full((len(scores), k), -1, dtype=np.int32), np.zeros((len(scores), k), dtype=np.float32)
+
+    best = np.argpartition(scores, -k_available, axis=1)[:, -k_available:]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+    best_candidates = np.take_along_axis(candidates, best, axis=1)
+
+    neighbors = np.full((len(scores), k), -1, dtype=np.int32)
+    neighbor_scores = np.zeros((len(scores), k), dtype=np.float32)
+    positive = best_scores > 0
+    neighbors[:, :k_available] = np.where(positive, best_candidates, -1)
+    neighbor_scores[:, :k_available] = np.where(positive, best_scores, 0)
+    return neighbors, neighbor_scores
+
+
+class IndexSegment:
+    """
+    Consecutive datasets of an index, from position start on: their ids, TF-IDF vectors and neighbor lists.
+    A segment appended after the first one also holds the new neighbor lists (changed_*) of the earlier
+    datasets that the segment's datasets entered.
+    """
+
+    ARRAYS = ("dataset_ids", "indptr", "indices", "data", "neighbors", "scores")
+    CHANGED_ARRAYS = ("changed_positions", "changed_neighbors", "changed_scores")
+
+    def __init__(self, start, dataset_ids, vectors: SparseRows, neighbors, scores, changed=None):
+        self.start = start
+        self.dataset_ids = dataset_ids
+        self.vectors = vectors
+        self.neighbors = neighbors
+        self.scores = scores
+        k = neighbors.shape[1]
+        self.changed_positions, self.changed_neighbors, self.changed_scores = changed or (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, k), dtype=np.int32),
+            np.empty((0, k), dtype=np.float32),
+        )
+
+    def __len__(self):
+        return len(self.dataset_ids)
+
+    def get_arrays(self, changed=True) -> dict:
+        arrays = {
+            "dataset_ids": self.dataset_ids,
+            "indptr": self.vectors.indptr,
+            "indices": self.vectors.indices,
+            "data": self.vectors.data,
+            "neighbors": self.neighbors,
+            "scores": self.scores,
+        }
+        if changed:
+            arrays.update(
+                changed_positions=self.changed_positions,
+                changed_neighbors=self.changed_neighbors,
+                changed_scores=self.changed_scores,
+            )
+        return arrays
+
+    @classmethod
+    def load(cls, path, start, changed=True, mmap=True):
+        names = cls.ARRAYS + cls.CHANGED_ARRAYS if changed else cls.ARRAYS
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in names}
+        return cls(
+            start,
+            arrays["dataset_ids"],
+            SparseRows(arrays["indptr"], arrays["indices"], arrays["data"]),
+            arrays["neighbors"],
+            arrays["scores"],
+            changed=tuple(arrays[name] for name in cls.CHANGED_ARRAYS) if changed else None,
+        )
+
+
+class ContentSimilarityIndex:
+    """
+    TF-IDF vectors of the synchronized datasets and their k most similar datasets, kept as flat NumPy arrays in
+    segments. The first segment is written by a build; each addition appends a small segment with the new
+    datasets and the neighbor lists they changed, so nothing already written is copied. Neighbors are positions
+    in dataset_ids (-1 when there are fewer than k) with their cosine similarity. Saved indexes are opened
+    memory-mapped, so serving a lookup only touches a few small rows.
+    """
+
+    ARRAYS = IndexSegment.ARRAYS + ("idf",)
+
+    def __init__(self, idf, segments, vocabulary=None, path=None):
+        self.idf = idf
+        self.segments = list(segments)
+        self.path = path
+        self._vocabulary = vocabulary
+        self._dataset_ids = None
+        self._positions = None
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def k(self):
+        return self.segments[0].neighbors.shape[1]
+
+    @property
+    def dataset_ids(self) -> np.ndarray:
+        if self._dataset_ids is None:
+            if len(self.segments) == 1:
+                self._dataset_ids = self.segments[0].dataset_ids
+            else:
+                self._dataset_ids = np.concatenate([segment.dataset_ids for segment in self.segments])
+        return self._dataset_ids
+
+    @property
+    def vocabulary(self) -> dict[str, int]:
+        if self._vocabulary is None:
+            with open(os.path.join(self.path, "vocabulary.txt"), encoding="utf-8") as vocabulary_file:
+                self._vocabulary = {term: column for column, term in enumerate(vocabulary_file.read().split())}
+        return self._vocabulary
+
+    @classmethod
+    def build(cls, dataset_ids, documents, k=DEFAULT_NEIGHBORS, max_document_frequency=MAX_DOCUMENT_FREQUENCY):
+        vocabulary, idf = fit_vocabulary(documents, max_document_frequency)
+        vectors = transform(documents, vocabulary, idf)
+        neighbors, scores = CosineScorer(vectors, len(vocabulary)).top_k(vectors, k)
+        segment = IndexSegment(0, np.asarray(dataset_ids, dtype=np.int64), vectors, neighbors, scores)
+        return cls(idf, [segment], vocabulary=vocabulary)
+
+    def get_rows(self, positions) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Current neighbor lists and scores of the datasets at the given positions.
+        """
+        neighbors = np.empty((len(positions), self.k), dtype=np.int32)
+        scores = np.empty((len(positions), self.k), dtype=np.float32)
+        for segment in self.segments:
+            own = (positions >= segment.start) & (positions < segment.start + len(segment))
+            neighbors[own] = segment.neighbors[positions[own] - segment.start]
+            scores[own] = segment.scores[positions[own] - segment.start]
+
+        # Later segments hold the newest version of the lists they changed
+        for segment in self.segments[1:]:
+            if not len(segment.changed_positions):
+                continue
+            found = np.searchsorted(segment.changed_positions, positions)
+            found = np.minimum(found, len(segment.changed_positions) - 1)
+            changed = segment.changed_positions[found] == positions
+            neighbors[changed] = segment.changed_neighbors[found[changed]]
+            scores[changed] = segment.changed_scores[found[changed]]
+        return neighbors, scores
+
+    def add(self, dataset_ids, documents):
+        """
+        New index with the given datasets appended as a new segment. They are vectorized with the current
+        vocabulary and document frequencies and scored against the existing datasets a block at a time, and
+        only the lists they enter are stored again for the existing datasets.
+        """
+        new_vectors = transform(documents, self.vocabulary, self.idf)
+        scorer = CosineScorer(new_vectors, len(self.idf))
+        old_size, new_size = len(self), len(new_vectors)
+        new_positions = np.arange(old_size, old_size + new_size, dtype=np.int32)
+
+        scores_to_new = scorer.scores(new_vectors)
+        scores_to_new[np.arange(new_size), np.arange(new_size)] = -np.inf
+        candidates = np.broadcast_to(new_positions, scores_to_new.shape)
+        new_neighbors, new_scores = select_top(scores_to_new, candidates, self.k)
+
+        changed_positions, changed_neighbors, changed_scores = [], [], []
+        block_size = scorer.block_size()
+        for segment in self.segments:
+            for start in range(0, len(segment), block_size):
+                stop = min(start + block_size, len(segment))
+                positions = np.arange(segment.start + start, segment.start + stop, dtype=np.int64)
+                block = scorer.scores(segment.vectors.slice(start, stop))
+
+                # The existing datasets of the block become candidates for the lists of the new ones...
+                new_neighbors, new_scores = select_top(
+                    np.concatenate((np.where(new_neighbors >= 0, new_scores, -1), block.T), axis=1),
+                    np.concatenate((new_neighbors, np.broadcast_to(positions, block.T.shape)), axis=1),
+                    self.k,
+                )
+
+                # ...and the new datasets for the lists of the existing ones, of which only the changed are kept
+                neighbors, scores = self.get_rows(positions)
+                merged_neighbors, merged_scores = select_top(
+                    np.concatenate((np.where(neighbors >= 0, scores, -1), block), axis=1),
+                    np.concatenate((neighbors, np.broadcast_to(new_positions, block.shape)), axis=1),
+                    self.k,
+                )
+                changed = (merged_neighbors != neighbors).any(axis=1)
+                changed_positions.append(positions[changed])
+                changed_neighbors.append(merged_neighbors[changed])
+                changed_scores.append(merged_scores[changed])
+
+        segment = IndexSegment(
+            old_size,
+            np.asarray(dataset_ids, dtype=np.int64),
+            new_vectors,
+            new_neighbors,
+            new_scores,
+            changed=(
+                np.concatenate(changed_positions) if changed_positions else np.empty(0, dtype=np.int64),
+                np.concatenate(changed_neighbors) if changed_neighbors else np.empty((0, self.k), dtype=np.int32),
+                np.concatenate(changed_scores) if changed_scores else np.empty((0, self.k), dtype=np.float32),
+            ),
+        )
+        return ContentSimilarityIndex(self.idf, self.segments + [segment], vocabulary=self.vocabulary, path=self.path)
+
+    def merge(self):
+        """
+        Same index as a single segment, with the changed lists applied.
+        """
+        vectors = self.segments[0].vectors
+        for segment in self.segments[1:]:
+            vectors = SparseRows.concatenate(vectors, segment.vectors)
+        neighbors, scores = self.get_rows(np.arange(len(self), dtype=np.int64))
+        segment = IndexSegment(0, np.array(self.dataset_ids), vectors, neighbors, scores)
+        return ContentSimilarityIndex(self.idf, [segment], vocabulary=self.vocabulary)
+
+    def similar(self, dataset_id, limit=DEFAULT_NEIGHBORS) -> list[tuple[int, float]]:
+        if self._positions is None:
+            order = np.argsort(self.dataset_ids, kind="stable")
+            self._positions = (self.dataset_ids[order], order)
+        sorted_ids, order = self._positions
+
+        index = np.searchsorted(sorted_ids, dataset_id)
+        if index == len(sorted_ids) or sorted_ids[index] != dataset_id:
+            return []
+        neighbors, scores = self.get_rows(np.array([order[index]], dtype=np.int64))
+        return [
+            (int(self.dataset_ids[neighbor]), float(score))
+            for neighbor, score in zip(neighbors[0][:limit], scores[0][:limit])
+            if neighbor >= 0
+        ]
+
+    def save(self, directory) -> str:
+        """
+        Writes the index, merged into a single segment, as a new version under directory and makes it the
+        current one. Returns its path.
+        """
+        if len(self.segments) > 1:
+            return self.merge().save(directory)
+
+        os.makedirs(directory, exist_ok=True)
+        version = uuid.uuid4().hex
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+
+        arrays = {**self.segments[0].get_arrays(changed=False), "idf": self.idf}
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(path, "vocabulary.txt"), "w", encoding="utf-8") as vocabulary_file:
+            vocabulary_file.write("\n".join(terms))
+
+        pointer = os.path.join(directory, "CURRENT")
+        with open(f"{pointer}.{version}.tmp", "w") as pointer_file:
+            pointer_file.write(version)
+        os.replace(f"{pointer}.{version}.tmp", pointer)
+
+        # Processes that still map an old version keep reading it until they reload
+        for entry in os.listdir(directory):
+            if entry != version and os.path.isdir(os.path.join(directory, entry)):
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+        self.path = path
+        return path
+
+    def save_segment(self) -> str:
+        """
+        Writes the last segment next to the saved version the index was loaded from and lists it there, so
+        it is read with that version from now on. Returns its path.
+        """
+        names = self.get_segment_names(self.path)
+        name = uuid.uuid4().hex
+        segment_path = os.path.join(self.path, "segments", name)
+        os.makedirs(segment_path)
+        for array_name, array in self.segments[-1].get_arrays().items():
+            np.save(os.path.join(segment_path, f"{array_name}.npy"), array)
+
+        pointer = os.path.join(self.path, "SEGMENTS")
+        with open(f"{pointer}.{name}.tmp", "w") as pointer_file:
+            pointer_file.write("\n".join(names + [name]))
+        os.replace(f"{pointer}.{name}.tmp", pointer)
+        return segment_path
+
+    @staticmethod
+    def get_segment_names(path) -> list[str]:
+        try:
+            with open(os.path.join(path, "SEGMENTS")) as pointer_file:
+                return pointer_file.read().split()
+        except FileNotFoundError:
+            return []
+
+    @classmethod
+    def current_path(cls, directory):
+        try:
+            with open(os.path.join(directory, "CURRENT")) as pointer_file:
+                return os.path.join(directory, pointer_file.read().strip())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def current_version(cls, directory):
+        """
+        Path and segment names of the current index, which change whenever it is saved or added to.
+        """
+        path = cls.current_path(directory)
+        if path is None:
+            return None
+        return path, tuple(cls.get_segment_names(path))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        segments = [IndexSegment.load(path, 0, changed=False, mmap=mmap)]
+        for name in cls.get_segment_names(path):
+            start = segments[-1].start + len(segments[-1])
+            segments.append(IndexSegment.load(os.path.join(path, "segments", name), start, mmap=mmap))
+        idf = np.load(os.path.join(path, "idf.npy"), mmap_mode="r" if mmap else None)
+        return cls(idf, segments, path=path)
@@ -79,6 +79,14 @@ def create_full_dataset(user_id, title, tags, author_names, doi_suffix):
     
     return ds
 
+def get_stats(test_client, dataset_id):
+    """
+    The tests share one session across requests, while a real client gets a new one for each request: forget
+    the rows it has loaded, so the counts written by the analytics buffer on its own connection are read again.
+    """
+    db.session.expire_all()
+    return test_client.get(f"/datasets/{dataset_id}/stats")
+
 # ------------------------- Tests -------------------------
 
 def test_download_creates_record_and_increments(test_client):
@@ -92,7 +100,7 @@ def test_download_creates_record_and_increments(test_client):
     resp = test_client.get(f"/dataset/download/{ds.id}")
     assert resp.status_code == 200
 
-    stats = test_client.get(f"/datasets/{ds.id}/stats")
+    stats = get_stats(test_client, ds.id)
     assert stats.status_code == 200
     assert stats.json["download_count"] == 1
 
@@ -113,7 +121,7 @@ def test_download_exist_record_and_not_increments(test_client):
     resp = test_client.get(f"/dataset/download/{ds.id}")
     assert resp.status_code == 200
 
-    stats = test_client.get(f"/datasets/{ds.id}/stats")
+    stats = get_stats(test_client, ds.id)
     assert stats.status_code == 200
     assert stats.json["download_count"] == 2
 
@@ -130,7 +138,7 @@ def test_download_file_and_increment(test_client):
     resp = test_client.get(f"/file/count_download/{ds.id}")
     assert resp.status_code == 200
 
-    stats = test_client.get(f"/datasets/{ds.id}/stats")
+    stats = get_stats(test_client, ds.id)
     assert stats.status_code == 200
     assert stats.json["download_count"] == 3
 
@@ -151,7 +159,7 @@ def test_download_file_exist_record_and_not_increment(test_client):
     resp = test_client.get(f"/file/count_download/{ds.id}")
     assert resp.status_code == 200
 
-    stats = test_client.get(f"/datasets/{ds.id}/stats")
+    stats = get_stats(test_client, ds.id)
     assert stats.status_code == 200
     assert stats.json["download_count"] == 4
 
@@ -1,13 +1,33 @@
+import fcntl
+import glob
+import hashlib
+import io
+import os
 import uuid
+import zipfile
 from flask import make_response
+from sqlalchemy import Insert, event
+from werkzeug.datastructures import MultiDict
 from app.modules.dataset.services import DataSetService
 import pytest
+from app.modules.dataset import ingestion
+from app.modules.dataset.ingestion import get_manifest, get_manifest_path, ingest_csv
 
 from app import db
 from app.modules.auth.models import User
-from app.modules.dataset.models import DataSet, DSDownloadRecord, DSMetaData, Author
-from app.modules.dataset.services import DataSetService
-from app.modules.dataset.repositories import DataSetRepository
+from app.modules.dataset.forms import DataSetForm
+from app.modules.dataset.models import DataSet, DSDownloadRecord, DSMetaData, DSPublishJob, Author, PublishJobStatus
+from app.modules.dataset.services import (
+    DataSetImportService,
+    DataSetPublishService,
+    aggregate_dataset_columns,
+)
+from app.modules.fakenodo.services import FakenodoService
+from app.modules.hubfile.columnar import ColumnarFile
+from app.modules.hubfile.repositories import HubfileColumnStatisticsRepository
+from app.modules.profile.models import UserProfile
+from core.managers import job_manager
+from core.managers.job_manager import get_jobs
 from app.modules.conftest import login, logout
 from datetime import datetime
 
@@ -179,97 +199,977 @@ def create_dummy_dataset(user_id, title, tags, author_names):
     db.session.refresh(ds)
     return ds
 
-def test_repo_returns_empty_list_if_no_match(test_client):
+
+def get_test_user():
     """
-    Lógica Pura: Si no hay coincidencias, devuelve lista vacía [].
+    The user of the module fixture, created again when a test that cleans the database ran before.
     """
-    user = User(email="tester@example.com", password="pass1234")
-    db.session.add(user)
+    user = User.query.filter_by(email="tester@example.com").first()
+    if user is None:
+        user = User(email="tester@example.com", password="pass1234")
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def test_service_reads_related_datasets_from_neighbor_table():
+    """
+    Verifica que el servicio lee los relacionados precalculados en lugar
+    de buscar coincidencias en todo el catálogo. NO toca la base de datos.
+    """
+
+    from unittest.mock import MagicMock
+    service = DataSetService()
+    service.repository = MagicMock()
+    service.ds_neighbor_repository = MagicMock()
+    service.ds_neighbor_repository.get_related_datasets.return_value = ["related"]
+
+    assert service.get_related_datasets(1) == ["related"]
+
+    service.ds_neighbor_repository.get_related_datasets.assert_called_once_with(1, 4)
+
+
+def test_serialize_datasets_uses_constant_number_of_queries(test_client):
+    from sqlalchemy import event
+
+    from app.modules.dataset.services import serialize_datasets
+    from app.modules.featuremodel.models import FeatureModel, FMMetaData
+    from app.modules.hubfile.models import Hubfile
+
+    user = get_test_user()
+    datasets = []
+    for i in range(4):
+        ds = create_dummy_dataset(user.id, f"Batch Dataset {i}", "batch", ["Author A", "Author B"])
+        for j in range(3):
+            fm_meta = FMMetaData(
+                csv_filename=f"file_{i}_{j}.csv", title="FM", description="FM", publication_type="NONE"
+            )
+            fm = FeatureModel(data_set_id=ds.id, fm_meta_data=fm_meta)
+            fm.files.append(Hubfile(name=f"file_{i}_{j}.csv", checksum="abc", size=1024))
+            db.session.add(fm)
+        db.session.commit()
+        datasets.append(ds)
+
+    dataset_ids = [ds.id for ds in datasets]
+
+    def count_queries(ids):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        db.session.expire_all()
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            with test_client.application.test_request_context():
+                datasets_to_serialize = DataSet.query.filter(DataSet.id.in_(ids)).order_by(DataSet.id).all()
+                serialized = serialize_datasets(datasets_to_serialize)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        return serialized, len(statements)
+
+    single, single_queries = count_queries(dataset_ids[:1])
+    batch, batch_queries = count_queries(dataset_ids)
+
+    assert single_queries == batch_queries
+    assert [ds["id"] for ds in batch] == dataset_ids
+    assert batch[0]["files_count"] == 3
+    assert batch[0]["total_size_in_bytes"] == 3 * 1024
+    assert batch[0]["url"].endswith(f"/doi/{datasets[0].ds_meta_data.dataset_doi}")
+    assert {author["name"] for author in batch[0]["authors"]} == {"Author A", "Author B"}
+
+
+def test_latest_synchronized_loads_serialized_relationships_in_the_same_query(test_client):
+    from app.modules.dataset.repositories import DataSetRepository
+    from app.modules.featuremodel.models import FeatureModel, FMMetaData
+    from app.modules.hubfile.models import Hubfile
+
+    ds = create_dummy_dataset(get_test_user().id, "Latest Serialized Dataset", "latest", ["Author A"])
+    fm = FeatureModel(data_set_id=ds.id, fm_meta_data=FMMetaData(
+        csv_filename="latest.csv", title="FM", description="FM", publication_type="NONE"
+    ))
+    fm.files.append(Hubfile(name="latest.csv", checksum="abc", size=1024))
+    db.session.add(fm)
     db.session.commit()
-    
-    ds = create_dummy_dataset(user.id, "Unique One", "QuantumPhysics", ["Einstein"])
-    
-    create_dummy_dataset(user.id, "Other One", "Cooking", ["Chef Ramsay"])
 
-    repo = DataSetRepository()
-    
-    results = repo.get_related_datasets(ds.id, ["QuantumPhysics"], ["Einstein"])
+    statements = []
 
-    assert isinstance(results, list)
-    assert results == []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
 
+    db.session.expire_all()
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        latest = DataSetRepository().latest_synchronized()
+        loading_statements = list(statements)
+        with test_client.application.test_request_context():
+            serialized = [dataset.to_dict() for dataset in latest]
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
 
-def test_repo_logic_ordering_and_limit(test_client):
-    """
-    Lógica Pura: Verifica que ordena por descargas y limita a 4 resultados.
-    """
-    user = User(email="tester1@example.com", password="pass1234")
+    # The datasets are fetched once and serializing them needs no further queries
+    assert sum("FROM data_set" in statement for statement in loading_statements) == 1
+    assert statements == loading_statements
+    assert serialized[0]["files_count"] == 1
+
+
+def add_dataset_file(dataset, dataset_folder, name, content):
+    from app.modules.featuremodel.models import FeatureModel, FMMetaData
+    from app.modules.hubfile.models import Hubfile
+
+    (dataset_folder / name).write_bytes(content)
+    fm_meta = FMMetaData(csv_filename=name, title="FM", description="FM", publication_type="NONE")
+    fm = FeatureModel(data_set_id=dataset.id, fm_meta_data=fm_meta)
+    fm.files.append(Hubfile(name=name, checksum=f"checksum_{len(content)}", size=len(content)))
+    db.session.add(fm)
+    db.session.commit()
+    return fm
+
+
+@pytest.fixture
+def dataset_with_files(test_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    monkeypatch.setitem(test_client.application.config, "ARCHIVE_CACHE_DIR", str(tmp_path / "archive_cache"))
+
+    user = get_test_user()
+    ds = create_dummy_dataset(user.id, "Streamed Dataset", "zip", ["Author"])
+
+    dataset_folder = tmp_path / "uploads" / f"user_{user.id}" / f"dataset_{ds.id}"
+    dataset_folder.mkdir(parents=True)
+    contents = {
+        "players.csv": b"Name,Age\n" + b"Player,25\n" * 50000,
+        "empty.csv": b"",
+    }
+    for name, content in contents.items():
+        add_dataset_file(ds, dataset_folder, name, content)
+
+    return ds, dataset_folder, contents
+
+
+def test_download_dataset_streams_zip_with_all_files(test_client, dataset_with_files):
+    import io
+    import zipfile
+
+    ds, _, contents = dataset_with_files
+
+    resp = test_client.get(f"/dataset/download/{ds.id}")
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.mimetype == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [f"dataset_{ds.id}/empty.csv", f"dataset_{ds.id}/players.csv"]
+        assert archive.read(f"dataset_{ds.id}/players.csv") == contents["players.csv"]
+        assert archive.getinfo(f"dataset_{ds.id}/players.csv").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_download_dataset_is_served_from_archive_cache(test_client, dataset_with_files):
+    from app.modules.dataset.services import DataSetArchiveService
+
+    ds, dataset_folder, _ = dataset_with_files
+
+    first = test_client.get(f"/dataset/download/{ds.id}")
+    first_body = first.data
+
+    cached_archive = DataSetArchiveService().get_cached_archive(ds)
+    assert cached_archive is not None
+    with open(cached_archive, "rb") as archive:
+        assert archive.read() == first_body
+
+    second = test_client.get(f"/dataset/download/{ds.id}")
+    assert second.status_code == 200
+    assert second.data == first_body
+
+    # Adding a file invalidates the cached archive of the dataset
+    add_dataset_file(ds, dataset_folder, "new.csv", b"Name\nNew\n")
+    assert not os.path.exists(cached_archive)
+    assert DataSetArchiveService().get_cached_archive(ds) is None
+
+
+def test_archive_is_built_once_per_digest(test_client, dataset_with_files):
+    from app.modules.dataset.services import DataSetArchiveService
+
+    ds, _, _ = dataset_with_files
+    service = DataSetArchiveService()
+    digest = service.get_archive_digest(ds)
+    os.makedirs(service.cache_dir, exist_ok=True)
+
+    # While another worker builds the archive, downloads are generated on the fly and nothing is cached
+    with open(os.path.join(service.cache_dir, f".{digest}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert service.build_archive(ds, digest) is None
+        response = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=0-9"})
+        assert response.status_code == 200
+        assert zipfile.ZipFile(io.BytesIO(response.data)).namelist()
+        assert service.get_cached_archive(ds, digest) is None
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Once built, the archive is served from the cache with ranges
+    path = service.build_archive(ds, digest)
+    assert path == service.get_cached_archive_path(ds, digest)
+    assert not os.path.exists(os.path.join(service.cache_dir, f".{digest}.lock"))
+    assert not [name for name in os.listdir(service.cache_dir) if name.endswith(".tmp")]
+    response = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    with open(path, "rb") as archive:
+        assert response.data == archive.read(10)
+
+
+def test_archive_is_only_cached_once_streamed_completely(test_client, dataset_with_files):
+    from app.modules.dataset.services import DataSetArchiveService
+
+    ds, _, _ = dataset_with_files
+    service = DataSetArchiveService()
+    digest = service.get_archive_digest(ds)
+
+    # A client disconnecting closes the stream: nothing is cached and the lock is released
+    stream = service.stream_archive(ds)
+    next(stream)
+    assert not os.path.exists(service.get_cached_archive_path(ds, digest))
+    assert service.build_archive(ds, digest) is None
+    stream.close()
+    assert service.get_cached_archive(ds, digest) is None
+    assert not [name for name in os.listdir(service.cache_dir) if name.endswith(".tmp")]
+
+    body = b"".join(service.stream_archive(ds))
+    with open(service.get_cached_archive(ds, digest), "rb") as archive:
+        assert archive.read() == body
+    assert b"".join(service.stream_archive(ds)) == body
+
+
+def test_archive_cache_evicts_least_recently_used(test_client, dataset_with_files, tmp_path, monkeypatch):
+    from app.modules.dataset.services import DataSetArchiveService
+
+    ds, _, _ = dataset_with_files
+    cache_dir = tmp_path / "archive_cache"
+    cache_dir.mkdir()
+    old_archive = cache_dir / "dataset_999_old.zip"
+    old_archive.write_bytes(b"x" * 1024)
+    os.utime(old_archive, (0, 0))
+
+    monkeypatch.setitem(test_client.application.config, "ARCHIVE_CACHE_MAX_BYTES", 1024)
+    b"".join(DataSetArchiveService().stream_archive(ds))
+
+    assert not old_archive.exists()
+    assert DataSetArchiveService().get_cached_archive(ds) is not None
+
+
+def test_download_dataset_supports_conditional_and_range_requests(test_client, dataset_with_files):
+    ds, _, _ = dataset_with_files
+
+    # The first download streams the whole archive while caching it, the next ones get ranges
+    first = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=0-9"})
+    assert first.status_code == 200
+    assert first.is_streamed
+    etag = first.headers["ETag"]
+    assert first.headers["Last-Modified"]
+    body = first.data
+    first_range = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=0-9"})
+    assert first_range.status_code == 206
+    assert first_range.data == body[:10]
+
+    not_modified = test_client.get(f"/dataset/download/{ds.id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    # Byte ranges keep the same ETag, so interrupted downloads can be resumed
+    partial = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.headers["ETag"] == etag
+    assert partial.data == body[10:20]
+
+    resumed = test_client.get(f"/dataset/download/{ds.id}", headers={"Range": "bytes=10-", "If-Range": etag})
+    assert resumed.status_code == 206
+    assert resumed.data == body[10:]
+
+    # Only downloads from the first byte are counted
+    def is_recorded(cookie, **headers):
+        test_client.set_cookie("download_cookie", cookie)
+        test_client.get(f"/dataset/download/{ds.id}", headers=headers)
+        return DSDownloadRecord.query.filter_by(download_cookie=cookie).count() == 1
+
+    assert is_recorded("range-full")
+    assert is_recorded("range-first", Range="bytes=0-9")
+    assert not is_recorded("range-revalidation", **{"If-None-Match": etag})
+    assert not is_recorded("range-resumed", Range="bytes=10-")
+    test_client.delete_cookie("download_cookie")
+
+
+def test_analytics_buffer_deduplicates_and_flushes_in_bulk(test_client, monkeypatch):
+    from core.managers.analytics_manager import AnalyticsManager
+
+    user = get_test_user()
+    ds = create_dummy_dataset(user.id, "Buffered Dataset", "analytics", ["Author"])
+    db.session.add(DSDownloadRecord(dataset_id=ds.id, download_cookie="already-stored"))
+    db.session.commit()
+
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_WRITE_BEHIND", True)
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_FLUSH_INTERVAL", 3600)
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_FLUSH_SIZE", 1000)
+    analytics = AnalyticsManager(test_client.application)
+
+    statements = []
+
+    def download(cookie):
+        return analytics.record(
+            "dataset_download", user_id=None, dataset_id=ds.id, download_date=datetime.now(), download_cookie=cookie
+        )
+
+    assert download("cookie-a") is True
+    assert download("cookie-a") is False
+    assert download("cookie-b") is True
+    assert download("already-stored") is True
+
+    # Nothing is written until the buffer is flushed
+    assert DSDownloadRecord.query.filter_by(dataset_id=ds.id).count() == 1
+
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        analytics.flush()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    cookies = {record.download_cookie for record in DSDownloadRecord.query.filter_by(dataset_id=ds.id)}
+    assert cookies == {"already-stored", "cookie-a", "cookie-b"}
+    db.session.refresh(ds)
+    assert ds.download_count == 2
+    record_inserts = [
+        statement for statement in statements
+        if statement.lstrip().upper().startswith("INSERT INTO DS_DOWNLOAD_RECORD")
+    ]
+    assert len(record_inserts) == 1
+
+
+def test_analytics_buffer_retries_the_events_of_a_failed_write(test_client, monkeypatch):
+    from core.managers.analytics_manager import AnalyticsManager, AnalyticsStream
+
+    ds = create_dummy_dataset(get_test_user().id, "Retried Dataset", "analytics", ["Author"])
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_WRITE_BEHIND", True)
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_FLUSH_INTERVAL", 3600)
+    monkeypatch.setitem(test_client.application.config, "ANALYTICS_MAX_PENDING", 1)
+    analytics = AnalyticsManager(test_client.application)
+
+    def download(cookie):
+        analytics.record(
+            "dataset_download", user_id=None, dataset_id=ds.id, download_date=datetime.now(), download_cookie=cookie
+        )
+
+    def failing_existing_keys(self, connection, rows):
+        raise RuntimeError("Database unavailable")
+
+    download("retried-a")
+    download("retried-b")
+    existing_keys = AnalyticsStream.existing_keys
+    monkeypatch.setattr(AnalyticsStream, "existing_keys", failing_existing_keys)
+    analytics.flush()
+    monkeypatch.setattr(AnalyticsStream, "existing_keys", existing_keys)
+    assert DSDownloadRecord.query.filter_by(dataset_id=ds.id).count() == 0
+
+    # The failed events are written by the next flush, as many as the buffer holds
+    analytics.flush()
+    cookies = {record.download_cookie for record in DSDownloadRecord.query.filter_by(dataset_id=ds.id)}
+    assert cookies == {"retried-a"}
+
+
+def test_analytics_written_right_away_leave_the_session_alone(test_client):
+    from core.managers.analytics_manager import get_analytics
+
+    ds = create_dummy_dataset(get_test_user().id, "Untouched Dataset", "analytics", ["Author"])
+    ds.ds_meta_data.title = "Uncommitted title"
+
+    assert get_analytics().record(
+        "dataset_download", user_id=None, dataset_id=ds.id, download_date=datetime.now(), download_cookie="untouched"
+    )
+
+    # The download is stored, while the change of the caller is neither committed nor rolled back
+    assert ds.ds_meta_data in db.session.dirty
+    with db.engine.connect() as connection:
+        stored_title = connection.execute(
+            DSMetaData.__table__.select().where(DSMetaData.id == ds.ds_meta_data_id)
+        ).one().title
+        stored_downloads = connection.execute(
+            DSDownloadRecord.__table__.select().where(DSDownloadRecord.download_cookie == "untouched")
+        ).all()
+    assert stored_title == "Untouched Dataset"
+    assert len(stored_downloads) == 1
+    db.session.rollback()
+
+
+def test_trending_datasets_sum_daily_buckets_for_each_window(test_client, trending_test_data):
+    from app.modules.dataset.repositories import DSDownloadDailyCountRepository
+
+    dataset_service = DataSetService()
+
+    last_week = dataset_service.get_trending_datasets(days=7)
+    assert [downloads for _, downloads in last_week] == [1, 1, 1, 1]
+
+    last_quarter = dataset_service.get_trending_datasets(days=90, limit=10)
+    downloads_by_title = {dataset.ds_meta_data.title: downloads for dataset, downloads in last_quarter}
+    assert downloads_by_title["Trending Dataset 1"] == 4
+    assert downloads_by_title["Trending Dataset 6"] == 2
+
+    # Rebuilding the buckets from the raw records gives the same result
+    expected = dataset_service.get_trending_datasets(days=30)
+    DSDownloadDailyCountRepository().rebuild()
+    assert dataset_service.get_trending_datasets(days=30) == expected
+
+
+def test_trending_page_accepts_window(test_client, trending_test_data):
+    response = test_client.get("/dataset/trending?days=7")
+    assert response.status_code == 200
+    assert b"Last 90 days" in response.data
+
+
+def test_related_datasets_follow_publication_and_retagging(test_client, clean_database):
+    from app.modules.dataset.services import RelatedDataSetService
+
+    user = User(email="related@example.com", password="pass1234")
     db.session.add(user)
     db.session.commit()
-    
-    main_ds = create_dummy_dataset(user.id, "Main", "CommonTag", ["Me"])
 
-    ds1 = create_dummy_dataset(user.id, "DS1", "CommonTag", ["A"]); ds1.download_count = 10
-    ds2 = create_dummy_dataset(user.id, "DS2", "CommonTag", ["B"]); ds2.download_count = 50
-    ds3 = create_dummy_dataset(user.id, "DS3", "CommonTag", ["C"]); ds3.download_count = 5
-    ds4 = create_dummy_dataset(user.id, "DS4", "CommonTag", ["D"]); ds4.download_count = 20
-    ds5 = create_dummy_dataset(user.id, "DS5", "CommonTag", ["E"]); ds5.download_count = 1
+    main = create_dummy_dataset(user.id, "Related Main", "Basketball, Stats", ["Ana López"])
+    twin = create_dummy_dataset(user.id, "Related Twin", " basketball ,STATS", ["Ana Lopez"])
+    cousin = create_dummy_dataset(user.id, "Related Cousin", "Basketball, Draft", ["Luis"])
+    stranger = create_dummy_dataset(user.id, "Related Stranger", "Cooking", ["Chef"])
+
+    service = DataSetService()
+    assert service.get_related_datasets(main.id) == [twin, cousin]
+    assert set(service.get_related_datasets(cousin.id)) == {main, twin}
+    assert service.get_related_datasets(stranger.id) == []
 
-    db.session.add_all([ds1, ds2, ds3, ds4, ds5])
+    stranger.ds_meta_data.tags = "Basketball, Stats, Draft"
+    cousin.ds_meta_data.tags = "Cooking"
     db.session.commit()
+    assert service.get_related_datasets(main.id) == [twin, stranger]
+    assert service.get_related_datasets(cousin.id) == []
 
-    repo = DataSetRepository()
-    results = repo.get_related_datasets(main_ds.id, ["CommonTag"], ["Me"])
+    # The incremental updates end up with the same lists as a full rebuild
+    datasets = [main, twin, cousin, stranger]
+    incremental = {dataset.id: service.get_related_datasets(dataset.id, limit=10) for dataset in datasets}
+    RelatedDataSetService().rebuild()
+    assert {dataset.id: service.get_related_datasets(dataset.id, limit=10) for dataset in datasets} == incremental
 
-    assert len(results) == 4
 
-    assert results[0].id == ds2.id
-    assert results[0].download_count == 50
-    assert results[1].id == ds4.id
-    assert ds5 not in results
+def test_deleted_dataset_leaves_related_lists(test_client, clean_database):
+    user = User(email="related-delete@example.com", password="pass1234")
+    db.session.add(user)
+    db.session.commit()
 
+    main = create_dummy_dataset(user.id, "Kept", "Playoffs", ["Ana"])
+    removed = create_dummy_dataset(user.id, "Removed", "Playoffs", ["Ana"])
+    other = create_dummy_dataset(user.id, "Other", "Playoffs", ["Luis"])
 
-def test_repo_logic_excludes_self(test_client):
-    """
-    Lógica Pura: El dataset no debe recomendarse a sí mismo aunque coincidan tags.
-    """
-    user = User(email="tester2@example.com", password="pass1234")
+    service = DataSetService()
+    assert service.get_related_datasets(main.id) == [removed, other]
+
+    removed.delete()
+    assert service.get_related_datasets(main.id) == [other]
+    assert service.get_related_datasets(other.id) == [main]
+
+
+def test_similar_datasets_come_from_the_tfidf_index(test_client, clean_database, tmp_path, monkeypatch):
+    from app.modules.dataset.services import ContentSimilarityService
+
+    monkeypatch.setitem(test_client.application.config, "SIMILARITY_INDEX_DIR", str(tmp_path))
+    user = User(email="similar@example.com", password="pass1234")
     db.session.add(user)
     db.session.commit()
-    ds = create_dummy_dataset(user.id, "Selfie", "Mirror", ["Narcissus"])
-    
-    repo = DataSetRepository()
-    results = repo.get_related_datasets(ds.id, ["Mirror"], ["Narcissus"])
-    
-    assert ds not in results
-    assert results == []
-    
-def test_service_prepares_data_correctly():
-    """
-    Verifica que el servicio limpia los tags y extrae autores 
-    antes de llamar al repositorio. NO toca la base de datos.
-    """
-    
-    from unittest.mock import MagicMock
-    mock_repository = MagicMock()
+
+    def create(title, description):
+        dataset = create_dummy_dataset(user.id, title, "nba", ["Author"])
+        dataset.ds_meta_data.description = description
+        db.session.commit()
+        return dataset
+
+    lakers = create("Lakers box scores", "Points rebounds assists of the Lakers roster")
+    celtics = create("Celtics box scores", "Points rebounds assists of the Celtics roster")
+    draft = create("Draft combine", "Wingspan vertical jump prospects")
+    create("Arena attendance", "Tickets sold per season")
+
     service = DataSetService()
-    service.repository = mock_repository
+    assert service.get_similar_datasets(lakers.id) == []
+
+    assert ContentSimilarityService().build() == 4
+    assert service.get_similar_datasets(lakers.id) == [celtics]
+    assert service.get_similar_datasets(draft.id) == []
+
+    # Datasets published after the build are appended to the index when their commit goes through
+    knicks = create("Knicks box scores", "Points rebounds assists of the Knicks roster")
+    assert service.get_similar_datasets(knicks.id)[0] in (lakers, celtics)
+    assert knicks in service.get_similar_datasets(lakers.id)
+
+    unpublished = create_dummy_dataset(user.id, "Unpublished box scores", "nba", ["Author"])
+    unpublished.ds_meta_data.dataset_doi = None
+    db.session.commit()
+    assert unpublished not in service.get_similar_datasets(lakers.id, limit=10)
+
+
+def test_similarity_index_matches_brute_force_cosine():
+    import random
+
+    import numpy as np
+
+    from app.modules.dataset.similarity import ContentSimilarityIndex, transform
+
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(200)]
+    documents = [[rng.choice(words[: rng.randint(5, 200)]) for _ in range(rng.randint(0, 12))] for _ in range(300)]
+
+    index = ContentSimilarityIndex.build(list(range(250)), documents[:250], k=5)
+    index = index.add(list(range(250, 280)), documents[250:280]).add(list(range(280, 300)), documents[280:])
+
+    vectors = transform(documents, index.vocabulary, index.idf)
+    dense = np.zeros((300, len(index.idf)))
+    dense[vectors.row_ids(), vectors.indices] = vectors.data
+    expected = dense @ dense.T
+    np.fill_diagonal(expected, 0)
+    expected = np.sort(expected, axis=1)[:, ::-1][:, :5]
+
+    # Segments only hold the lists the added datasets changed, and merging them gives the same index
+    assert len(index.segments) == 3
+    assert len(index.segments[2].changed_positions) < 280
+    assert np.allclose(index.get_rows(np.arange(300))[1], expected, atol=1e-5)
+    assert np.allclose(index.merge().segments[0].scores, expected, atol=1e-5)
+    for dataset_id, score in index.similar(7):
+        assert np.isclose(expected[7][expected[7] > 0], score, atol=1e-5).any()
+        assert np.isclose(dense[7] @ dense[dataset_id], score, atol=1e-5)
+
+
+def test_similarity_index_segments_are_saved_and_merged(tmp_path):
+    from app.modules.dataset.similarity import ContentSimilarityIndex
+
+    documents = [["guard", "points"], ["guard", "assists"], ["center", "rebounds"], ["center", "blocks"], ["points"]]
+    path = ContentSimilarityIndex.build([1, 2, 3], documents[:3], k=2).save(str(tmp_path))
+    base_files = {name: os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)}
+
+    index = ContentSimilarityIndex.load(path).add([4], documents[3:4])
+    segment_path = index.save_segment()
+    # Adding only writes the new segment, the saved version is left as it was
+    assert {name: os.path.getmtime(os.path.join(path, name)) for name in base_files} == base_files
+    assert os.path.dirname(os.path.dirname(segment_path)) == path
+
+    loaded = ContentSimilarityIndex.load(path)
+    assert ContentSimilarityIndex.current_version(str(tmp_path))[1] == (os.path.basename(segment_path),)
+    assert loaded.similar(4) == index.similar(4)
+    assert loaded.similar(3) == index.similar(3)
+    assert [dataset_id for dataset_id, _ in loaded.similar(3)] == [4]
+
+    merged_path = loaded.add([5], documents[4:]).save(str(tmp_path))
+    merged = ContentSimilarityIndex.load(merged_path)
+    assert len(merged.segments) == 1
+    assert merged.dataset_ids.tolist() == [1, 2, 3, 4, 5]
+    assert [dataset_id for dataset_id, _ in merged.similar(5)] == [1]
+    assert not os.path.exists(path)
+
+
+def test_ingest_csv_hashes_parses_and_validates_in_one_pass(tmp_path):
+    content = (
+        "Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game,College\n"
+        "Jordan,1m98,40,1072,30.1,5.3,6.2,UNC\n"
+        "\n"
+        "Bird,2m06,,897,x,6.3,10.0,Indiana\n"
+    ).encode()
+
+    class CountingSource(io.BytesIO):
+        bytes_read = 0
+
+        def read(self, size=-1):
+            chunk = super().read(size)
+            CountingSource.bytes_read += len(chunk)
+            return chunk
+
+    manifest = ingest_csv(CountingSource(content), str(tmp_path / "players.csv"))
+
+    assert CountingSource.bytes_read == len(content)
+    assert (tmp_path / "players.csv").read_bytes() == content
+    assert not (tmp_path / "players.csv.part").exists()
+    assert manifest["checksum"] == hashlib.md5(content).hexdigest()
+    assert manifest["size"] == len(content)
+    assert manifest["columns"][-1] == "College"
+    assert manifest["row_count"] == 2
+    assert manifest["errors"] == ["Line 4: Points per game 'x' is not a valid number"]
+
+
+def test_ingest_csv_writes_the_columnar_sidecar(tmp_path):
+    content = (
+        b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+        b"Jordan,1m98,40,1072,30.1,5.3,6.2\n"
+        b"Bird,2m06,,897,24.3,6.3,10.0\n"
+    )
+    manifest = ingest_csv(io.BytesIO(content), sidecar_dir=str(tmp_path / "columnar"))
+
+    columnar = ColumnarFile(str(tmp_path / "columnar" / f"{manifest['checksum']}.columns"))
+    assert (columnar.checksum, columnar.source_size) == (manifest["checksum"], len(content))
+    assert columnar.names() == ["Jordan", "Bird"]
+    assert columnar.values("Games").tolist() == [1072.0, 897.0]
+    assert columnar.values("Rebounds per game").tolist() == [6.2, 10.0]
+
+
+def test_uploaded_file_manifest_is_reused(test_client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with test_client.application.app_context():
+        db.session.add(User(email="uploader@example.com", password="pass1234"))
+        db.session.commit()
+    login(test_client, "uploader@example.com", "pass1234")
+    content = (
+        b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game,Team\n"
+        b"Jordan,1m98,40,1,2,3,4,CHI\n"
+    )
+
+    response = test_client.post(
+        "/dataset/file/upload", data={"file": (io.BytesIO(content), "players.csv")}, content_type="multipart/form-data"
+    )
+    logout(test_client)
+
+    assert response.status_code == 200
+    assert response.json["row_count"] == 1
+    assert response.json["error_count"] == 0
+    [file_path] = glob.glob(str(tmp_path / "uploads" / "temp" / "*" / "players.csv"))
+    assert os.path.exists(get_manifest_path(file_path))
+
+    # create_from_form takes the checksum and columns from the manifest instead of reading the file again
+    monkeypatch.setattr(ingestion, "ingest_csv", lambda *args: pytest.fail("file read again"))
+    manifest = get_manifest(file_path)
+    assert manifest["checksum"] == hashlib.md5(content).hexdigest()
+    assert aggregate_dataset_columns([manifest]) == "Team"
+
+
+def test_chunked_upload_accepts_chunks_in_any_order_and_resumes(test_client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with test_client.application.app_context():
+        db.session.add(User(email="chunked@example.com", password="pass1234"))
+        db.session.commit()
+    login(test_client, "chunked@example.com", "pass1234")
+    content = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n" + b"".join(
+        f"Player {i},2m01,{20 + i % 15},{i},1.5,2.5,3.5\n".encode() for i in range(200)
+    )
+    chunks = [content[start:start + 1000] for start in range(0, len(content), 1000)]
+
+    response = test_client.post(
+        "/dataset/file/upload/chunked",
+        json={"filename": "season.csv", "size": len(content), "chunk_size": 1000,
+              "checksum": hashlib.md5(content).hexdigest()},
+    )
+    assert response.status_code == 201
+    upload_id = response.json["upload_id"]
+    assert response.json["total_chunks"] == len(chunks)
+
+    def put_chunk(index, data, checksum=None):
+        return test_client.put(
+            f"/dataset/file/upload/chunked/{upload_id}/{index}",
+            data=data,
+            headers={"X-Chunk-Checksum": checksum or hashlib.md5(data).hexdigest()},
+        )
+
+    # Last chunk first, a corrupted chunk is rejected and not marked as received
+    assert put_chunk(len(chunks) - 1, chunks[-1]).status_code == 200
+    assert put_chunk(0, chunks[0][:-1] + b"X", hashlib.md5(chunks[0]).hexdigest()).status_code == 400
+    assert put_chunk(0, chunks[0][:10]).status_code == 400
+    assert test_client.post(f"/dataset/file/upload/chunked/{upload_id}/finalize").status_code == 400
+
+    # Resuming after a dropped connection only sends what the server is missing
+    received = test_client.get(f"/dataset/file/upload/chunked/{upload_id}").json["received"]
+    assert received == [len(chunks) - 1]
+    for index in reversed(range(len(chunks))):
+        if index not in received:
+            assert put_chunk(index, chunks[index]).status_code == 200
+
+    response = test_client.post(f"/dataset/file/upload/chunked/{upload_id}/finalize")
+    logout(test_client)
+
+    assert response.status_code == 200
+    assert response.json["filename"] == "season.csv"
+    assert response.json["row_count"] == 200
+    assert response.json["error_count"] == 0
+    [file_path] = glob.glob(str(tmp_path / "uploads" / "temp" / "*" / "season.csv"))
+    with open(file_path, "rb") as uploaded:
+        assert uploaded.read() == content
+    assert get_manifest(file_path)["checksum"] == hashlib.md5(content).hexdigest()
+    assert glob.glob(str(tmp_path / "uploads" / "temp" / "*" / ".chunked" / "*")) == []
 
-    mock_dataset = MagicMock()
-    mock_dataset.id = 1
-    
-    mock_dataset.ds_meta_data.tags = " AI , Machine Learning, " 
-    
-    author1 = MagicMock(); author1.name = "Maria"
-    author2 = MagicMock(); author2.name = "Juan"
-    mock_dataset.ds_meta_data.authors = [author1, author2]
 
-    mock_repository.find_by_id.return_value = mock_dataset
+def test_chunked_upload_keeps_received_chunks_and_removes_expired_uploads(test_client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with test_client.application.app_context():
+        db.session.add(User(email="chunked_resend@example.com", password="pass1234"))
+        db.session.commit()
+    login(test_client, "chunked_resend@example.com", "pass1234")
+    content = b"Name,Age\nJordan,40\n"
 
-    service.get_related_datasets(1)
+    response = test_client.post(
+        "/dataset/file/upload/chunked", json={"filename": "resend.csv", "size": len(content), "chunk_size": 10}
+    )
+    upload_id = response.json["upload_id"]
+    for index, start in enumerate(range(0, len(content), 10)):
+        chunk = content[start:start + 10]
+        headers = {"X-Chunk-Checksum": hashlib.md5(chunk).hexdigest()}
+        assert test_client.put(f"/dataset/file/upload/chunked/{upload_id}/{index}", data=chunk,
+                               headers=headers).status_code == 200
 
-    mock_repository.get_related_datasets.assert_called_once_with(
-        1,                         
-        ['AI', 'Machine Learning'],
-        ['Maria', 'Juan']           
+    # A received chunk sent again with wrong bytes is rejected without touching the data file
+    response = test_client.put(
+        f"/dataset/file/upload/chunked/{upload_id}/0",
+        data=b"XXXX" + content[4:10],
+        headers={"X-Chunk-Checksum": hashlib.md5(content[:10]).hexdigest()},
     )
+    assert response.status_code == 400
+    assert test_client.get(f"/dataset/file/upload/chunked/{upload_id}").json["received"] == [0, 1]
+    [upload_folder] = glob.glob(str(tmp_path / "uploads" / "temp" / "*" / ".chunked" / upload_id))
+    assert sorted(os.listdir(upload_folder)) == ["data", "received", "upload.json"]
+    with open(os.path.join(upload_folder, "data"), "rb") as data_file:
+        assert data_file.read() == content
+
+    # Starting another upload removes the ones abandoned for longer than UPLOAD_EXPIRY
+    os.utime(upload_folder, (0, 0))
+    test_client.post("/dataset/file/upload/chunked", json={"filename": "other.csv", "size": 1})
+    logout(test_client)
+    assert not os.path.exists(upload_folder)
+
+
+def test_publish_job_runs_in_background_and_is_idempotent(test_client, clean_database, monkeypatch):
+    with test_client.application.app_context():
+        user = User(email="publisher@example.com", password="pass1234")
+        db.session.add(user)
+        meta = DSMetaData(title="Unpublished", description="Unpublished", publication_type="NONE", tags="nba")
+        db.session.add(meta)
+        db.session.flush()
+        dataset = DataSet(user_id=user.id, ds_meta_data_id=meta.id)
+        db.session.add(dataset)
+        db.session.commit()
+        dataset_id, meta_id = dataset.id, meta.id
+
+        jobs = get_jobs()
+        enqueued = []
+        monkeypatch.setattr(jobs, "max_attempts", 3)
+        original_enqueue = jobs.enqueue
+        monkeypatch.setattr(jobs, "enqueue", lambda *args: enqueued.append(args) or original_enqueue(*args))
+
+        # The first publication attempt fails, the retry succeeds
+        publish_deposition = FakenodoService.publish_deposition
+        failures = iter([RuntimeError("Fakenodo is down")])
+
+        def flaky_publish_deposition(self, deposition_id):
+            failure = next(failures, None)
+            if failure:
+                raise failure
+            return publish_deposition(self, deposition_id)
+
+        monkeypatch.setattr(FakenodoService, "publish_deposition", flaky_publish_deposition)
+
+        service = DataSetPublishService()
+        service.enqueue(db.session.get(DataSet, dataset_id))
+        service.enqueue(db.session.get(DataSet, dataset_id))
+        assert jobs.wait(timeout=10)
+
+        db.session.expire_all()
+        job = service.get_job(dataset_id)
+        assert enqueued == [("publish_dataset", dataset_id)]
+        assert job.status == PublishJobStatus.SUCCEEDED
+        assert job.attempts == 2
+        assert db.session.get(DSMetaData, meta_id).dataset_doi == f"10.1234/nbahub.{meta_id}"
+
+        # A published dataset is not queued again
+        service.enqueue(db.session.get(DataSet, dataset_id))
+        assert len(enqueued) == 1
+
+    login(test_client, "publisher@example.com", "pass1234")
+    response = test_client.get(f"/dataset/{dataset_id}/publish/status")
+    logout(test_client)
+    assert response.status_code == 200
+    assert response.json["status"] == "succeeded"
+    assert response.json["dataset_doi"] == f"10.1234/nbahub.{meta_id}"
+
+
+def test_stale_publish_jobs_are_queued_again(test_client, clean_database):
+    with test_client.application.app_context():
+        user = User(email="restarted@example.com", password="pass1234")
+        db.session.add(user)
+        meta = DSMetaData(title="Lost", description="Lost", publication_type="NONE", tags="nba")
+        db.session.add(meta)
+        db.session.flush()
+        dataset = DataSet(user_id=user.id, ds_meta_data_id=meta.id)
+        db.session.add(dataset)
+        db.session.flush()
+        # A restart killed the job while it ran, long ago
+        db.session.add(DSPublishJob(dataset_id=dataset.id, status=PublishJobStatus.RUNNING, attempts=1,
+                                    updated_at=datetime(2020, 1, 1)))
+        db.session.commit()
+        dataset_id, meta_id = dataset.id, meta.id
+
+        assert get_jobs().recover_stale() == 1
+        assert get_jobs().wait(timeout=10)
+        db.session.expire_all()
+        job = DataSetPublishService().get_job(dataset_id)
+        assert (job.status, job.attempts) == (PublishJobStatus.SUCCEEDED, 2)
+        assert db.session.get(DSMetaData, meta_id).dataset_doi == f"10.1234/nbahub.{meta_id}"
+        assert get_jobs().recover_stale() == 0
+
+
+def test_rq_backend_waits_until_no_job_is_queued_running_or_scheduled(test_client, monkeypatch):
+    class Registry:
+        def __init__(self, counts):
+            self.counts = counts
+
+        @property
+        def count(self):
+            return next(self.counts, 0)
+
+    class Queue:
+        def __init__(self, queued, started, scheduled):
+            self.queued = iter(queued)
+            self.started_job_registry = Registry(iter(started))
+            self.scheduled_job_registry = Registry(iter(scheduled))
+
+        @property
+        def count(self):
+            return next(self.queued, 0)
+
+    monkeypatch.setattr(job_manager, "RQ_WAIT_POLL_INTERVAL", 0)
+    backend = job_manager.RqJobBackend(test_client.application.extensions["jobs"])
+    backend.queue = Queue([1, 0, 0, 0], [1, 0, 0], [1, 0])
+    assert backend.wait(timeout=5)
+
+    backend.queue = Queue(iter(lambda: 1, 0), [], [])
+    assert not backend.wait(timeout=0.05)
+
+
+def test_publish_job_fails_after_max_attempts(test_client, clean_database, monkeypatch):
+    with test_client.application.app_context():
+        user = User(email="failing@example.com", password="pass1234")
+        db.session.add(user)
+        meta = DSMetaData(title="Never published", description="Never published", publication_type="NONE", tags="nba")
+        db.session.add(meta)
+        db.session.flush()
+        dataset = DataSet(user_id=user.id, ds_meta_data_id=meta.id)
+        db.session.add(dataset)
+        db.session.commit()
+
+        monkeypatch.setattr(get_jobs(), "max_attempts", 3)
+        monkeypatch.setattr(FakenodoService, "create_new_deposition", lambda self, dataset: {})
+
+        service = DataSetPublishService()
+        service.enqueue(dataset)
+        assert get_jobs().wait(timeout=10)
+
+        db.session.expire_all()
+        job = service.get_job(dataset.id)
+        assert job.status == PublishJobStatus.FAILED
+        assert job.attempts == 3
+        assert "was not created" in job.last_error
+        assert db.session.get(DSMetaData, meta.id).dataset_doi is None
+
+
+def test_import_tree_creates_a_dataset_per_folder_in_batches(test_client, clean_database, tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    header = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game"
+    roster = header + b",Team\nJordan,1m98,40,1072,30.1,5.3,6.2,CHI\nPippen,2m03,35,1178,16.1,5.2,6.4,CHI\n"
+    catalog = tmp_path / "catalog"
+    (catalog / "bulls" / "1996-97").mkdir(parents=True)
+    (catalog / "spurs").mkdir()
+    (catalog / "bulls" / "1996-97" / "roster.csv").write_bytes(roster)
+    (catalog / "bulls" / "1996-97" / "playoffs.csv").write_bytes(header + b"\nKerr,1m91,31,19,x,1.2,1.1\n")
+    (catalog / "spurs" / "roster.csv").write_bytes(roster)
+
+    with test_client.application.app_context():
+        user = User(email="importer@example.com", password="pass1234")
+        db.session.add(user)
+        db.session.commit()
+
+        progress = []
+        result = DataSetImportService(workers=2, batch_size=1).import_tree(
+            str(catalog), user, tags="nba", progress=lambda result: progress.append(result["files"])
+        )
+
+        assert progress == [2, 3]
+        assert (result["datasets"], result["files"], result["rows"], result["invalid_files"]) == (2, 3, 5, 1)
+        assert result["bytes"] == 2 * len(roster) + len(header) + 27
+
+        datasets = [db.session.get(DataSet, dataset_id) for dataset_id in result["dataset_ids"]]
+        assert [dataset.ds_meta_data.title for dataset in datasets] == ["1996 97", "Spurs"]
+        assert datasets[0].ds_meta_data.extra_fields == "Team"
+        assert datasets[0].ds_meta_data.tags == "nba"
+        assert sorted(feature_model.fm_meta_data.csv_filename for feature_model in datasets[0].feature_models) == [
+            "playoffs.csv",
+            "roster.csv",
+        ]
+        [spurs_file] = datasets[1].files()
+        assert spurs_file.checksum == hashlib.md5(roster).hexdigest()
+        assert spurs_file.row_count == 2
+        # Statistics of the numeric columns are stored at ingest, heights in centimeters
+        heights = next(
+            statistics
+            for statistics in HubfileColumnStatisticsRepository().get_by_checksum(spurs_file.checksum)
+            if statistics.column_name == "Height"
+        )
+        assert (heights.count, heights.minimum, heights.maximum) == (2, 198.0, 203.0)
+
+        bulls_roster = tmp_path / "uploads" / f"user_{user.id}" / f"dataset_{datasets[0].id}" / "roster.csv"
+        spurs_roster = tmp_path / "uploads" / f"user_{user.id}" / f"dataset_{datasets[1].id}" / "roster.csv"
+        assert spurs_roster.read_bytes() == roster
+        # The same content imported twice is stored once
+        assert os.path.samefile(bulls_roster, spurs_roster)
+
+
+def test_create_from_form_statement_count_does_not_grow_with_files(test_client, clean_database, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    header = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+
+    with test_client.application.app_context():
+        user = User(email="batched@example.com", password="pass1234")
+        db.session.add(user)
+        db.session.add(UserProfile(user=user, name="Phil", surname="Jackson"))
+        db.session.commit()
+
+        def create_dataset(file_count):
+            temp_folder = user.temp_folder()
+            os.makedirs(temp_folder, exist_ok=True)
+            formdata = MultiDict({"title": f"{file_count} files", "desc": "Batched", "publication_type": "none"})
+            for i in range(file_count):
+                filename = f"players_{file_count}_{i}.csv"
+                with open(os.path.join(temp_folder, filename), "wb") as csv_file:
+                    csv_file.write(header + f"Player {file_count}.{i},1m98,40,1,2,3,4\n".encode())
+                formdata.add(f"feature_models-{i}-csv_filename", filename)
+                formdata.add(f"feature_models-{i}-title", f"Players {i}")
+                formdata.add(f"feature_models-{i}-desc", "Roster")
+                formdata.add(f"feature_models-{i}-publication_type", "none")
+                formdata.add(f"feature_models-{i}-authors-0-name", f"Author {i}")
+            with test_client.application.test_request_context(method="POST", data=formdata):
+                form = DataSetForm()
+
+            statements = []
+
+            def record(connection, clauseelement, *args):
+                statements.append(clauseelement)
+
+            event.listen(db.engine, "before_execute", record)
+            try:
+                dataset = DataSetService().create_from_form(form, user)
+            finally:
+                event.remove(db.engine, "before_execute", record)
+            return dataset, statements
+
+        # The first dataset also creates the platform statistics
+        create_dataset(1)
+        _, few_files_statements = create_dataset(2)
+        dataset, many_files_statements = create_dataset(12)
+
+        assert len(many_files_statements) == len(few_files_statements)
+        file_inserts = [
+            statement
+            for statement in many_files_statements
+            if isinstance(statement, Insert) and statement.table.name == "file"
+        ]
+        assert len(file_inserts) == 1
+        assert len(dataset.feature_models) == 12
+        assert sorted(author.name for author in dataset.ds_meta_data.authors) == ["Jackson, Phil"]
+        assert all(len(feature_model.files) == 1 for feature_model in dataset.feature_models)
+        file_authors = Author.query.filter(Author.fm_meta_data_id.in_(
+            [feature_model.fm_meta_data_id for feature_model in dataset.feature_models]
+        ))
+        assert {author.name for author in file_authors} == {f"Author {i}" for i in range(12)}
@@ -26,126 +26,159 @@ function send_query() {
                 dateError.style.display = 'none';
             }
             
-            const csrfToken = document.getElementById('csrf_token').value;
-
-            const searchCriteria = {
-                csrf_token: csrfToken,
-                query: document.querySelector('#query').value,
-                publication_type: document.querySelector('#publication_type').value,
-                sorting: document.querySelector('[name="sorting"]:checked').value,
-                start_date: startDate,
-                end_date: endDate
-            };
-
-            console.log(document.querySelector('#publication_type').value);
-
-            fetch('/explore', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(searchCriteria),
-            })
-                .then(response => response.json())
-                .then(data => {
-
-                    console.log(data);
-                    document.getElementById('results').innerHTML = '';
-
-                    // results counter
-                    const resultCount = data.length;
-                    const resultText = resultCount === 1 ? 'dataset' : 'datasets';
-                    document.getElementById('results_number').textContent = `${resultCount} ${resultText} found`;
-
-                    if (resultCount === 0) {
-                        console.log("show not found icon");
-                        document.getElementById("results_not_found").style.display = "block";
-                    } else {
-                        document.getElementById("results_not_found").style.display = "none";
-                    }
-
-
-                    data.forEach(dataset => {
-                        let card = document.createElement('div');
-                        card.className = 'col-12';
-                        card.innerHTML = `
-                            <div class="card">
-                                <div class="card-body">
-                                    <div class="d-flex align-items-center justify-content-between">
-                                        <h3><a href="${dataset.url}">${dataset.title}</a></h3>
-                                        <div>
-                                            <span class="badge bg-primary" style="cursor: pointer;" onclick="set_publication_type_as_query('${dataset.publication_type}')">${dataset.publication_type}</span>
-                                        </div>
-                                    </div>
-                                    <p class="text-secondary">${formatDate(dataset.created_at)}</p>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Description
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            <p class="card-text">${dataset.description}</p>
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Authors
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            ${dataset.authors.map(author => `
-                                                <p class="p-0 m-0">${author.name}${author.affiliation ? ` (${author.affiliation})` : ''}${author.orcid ? ` (${author.orcid})` : ''}</p>
-                                            `).join('')}
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Tags
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            ${dataset.tags.map(tag => `<span class="badge bg-primary me-1" style="cursor: pointer;" onclick="set_tag_as_query('${tag}')">${tag}</span>`).join('')}
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row">
-
-                                        <div class="col-md-4 col-12">
-
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            <a href="${dataset.url}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
-                                                View dataset
-                                            </a>
-                                            <a href="/dataset/download/${dataset.id}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
-                                                Download (${dataset.total_size_in_human_format})
-                                            </a>
-                                        </div>
-
-
-                                    </div>
+            load_page(null);
+        });
+    });
+
+    document.getElementById('load_more').addEventListener('click', () => {
+        load_page(next_cursor);
+    });
+}
+
+const PAGE_SIZE = 20;
+let next_cursor = null;
+let search_id = 0;
+
+function load_page(cursor) {
+
+    const csrfToken = document.getElementById('csrf_token').value;
+    const firstPage = cursor === null;
+
+    const searchCriteria = {
+        csrf_token: csrfToken,
+        query: document.querySelector('#query').value,
+        publication_type: document.querySelector('#publication_type').value,
+        sorting: document.querySelector('[name="sorting"]:checked').value,
+        start_date: document.querySelector('#start_date').value,
+        end_date: document.querySelector('#end_date').value,
+        limit: PAGE_SIZE,
+        cursor: cursor,
+        // The total only changes with the filters, so it is counted once per search
+        count_total: firstPage
+    };
+
+    // Responses of a search that has been replaced by a newer one are discarded
+    const currentSearch = firstPage ? ++search_id : search_id;
+    const loadMoreButton = document.getElementById('load_more');
+    loadMoreButton.disabled = true;
+
+    fetch('/explore', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(searchCriteria),
+    })
+        .then(response => response.json().then(data => ({
+            data: data,
+            nextCursor: response.headers.get('X-Next-Cursor'),
+            total: response.headers.get('X-Total-Count')
+        })))
+        .then(({data, nextCursor, total}) => {
+
+            if (currentSearch !== search_id) {
+                return;
+            }
+
+            if (firstPage) {
+                document.getElementById('results').innerHTML = '';
+
+                // results counter
+                const resultCount = total !== null ? parseInt(total) : data.length;
+                const resultText = resultCount === 1 ? 'dataset' : 'datasets';
+                document.getElementById('results_number').textContent = `${resultCount} ${resultText} found`;
+
+                if (resultCount === 0) {
+                    console.log("show not found icon");
+                    document.getElementById("results_not_found").style.display = "block";
+                } else {
+                    document.getElementById("results_not_found").style.display = "none";
+                }
+            }
+
+            next_cursor = nextCursor;
+            loadMoreButton.disabled = false;
+            loadMoreButton.style.display = next_cursor ? 'inline-block' : 'none';
+
+            data.forEach(dataset => {
+                let card = document.createElement('div');
+                card.className = 'col-12';
+                card.innerHTML = `
+                    <div class="card">
+                        <div class="card-body">
+                            <div class="d-flex align-items-center justify-content-between">
+                                <h3><a href="${dataset.url}">${dataset.title}</a></h3>
+                                <div>
+                                    <span class="badge bg-primary" style="cursor: pointer;" onclick="set_publication_type_as_query('${dataset.publication_type}')">${dataset.publication_type}</span>
+                                </div>
+                            </div>
+                            <p class="text-secondary">${formatDate(dataset.created_at)}</p>
+
+                            <div class="row mb-2">
+
+                                <div class="col-md-4 col-12">
+                                    <span class=" text-secondary">
+                                        Description
+                                    </span>
+                                </div>
+                                <div class="col-md-8 col-12">
+                                    <p class="card-text">${dataset.description}</p>
+                                </div>
+
+                            </div>
+
+                            <div class="row mb-2">
+
+                                <div class="col-md-4 col-12">
+                                    <span class=" text-secondary">
+                                        Authors
+                                    </span>
+                                </div>
+                                <div class="col-md-8 col-12">
+                                    ${dataset.authors.map(author => `
+                                        <p class="p-0 m-0">${author.name}${author.affiliation ? ` (${author.affiliation})` : ''}${author.orcid ? ` (${author.orcid})` : ''}</p>
+                                    `).join('')}
+                                </div>
+
+                            </div>
+
+                            <div class="row mb-2">
+
+                                <div class="col-md-4 col-12">
+                                    <span class=" text-secondary">
+                                        Tags
+                                    </span>
+                                </div>
+                                <div class="col-md-8 col-12">
+                                    ${dataset.tags.map(tag => `<span class="badge bg-primary me-1" style="cursor: pointer;" onclick="set_tag_as_query('${tag}')">${tag}</span>`).join('')}
+                                </div>
+
+                            </div>
+
+                            <div class="row">
+
+                                <div class="col-md-4 col-12">
 
                                 </div>
+                                <div class="col-md-8 col-12">
+                                    <a href="${dataset.url}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
+                                        View dataset
+                                    </a>
+                                    <a href="/dataset/download/${dataset.id}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
+                                        Download (${dataset.total_size_in_human_format})
+                                    </a>
+                                </div>
+
+
                             </div>
-                        `;
 
-                        document.getElementById('results').appendChild(card);
-                    });
-                });
+                        </div>
+                    </div>
+                `;
+
+                document.getElementById('results').appendChild(card);
+            });
         });
-    });
 }
 
 function formatDate(dateString) {
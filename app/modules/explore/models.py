@@ -0,0 +1,17 @@
+from app import db
+
+
+class SearchIndexEntry(db.Model):
+    __tablename__ = "search_index_entry"
+    __table_args__ = (db.Index("ix_search_index_entry_token_dataset", "token", "dataset_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), nullable=False)
+    dataset_id = db.Column(
+        db.Integer, db.ForeignKey("data_set.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    field = db.Column(db.String(32), nullable=False)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f"SearchIndexEntry<{self.token}, dataset={self.dataset_id}, field={self.field}>"
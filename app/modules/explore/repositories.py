@@ -1,9 +1,7 @@
-import re
-
-import unidecode
-from sqlalchemy import any_, or_
+from sqlalchemy import and_, any_, delete, insert, or_, select
 
 from app.modules.dataset.models import Author, DataSet, DSMetaData, PublicationType
+from app.modules.explore.models import SearchIndexEntry
 from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from core.repositories.BaseRepository import BaseRepository
 from datetime import datetime
@@ -13,35 +11,53 @@ class ExploreRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
 
-    def filter(self, query="", sorting="newest", publication_type="any", tags=[], start_date=None, end_date=None, **kwargs):
-        # Normalize and remove unwanted characters
-        normalized_query = unidecode.unidecode(query).lower()
-        cleaned_query = re.sub(r'[,.":\'()\[\]^;!¡¿?]', "", normalized_query)
-
-        filters = []
-        for word in cleaned_query.split():
-            filters.append(DSMetaData.title.ilike(f"%{word}%"))
-            filters.append(DSMetaData.description.ilike(f"%{word}%"))
-            filters.append(Author.name.ilike(f"%{word}%"))
-            filters.append(Author.affiliation.ilike(f"%{word}%"))
-            filters.append(Author.orcid.ilike(f"%{word}%"))
-            filters.append(FMMetaData.csv_filename.ilike(f"%{word}%"))
-            filters.append(FMMetaData.title.ilike(f"%{word}%"))
-            filters.append(FMMetaData.description.ilike(f"%{word}%"))
-            filters.append(FMMetaData.publication_doi.ilike(f"%{word}%"))
-            filters.append(FMMetaData.tags.ilike(f"%{word}%"))
-            filters.append(DSMetaData.tags.ilike(f"%{word}%"))
-            filters.append(DSMetaData.extra_fields.ilike(f"%{word}%"))
+    def filter(self, candidate_ids=None, sorting="newest", publication_type="any", tags=[], start_date=None,
+               end_date=None, limit=None, after=None, **kwargs):
+        datasets = self._filtered_query(candidate_ids, publication_type, tags, start_date, end_date)
+
+        # Keyset pagination: resume right after the (created_at, id) of the last dataset already served
+        if after is not None:
+            after_created_at, after_id = after
+            if sorting == "oldest":
+                datasets = datasets.filter(
+                    or_(
+                        DataSet.created_at > after_created_at,
+                        and_(DataSet.created_at == after_created_at, DataSet.id > after_id),
+                    )
+                )
+            else:
+                datasets = datasets.filter(
+                    or_(
+                        DataSet.created_at < after_created_at,
+                        and_(DataSet.created_at == after_created_at, DataSet.id < after_id),
+                    )
+                )
+
+        # Order by created_at, using the id to break ties so that pages never overlap
+        if sorting == "oldest":
+            datasets = datasets.order_by(self.model.created_at.asc(), self.model.id.asc())
+        else:
+            datasets = datasets.order_by(self.model.created_at.desc(), self.model.id.desc())
+
+        if limit is not None:
+            datasets = datasets.limit(limit)
+
+        return datasets.all()
+
+    def count_filtered(self, candidate_ids=None, publication_type="any", tags=[], start_date=None, end_date=None,
+                       **kwargs):
+        return self._filtered_query(candidate_ids, publication_type, tags, start_date, end_date).count()
 
+    def _filtered_query(self, candidate_ids, publication_type, tags, start_date, end_date):
         datasets = (
             self.model.query.join(DataSet.ds_meta_data)
-            .outerjoin(DSMetaData.authors)
-            .outerjoin(DataSet.feature_models)
-            .outerjoin(FeatureModel.fm_meta_data)
-            .filter(or_(*filters))
             .filter(DSMetaData.dataset_doi.isnot(None))  # Exclude datasets with empty dataset_doi
         )
 
+        # Only hydrate the datasets resolved from the search index
+        if candidate_ids is not None:
+            datasets = datasets.filter(DataSet.id.in_(candidate_ids))
+
         if publication_type != "any":
             matching_type = None
             for member in PublicationType:
@@ -65,11 +81,84 @@ class ExploreRepository(BaseRepository):
                 end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
             datasets = datasets.filter(DataSet.created_at <= end_date)
 
+        return datasets
 
-        # Order by created_at
-        if sorting == "oldest":
-            datasets = datasets.order_by(self.model.created_at.asc())
-        else:
-            datasets = datasets.order_by(self.model.created_at.desc())
 
-        return datasets.all()
+class SearchIndexRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(SearchIndexEntry)
+
+    def candidate_ids(self, tokens):
+        """
+        Builds the subquery with the ids of the datasets that contain any token starting with one of the given
+        tokens. Prefix matching keeps the lookup on the token index instead of scanning the metadata tables.
+        """
+        return (
+            select(SearchIndexEntry.dataset_id)
+            .where(or_(*[SearchIndexEntry.token.like(f"{token}%") for token in tokens]))
+            .distinct()
+        )
+
+    def get_all_dataset_ids(self):
+        return self.session.execute(select(DataSet.id).order_by(DataSet.id)).scalars().all()
+
+    def get_dataset_ids_by_ds_meta_data(self, ds_meta_data_ids, connection=None):
+        connection = connection or self.session.connection()
+        return connection.execute(
+            select(DataSet.id).where(DataSet.ds_meta_data_id.in_(ds_meta_data_ids))
+        ).scalars().all()
+
+    def get_dataset_ids_by_fm_meta_data(self, fm_meta_data_ids, connection=None):
+        connection = connection or self.session.connection()
+        return connection.execute(
+            select(FeatureModel.data_set_id).where(FeatureModel.fm_meta_data_id.in_(fm_meta_data_ids))
+        ).scalars().all()
+
+    def get_documents(self, dataset_ids, connection=None):
+        """
+        Collects the searchable text of the given datasets as {dataset_id: [(field, text), ...]} using one query
+        per source table.
+        """
+        connection = connection or self.session.connection()
+        documents = {dataset_id: [] for dataset_id in dataset_ids}
+
+        ds_meta_data_rows = connection.execute(
+            select(DataSet.id, DSMetaData.title, DSMetaData.description, DSMetaData.tags, DSMetaData.extra_fields)
+            .join(DSMetaData, DataSet.ds_meta_data_id == DSMetaData.id)
+            .where(DataSet.id.in_(dataset_ids))
+        )
+        for dataset_id, title, description, tags, extra_fields in ds_meta_data_rows:
+            documents[dataset_id].extend(
+                [("title", title), ("description", description), ("tags", tags), ("extra_fields", extra_fields)]
+            )
+
+        author_rows = connection.execute(
+            select(DataSet.id, Author.name, Author.affiliation, Author.orcid)
+            .join(Author, Author.ds_meta_data_id == DataSet.ds_meta_data_id)
+            .where(DataSet.id.in_(dataset_ids))
+        )
+        for dataset_id, name, affiliation, orcid in author_rows:
+            documents[dataset_id].extend([("author", name), ("author", affiliation), ("author", orcid)])
+
+        fm_meta_data_rows = connection.execute(
+            select(
+                FeatureModel.data_set_id,
+                FMMetaData.csv_filename,
+                FMMetaData.title,
+                FMMetaData.description,
+                FMMetaData.publication_doi,
+                FMMetaData.tags,
+            )
+            .join(FMMetaData, FeatureModel.fm_meta_data_id == FMMetaData.id)
+            .where(FeatureModel.data_set_id.in_(dataset_ids))
+        )
+        for dataset_id, *texts in fm_meta_data_rows:
+            documents[dataset_id].extend(("file", text) for text in texts)
+
+        return documents
+
+    def replace_entries(self, dataset_ids, entries, connection=None):
+        connection = connection or self.session.connection()
+        connection.execute(delete(SearchIndexEntry).where(SearchIndexEntry.dataset_id.in_(dataset_ids)))
+        if entries:
+            connection.execute(insert(SearchIndexEntry), entries)
@@ -1,5 +1,6 @@
 from flask import jsonify, render_template, request
 
+from app.modules.dataset.services import serialize_datasets
 from app.modules.explore import explore_bp
 from app.modules.explore.forms import ExploreForm
 from app.modules.explore.services import ExploreService
@@ -15,8 +16,14 @@ def index():
     if request.method == "POST":
         criteria = request.get_json()
         try:
-            datasets = ExploreService().filter(**criteria)
-            return jsonify([dataset.to_dict() for dataset in datasets])
+            datasets, next_cursor, total = ExploreService().filter_page(**criteria)
+            response = jsonify(serialize_datasets(datasets))
+            # Pagination metadata travels in headers so the body stays a plain list of datasets
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            if total is not None:
+                response.headers["X-Total-Count"] = str(total)
+            return response
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
         except Exception as e:
@@ -1,10 +1,162 @@
-from app.modules.explore.repositories import ExploreRepository
+import base64
+import itertools
+import json
+import re
+from datetime import datetime
+
+import unidecode
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.modules.dataset.models import Author, DataSet, DSMetaData
+from app.modules.explore.repositories import ExploreRepository, SearchIndexRepository
+from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from core.services.BaseService import BaseService
 
+# Weight of a token depending on the field it was extracted from
+FIELD_WEIGHTS = {
+    "title": 5,
+    "tags": 4,
+    "author": 3,
+    "extra_fields": 3,
+    "file": 2,
+    "description": 1,
+}
+
+MAX_TOKEN_LENGTH = 64
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def tokenize(text):
+    if not text:
+        return []
+    normalized_text = unidecode.unidecode(text).lower()
+    return [token[:MAX_TOKEN_LENGTH] for token in re.findall(r"[a-z0-9]+", normalized_text)]
+
+
+def encode_cursor(dataset):
+    payload = json.dumps({"created_at": dataset.created_at.isoformat(), "id": dataset.id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["created_at"]), int(payload["id"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+class SearchIndexService(BaseService):
+    def __init__(self):
+        super().__init__(SearchIndexRepository())
+
+    def candidate_ids(self, query):
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return None
+        return self.repository.candidate_ids(tokens)
+
+    def reindex(self, dataset_ids, connection=None):
+        dataset_ids = sorted(set(dataset_ids))
+        if not dataset_ids:
+            return
+
+        documents = self.repository.get_documents(dataset_ids, connection=connection)
+
+        entries = {}
+        for dataset_id, fields in documents.items():
+            for field, text in fields:
+                for token in tokenize(text):
+                    key = (token, dataset_id, field)
+                    entries[key] = {"token": token, "dataset_id": dataset_id, "field": field,
+                                    "weight": FIELD_WEIGHTS[field]}
+
+        self.repository.replace_entries(dataset_ids, list(entries.values()), connection=connection)
+
+    def rebuild(self, batch_size=500):
+        dataset_ids = self.repository.get_all_dataset_ids()
+        for start in range(0, len(dataset_ids), batch_size):
+            self.reindex(dataset_ids[start:start + batch_size])
+            self.repository.session.commit()
+        return len(dataset_ids)
+
+    def touched_dataset_ids(self, session):
+        dataset_ids, ds_meta_data_ids, fm_meta_data_ids = set(), set(), set()
+
+        for instance in itertools.chain(session.new, session.dirty, session.deleted):
+            if isinstance(instance, DataSet):
+                dataset_ids.add(instance.id)
+            elif isinstance(instance, DSMetaData):
+                ds_meta_data_ids.add(instance.id)
+            elif isinstance(instance, Author):
+                if instance.ds_meta_data_id:
+                    ds_meta_data_ids.add(instance.ds_meta_data_id)
+                if instance.fm_meta_data_id:
+                    fm_meta_data_ids.add(instance.fm_meta_data_id)
+            elif isinstance(instance, FeatureModel):
+                dataset_ids.add(instance.data_set_id)
+            elif isinstance(instance, FMMetaData):
+                fm_meta_data_ids.add(instance.id)
+
+        if ds_meta_data_ids:
+            dataset_ids.update(
+                self.repository.get_dataset_ids_by_ds_meta_data(ds_meta_data_ids, connection=session.connection())
+            )
+        if fm_meta_data_ids:
+            dataset_ids.update(
+                self.repository.get_dataset_ids_by_fm_meta_data(fm_meta_data_ids, connection=session.connection())
+            )
+
+        dataset_ids.discard(None)
+        return dataset_ids
+
+
+@event.listens_for(Session, "after_flush")
+def update_search_index(session, flush_context):
+    """
+    Keeps the inverted index in sync with every flush that creates, changes or removes the searchable
+    metadata of a dataset. The entries are written in the same transaction as the metadata.
+    """
+    search_index_service = SearchIndexService()
+    dataset_ids = search_index_service.touched_dataset_ids(session)
+    if dataset_ids:
+        search_index_service.reindex(dataset_ids, connection=session.connection())
+
 
 class ExploreService(BaseService):
     def __init__(self):
         super().__init__(ExploreRepository())
+        self.search_index_service = SearchIndexService()
 
     def filter(self, query="", sorting="newest", publication_type="any", tags=[], start_date=None, end_date=None, **kwargs):
-        return self.repository.filter(query, sorting, publication_type, tags, start_date, end_date, **kwargs)
+        candidate_ids = self.search_index_service.candidate_ids(query)
+        return self.repository.filter(candidate_ids, sorting, publication_type, tags, start_date, end_date, **kwargs)
+
+    def filter_page(self, query="", limit=DEFAULT_PAGE_SIZE, cursor=None, count_total=True, **criteria):
+        """
+        Returns one page of the search as (datasets, next_cursor, total). The next page starts right after the
+        (created_at, id) encoded in next_cursor, which is None on the last page. Counting every match costs an
+        extra query, so total is only computed when count_total is set and is None otherwise.
+        """
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer")
+        if limit < 1:
+            raise ValueError("limit must be greater than 0")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        after = decode_cursor(cursor) if cursor else None
+        candidate_ids = self.search_index_service.candidate_ids(query)
+
+        # Fetch one extra row to know whether there is a next page without counting
+        datasets = self.repository.filter(candidate_ids, limit=limit + 1, after=after, **criteria)
+        next_cursor = encode_cursor(datasets[limit - 1]) if len(datasets) > limit else None
+        datasets = datasets[:limit]
+
+        total = self.repository.count_filtered(candidate_ids, **criteria) if count_total else None
+
+        return datasets, next_cursor, total
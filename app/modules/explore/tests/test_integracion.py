@@ -423,3 +423,29 @@ def test_explore_filter_complete_workflow(test_client_with_date_datasets):
 
     logout(test_client_with_date_datasets)
 
+
+def test_explore_paginates_with_cursor(test_client_with_date_datasets):
+    """Test de integración: paginación por cursor sobre (created_at, id)"""
+    criteria = {"query": "Test Dataset", "sorting": "newest", "publication_type": "any", "limit": 2}
+
+    first_page = test_client_with_date_datasets.post("/explore", json=criteria)
+    assert first_page.status_code == 200
+    assert [ds["title"] for ds in first_page.json] == ["Recent Test Dataset", "Mid Test Dataset"]
+    assert first_page.headers["X-Total-Count"] == "3"
+    next_cursor = first_page.headers["X-Next-Cursor"]
+
+    second_page = test_client_with_date_datasets.post(
+        "/explore", json={**criteria, "cursor": next_cursor, "count_total": False}
+    )
+    assert second_page.status_code == 200
+    assert [ds["title"] for ds in second_page.json] == ["Old Test Dataset"]
+    assert "X-Next-Cursor" not in second_page.headers
+    assert "X-Total-Count" not in second_page.headers
+
+
+def test_explore_rejects_invalid_cursor(test_client_with_date_datasets):
+    """Test de integración: un cursor inválido devuelve 400"""
+    response = test_client_with_date_datasets.post(
+        "/explore", json={"query": "", "cursor": "not-a-cursor", "limit": 2}
+    )
+    assert response.status_code == 400
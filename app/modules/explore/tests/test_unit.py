@@ -346,4 +346,44 @@ def test_datasets_with_extra_fields(test_client):
     with test_client.application.app_context():
         DataSet.query.filter(DataSet.id.in_(dataset_ids)).delete(synchronize_session=False)
         DSMetaData.query.filter(DSMetaData.id.in_(metadata_ids)).delete(synchronize_session=False)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+
+def test_tokenize_normalizes_accents_and_punctuation():
+    from app.modules.explore.services import tokenize
+
+    assert tokenize("Estadísticas: Pau GASOL, 2008-09!") == ["estadisticas", "pau", "gasol", "2008", "09"]
+    assert tokenize(None) == []
+
+
+def test_search_index_matches_author_by_prefix(test_client, test_datasets_with_dates):
+    from app.modules.dataset.models import Author
+
+    with test_client.application.app_context():
+        dataset = DataSet.query.get(test_client.test_ds_ids[0])
+        author = Author(name="Kareem Abdul-Jabbar", ds_meta_data_id=dataset.ds_meta_data_id)
+        db.session.add(author)
+        db.session.commit()
+
+        result = ExploreService().filter(query="abdul")
+        assert [ds.id for ds in result] == [dataset.id]
+
+        result = ExploreService().filter(query="kar")
+        assert dataset.id in [ds.id for ds in result]
+
+        db.session.delete(author)
+        db.session.commit()
+
+        assert ExploreService().filter(query="abdul") == []
+
+
+def test_search_index_follows_title_changes(test_client, test_datasets_with_dates):
+    with test_client.application.app_context():
+        dataset = DataSet.query.get(test_client.test_ds_ids[1])
+        assert ExploreService().filter(query="championship") == []
+
+        dataset.ds_meta_data.title = "Championship Dataset"
+        db.session.commit()
+
+        result = ExploreService().filter(query="championship")
+        assert [ds.id for ds in result] == [dataset.id]
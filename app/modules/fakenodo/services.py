@@ -2,6 +2,7 @@ from app.modules.fakenodo.repositories import FakenodoRepository
 from core.services.BaseService import BaseService
 from app.modules.dataset.models import DataSet
 from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.services import HubfileBlobService
 from core.configuration.configuration import uploads_folder_name
 from flask_login import current_user
 import os
@@ -62,6 +63,10 @@ class FakenodoService(BaseService):
         data = {"name": csv_filename}
         user_id = current_user.id if user is None else user.id
         file_path = os.path.join(uploads_folder_name(), f"user_{str(user_id)}", f"dataset_{dataset.id}/", csv_filename)
+        hubfile = next((hubfile for hubfile in feature_model.files if hubfile.name == csv_filename), None)
+        if hubfile is not None:
+            # Falls back to the blob store when the dataset folder does not have the file
+            file_path = HubfileBlobService().resolve(file_path, hubfile.checksum)
         files = {"file": open(file_path, "rb")}
 
         response = {
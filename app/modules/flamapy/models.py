@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from app import db
+
+
+class CsvValidationResult(db.Model):
+    """
+    Validation report of a file content, identified by its checksum, as computed by a version of the validator.
+    """
+
+    __tablename__ = "csv_validation_result"
+
+    checksum = db.Column(db.String(120), primary_key=True)
+    validator_version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    valid = db.Column(db.Boolean, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    error_count = db.Column(db.Integer, nullable=False)
+    report = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CsvValidationResult {self.checksum} v{self.validator_version} valid={self.valid}>"
@@ -1,7 +1,80 @@
-from app.modules.flamapy.models import Flamapy
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.modules.flamapy.models import CsvValidationResult
 from core.repositories.BaseRepository import BaseRepository
 
+# Checksums looked up per query
+LOOKUP_BATCH_SIZE = 1000
+
 
-class FlamapyRepository(BaseRepository):
+class CsvValidationResultRepository(BaseRepository):
     def __init__(self):
-        super().__init__(Flamapy)
+        super().__init__(CsvValidationResult)
+
+    def get_result(self, checksum: str, validator_version: int) -> Optional[CsvValidationResult]:
+        return self.session.get(self.model, (checksum, validator_version))
+
+    def get_reports(self, checksums, validator_version: int) -> dict[str, dict]:
+        """
+        {checksum: report} of the given checksums with a result of validator_version.
+        """
+        checksums, reports = list(checksums), {}
+        for start in range(0, len(checksums), LOOKUP_BATCH_SIZE):
+            reports.update(
+                self.session.execute(
+                    select(self.model.checksum, self.model.report).where(
+                        self.model.checksum.in_(checksums[start:start + LOOKUP_BATCH_SIZE]),
+                        self.model.validator_version == validator_version,
+                    )
+                ).all()
+            )
+        return reports
+
+    def save_result(self, checksum: str, validator_version: int, report: dict):
+        self.save_results({checksum: report}, validator_version)
+        self.session.commit()
+
+    def save_results(self, reports: dict[str, dict], validator_version: int, connection=None):
+        """
+        Saves {checksum: report}, replacing the results of validator_version already saved for those checksums.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        rows = [
+            {
+                "checksum": checksum,
+                "validator_version": validator_version,
+                "valid": report["valid"],
+                "row_count": report["row_count"],
+                "error_count": report["error_count"],
+                "report": report,
+            }
+            for checksum, report in reports.items()
+        ]
+        if not rows:
+            return
+        updated = ("valid", "row_count", "error_count", "report")
+
+        if connection.dialect.name == "mysql":
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update({name: statement.inserted[name] for name in updated})
+            connection.execute(statement, rows)
+            return
+
+        if connection.dialect.name in ("sqlite", "postgresql"):
+            statement = (sqlite_insert if connection.dialect.name == "sqlite" else postgresql_insert)(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.checksum, table.c.validator_version],
+                set_={name: statement.excluded[name] for name in updated},
+            )
+            connection.execute(statement, rows)
+            return
+
+        # Backends without upserts
+        for row in rows:
+            self.session.merge(self.model(**row))
@@ -1,7 +1,167 @@
-from app.modules.flamapy.repositories import FlamapyRepository
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.modules.flamapy.repositories import CsvValidationResultRepository
+from app.modules.flamapy.validation import VALIDATOR_VERSION, ColumnarCsvValidator, ValidationReport, validate_file
+from app.modules.hubfile.models import Hubfile
+from app.modules.hubfile.services import HubfileService, is_digest
 from core.services.BaseService import BaseService
 
 
-class FlamapyService(BaseService):
+class CsvValidationService(BaseService):
+    """
+    Validates the CSV files of the hub. Files do not change once uploaded, so the report of each content is kept
+    by checksum and validator version: a file is only read again when its content or the rules change.
+    """
+
     def __init__(self):
-        super().__init__(FlamapyRepository())
+        super().__init__(CsvValidationResultRepository())
+
+    def get_report(self, hubfile: Hubfile) -> ValidationReport:
+        if is_digest(hubfile.checksum):
+            result = self.repository.get_result(hubfile.checksum, VALIDATOR_VERSION)
+            if result is not None:
+                return ValidationReport.from_dict(result.report)
+
+        with open(hubfile.get_path(), "rb") as csv_file:
+            report = ColumnarCsvValidator().validate(csv_file)
+
+        # Files seeded without a real checksum may share it with a different content
+        if is_digest(hubfile.checksum):
+            self.repository.save_result(hubfile.checksum, VALIDATOR_VERSION, report.to_dict())
+        return report
+
+
+class CsvBulkValidationService:
+    """
+    Validates every file of the hub with a pool of processes, each content once, and writes a line of JSON per
+    file to a report. The files already in the report with a result of the current validator are skipped, so an
+    interrupted run resumes where it stopped, and the contents with a result of the current validator are not
+    read again unless `force` is set. The results are saved for check_csv `batch_size` at a time, and the lines
+    of a batch are only written once it is saved, so a resumed run never skips a file whose result was lost.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 500, force: bool = False):
+        self.validation_service = CsvValidationService()
+        self.hubfile_service = HubfileService()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.force = force
+
+    def validate_all(self, output_path, progress=None) -> dict:
+        """
+        Validates the files not in the report at output_path yet. `progress(result)` is called with the running
+        totals after each content. Returns the totals: files (reported by this run), skipped (already reported),
+        cached, validated and bytes (contents read), invalid, missing and seconds.
+        """
+        start = time.perf_counter()
+        reported = get_reported_file_ids(output_path)
+        locations = [location for location in self.hubfile_service.get_locations() if location["id"] not in reported]
+        result = {"files": 0, "skipped": len(reported), "cached": 0, "validated": 0, "bytes": 0, "invalid": 0}
+        result.update({"missing": 0, "seconds": 0.0, "total_files": len(locations)})
+
+        # Files with the same content are validated once, unless their checksum is not a real one
+        contents = {}
+        for location in locations:
+            key = location["checksum"] if is_digest(location["checksum"]) else location["path"]
+            contents.setdefault(key, []).append(location)
+
+        repository = self.validation_service.repository
+        cached = {} if self.force else repository.get_reports(
+            [key for key in contents if is_digest(key)], VALIDATOR_VERSION
+        )
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            lines = []
+
+            def report(files, content_report, error, is_cached):
+                for location in files:
+                    lines.append(json.dumps(get_report_line(location, content_report, error, is_cached)) + "\n")
+                result["files"] += len(files)
+                result["invalid"] += len(files) if content_report and not content_report["valid"] else 0
+                result["missing"] += len(files) if error else 0
+                result["seconds"] = time.perf_counter() - start
+                if progress:
+                    progress(result)
+
+            def write_lines():
+                output.writelines(lines)
+                output.flush()
+                lines.clear()
+
+            for key, content_report in cached.items():
+                result["cached"] += 1
+                report(contents.pop(key), content_report, None, True)
+            write_lines()
+
+            keys = list(contents)
+            paths = [contents[key][0]["path"] for key in keys]
+            pending = {}
+            with ProcessPoolExecutor(self.workers) as executor:
+                chunksize = max(1, min(64, len(paths) // (self.workers * 4)))
+                for key, (content_report, error) in zip(keys, executor.map(validate_file, paths, chunksize=chunksize)):
+                    if content_report is not None:
+                        result["validated"] += 1
+                        result["bytes"] += contents[key][0]["size"]
+                        if is_digest(key):
+                            pending[key] = content_report
+                    report(contents[key], content_report, error, False)
+                    if len(pending) >= self.batch_size:
+                        self._save(pending)
+                        pending = {}
+                    if not pending:
+                        write_lines()
+            self._save(pending)
+            write_lines()
+
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def _save(self, reports):
+        if reports:
+            self.validation_service.repository.save_results(reports, VALIDATOR_VERSION)
+            self.validation_service.repository.session.commit()
+
+
+def get_report_line(location, report, error, cached) -> dict:
+    line = {"file_id": location["id"], "name": location["name"], "checksum": location["checksum"]}
+    if error is not None:
+        line["error"] = error
+        return line
+    line.update(
+        {
+            "valid": report["valid"],
+            "row_count": report["row_count"],
+            "error_count": report["error_count"],
+            "rules": {rule["rule"]: rule["count"] for rule in report["rules"]},
+            "validator_version": VALIDATOR_VERSION,
+            "cached": cached,
+        }
+    )
+    return line
+
+
+def get_reported_file_ids(output_path) -> set[int]:
+    """
+    The files already in the report at output_path with a result of the current validator. Lines of other
+    versions and errors are left for the file to be validated again, and its last line is the one that counts. A
+    last line cut by an interruption is removed.
+    """
+    try:
+        with open(output_path, "rb+") as output:
+            content = output.read()
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                output.truncate(complete)
+    except FileNotFoundError:
+        return set()
+    reported = set()
+    for line in content[:complete].splitlines():
+        if line.strip():
+            line = json.loads(line)
+            if line.get("validator_version") == VALIDATOR_VERSION:
+                reported.add(line["file_id"])
+    return reported
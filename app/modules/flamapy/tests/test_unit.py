@@ -1,11 +1,30 @@
+import csv
+import hashlib
+import io
+import json
+
 import pytest
 from app import create_app, db
+from app.modules.auth.models import User
+from app.modules.dataset.services import DataSetImportService
 from app.modules.flamapy import routes as routes_module
+from app.modules.flamapy import services as services_module
+from app.modules.flamapy.models import CsvValidationResult
+from app.modules.flamapy.services import CsvBulkValidationService
+from app.modules.flamapy.validation import (
+    MAX_ERRORS_PER_RULE,
+    VALIDATOR_VERSION,
+    ColumnarCsvValidator,
+    CsvValidator,
+    ValidationReport,
+)
 
 
 class FakeHubfile:
     def __init__(self, path):
         self._path = path
+        with open(path, "rb") as f:
+            self.checksum = hashlib.md5(f.read()).hexdigest()
 
     def get_path(self):
         return self._path
@@ -196,3 +215,155 @@ def test_check_csv_allows_additional_columns(test_client, tmp_path, monkeypatch)
     assert resp.status_code == 200
     data = resp.get_json()
     assert data.get("message") == "Valid CSV file"
+
+
+def test_check_csv_caps_errors_per_rule_and_reports_counts(test_client, tmp_path, monkeypatch):
+    csv_path = tmp_path / "many_errors.csv"
+    rows = "".join(f"Player {i},tall,28,81,20.8,11.7,1.8\n" for i in range(50))
+    csv_path.write_text(
+        "Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n" + rows,
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(routes_module, "HubfileService", lambda: FakeService(str(csv_path)))
+
+    resp = test_client.get("/flamapy/check_csv/11")
+    assert resp.status_code == 400
+    data = resp.get_json()
+    assert len(data["errors"]) == MAX_ERRORS_PER_RULE
+    report = data["report"]
+    assert report["valid"] is False
+    assert report["row_count"] == 50
+    assert report["error_count"] == 50
+    assert report["truncated"] is True
+    assert report["rules"][0]["rule"] == "height"
+    assert report["rules"][0]["count"] == 50
+    assert report["rules"][0]["examples"][0] == {
+        "line": 2,
+        "column": "Height",
+        "value": "tall",
+        "message": "Line 2: Height 'tall' does not match pattern e.g. '1m95'",
+    }
+
+
+def test_columnar_validator_matches_row_validator_across_chunks():
+    lines = ["Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game"]
+    cells = [",2m06,28,81,20.8,11.7,1.8", "A,2m6,28,81,20.8,11.7,1.8", "B,2m06,-1,81,20.8,11.7,1.8",
+             "C,2m06,,8.1,1e3,-.5,1.", "D,2m06,28", "", "É,12m345,028,81,-0,5.,x", "F,2m06,28,81,20.8,11.7,1.8,extra"]
+    lines += cells * 5
+    content = ("\n".join(lines) + "\n").encode("utf-8")
+
+    expected = CsvValidator(ValidationReport(max_errors_per_rule=float("inf")))
+    rows = csv.reader(io.StringIO(content.decode("utf-8")))
+    expected.check_header(next(rows))
+    for line_no, row in enumerate(rows, start=2):
+        expected.check_row(line_no, row)
+
+    for chunk_size in (7, 64, 1024):
+        validator = ColumnarCsvValidator(chunk_size=chunk_size, max_errors_per_rule=float("inf"))
+        report = validator.validate(io.BytesIO(content))
+        assert report.messages() == expected.report.messages()
+        assert report.row_count == expected.report.row_count
+
+
+def test_columnar_validator_falls_back_to_csv_module_for_quoted_fields():
+    content = (
+        "Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+        'Ok,2m06,28,81,20.8,11.7,1.8\n"Doe, John",2m06,28,81,20.8,11.7,1.8\n"",1m99,x,81,1,1,1\n'
+    ).encode("utf-8")
+
+    report = ColumnarCsvValidator(chunk_size=16).validate(io.BytesIO(content))
+    assert report.row_count == 3
+    assert report.messages() == ["Line 4: Name is empty", "Line 4: Age 'x' is not a valid integer"]
+
+
+def test_check_csv_reuses_the_result_of_the_same_content(test_client, tmp_path, monkeypatch):
+    csv_path = tmp_path / "cached.csv"
+    csv_path.write_text(
+        "Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+        "Cached Player,2m01,27,70,9.9,1.1,2.2\n"
+        "Cached Player,tall,27,70,9.9,1.1,2.2\n",
+        encoding="utf-8",
+    )
+    hubfile = FakeHubfile(str(csv_path))
+    service = FakeService(str(csv_path))
+    service.get_by_id = lambda file_id: hubfile
+    monkeypatch.setattr(routes_module, "HubfileService", lambda: service)
+
+    first = test_client.get("/flamapy/check_csv/12")
+    assert first.status_code == 400
+
+    # The file is not read again for the same checksum and validator version
+    csv_path.unlink()
+    second = test_client.get("/flamapy/check_csv/12")
+    assert second.status_code == 400
+    assert second.get_json() == first.get_json()
+    assert db.session.get(CsvValidationResult, (hubfile.checksum, VALIDATOR_VERSION)).error_count == 1
+
+    monkeypatch.setattr(services_module, "VALIDATOR_VERSION", VALIDATOR_VERSION + 1)
+    assert test_client.get("/flamapy/check_csv/12").status_code == 500
+
+
+def test_check_csv_validates_again_when_the_content_changes(test_client, tmp_path, monkeypatch):
+    csv_path = tmp_path / "changed.csv"
+    header = "Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+    csv_path.write_text(header + "Changed Player,2m01,27,70,9.9,1.1,x\n", encoding="utf-8")
+    monkeypatch.setattr(routes_module, "HubfileService", lambda: FakeService(str(csv_path)))
+    assert test_client.get("/flamapy/check_csv/13").status_code == 400
+
+    csv_path.write_text(header + "Changed Player,2m01,27,70,9.9,1.1,2.2\n", encoding="utf-8")
+    resp = test_client.get("/flamapy/check_csv/13")
+    assert resp.status_code == 200
+    assert resp.get_json()["report"]["row_count"] == 1
+
+
+def test_validate_all_reports_every_file_and_resumes(test_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    header = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+    roster = header + b"Duncan,2m11,21,82,21.1,2.7,11.9\n"
+    catalog = tmp_path / "catalog"
+    (catalog / "spurs").mkdir(parents=True)
+    (catalog / "bulls").mkdir()
+    (catalog / "spurs" / "roster.csv").write_bytes(roster)
+    (catalog / "bulls" / "roster.csv").write_bytes(roster)
+    (catalog / "bulls" / "playoffs.csv").write_bytes(header + b"Kerr,tall,31,19,x,1.2,1.1\n")
+
+    user = User(email="validator@example.com", password="pass1234")
+    db.session.add(user)
+    db.session.commit()
+    assert DataSetImportService(workers=1).import_tree(str(catalog), user)["datasets"] == 2
+
+    output = tmp_path / "report.ndjson"
+    result = CsvBulkValidationService(workers=2, batch_size=1).validate_all(str(output))
+    assert (result["files"], result["validated"], result["cached"], result["invalid"]) == (3, 2, 0, 1)
+    assert result["bytes"] == len(roster) + len(header) + 26
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    playoffs = next(line for line in lines if line["name"] == "playoffs.csv")
+    assert playoffs["rules"] == {"height": 1, "points_per_game": 1}
+    assert sum(line["valid"] for line in lines) == 2
+    assert db.session.get(CsvValidationResult, (hashlib.md5(roster).hexdigest(), VALIDATOR_VERSION)).valid
+
+    # An interrupted run left the last file with half a line
+    kept = output.read_text().splitlines(keepends=True)[:2]
+    output.write_text("".join(kept) + '{"file_id": ')
+    result = CsvBulkValidationService(workers=2).validate_all(str(output))
+    assert (result["skipped"], result["files"], result["validated"], result["cached"]) == (2, 1, 0, 1)
+    assert sorted(json.loads(line)["file_id"] for line in output.read_text().splitlines()) == sorted(
+        line["file_id"] for line in lines
+    )
+
+    # Lines of another validator version do not count as done
+    monkeypatch.setattr(services_module, "VALIDATOR_VERSION", VALIDATOR_VERSION + 1)
+    result = CsvBulkValidationService(workers=2).validate_all(str(output))
+    assert (result["skipped"], result["files"], result["validated"], result["cached"]) == (0, 3, 2, 0)
+
+    # Lines are written once the results of their batch are saved, never before
+    def interrupted(self, reports):
+        if reports:
+            raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(services_module, "VALIDATOR_VERSION", VALIDATOR_VERSION + 2)
+    monkeypatch.setattr(CsvBulkValidationService, "_save", interrupted)
+    with pytest.raises(RuntimeError):
+        CsvBulkValidationService(workers=1, batch_size=1).validate_all(str(output))
+    assert services_module.get_reported_file_ids(str(output)) == set()
@@ -0,0 +1,593 @@
+"""
+Validation of the players CSV files. `ColumnarCsvValidator` reads a file in chunks and checks each column of a
+chunk at once with NumPy masks over its bytes: only the cells the masks cannot vouch for (a negative number, a
+padded value, an error...) are checked one by one, with the same rules and messages as the row by row
+`CsvValidator`. The errors go to a `ValidationReport`, which counts all of them but keeps the first few of each
+rule only.
+"""
+import csv
+import io
+import re
+from collections import Counter
+
+import numpy as np
+
+EXPECTED_CSV_HEADER = [
+    "Name",
+    "Height",
+    "Age",
+    "Games",
+    "Points per game",
+    "Assists per game",
+    "Rebounds per game",
+]
+
+HEIGHT_RE = re.compile(r"^\d+m\d{2}$")
+
+# Bumped whenever a rule changes, so results computed by an older validator are not reused
+VALIDATOR_VERSION = 2
+
+VALIDATION_CHUNK_SIZE = 4 * 1024 * 1024
+
+MAX_ERRORS_PER_RULE = 20
+
+# Longest value the column masks look at, longer ones are checked one by one
+FIELD_WIDTH = 8
+
+NEWLINE, CARRIAGE_RETURN, COMMA, MINUS, DOT, LETTER_M = (ord(char) for char in "\n\r,-.m")
+
+
+def name_error(value):
+    return None if value else "Name is empty"
+
+
+def height_error(value):
+    return None if HEIGHT_RE.match(value) else f"Height '{value}' does not match pattern e.g. '1m95'"
+
+
+def integer_error(field_name, allow_empty=False):
+    def check(value):
+        if allow_empty and value == "":
+            return None
+        try:
+            int(value)
+        except Exception:
+            return f"{field_name} '{value}' is not a valid integer"
+        return None
+
+    return check
+
+
+def number_error(field_name):
+    def check(value):
+        try:
+            float(value)
+        except Exception:
+            return f"{field_name} '{value}' is not a valid number"
+        return None
+
+    return check
+
+
+# (rule, check) of each expected column, in order. A check returns the error of a stripped value, or None.
+COLUMN_CHECKS = [
+    ("name", name_error),
+    ("height", height_error),
+    ("age", integer_error("Age", allow_empty=True)),
+    ("games", integer_error("Games")),
+    ("points_per_game", number_error("Points per game")),
+    ("assists_per_game", number_error("Assists per game")),
+    ("rebounds_per_game", number_error("Rebounds per game")),
+]
+
+
+class ValidationReport:
+    """
+    Errors of a validated file, aggregated by rule: every error is counted but only the first
+    `max_errors_per_rule` of each rule are kept.
+    """
+
+    def __init__(self, max_errors_per_rule=MAX_ERRORS_PER_RULE):
+        self.max_errors_per_rule = max_errors_per_rule
+        self.counts = Counter()
+        self.examples = {}
+        self.row_count = 0
+
+    @property
+    def error_count(self):
+        return sum(self.counts.values())
+
+    @property
+    def valid(self):
+        return not self.counts
+
+    def add(self, rule, message, line=None, column=None, value=None):
+        self.counts[rule] += 1
+        examples = self.examples.setdefault(rule, [])
+        if len(examples) < self.max_errors_per_rule:
+            examples.append({"line": line, "column": column, "value": value, "message": message})
+
+    def messages(self):
+        """
+        The kept errors, in file order.
+        """
+        examples = [example for rule_examples in self.examples.values() for example in rule_examples]
+        columns = {column: index for index, column in enumerate(EXPECTED_CSV_HEADER)}
+        examples.sort(key=lambda example: (example["line"] or 0, columns.get(example["column"], -1)))
+        return [example["message"] for example in examples]
+
+    @classmethod
+    def from_dict(cls, data, max_errors_per_rule=MAX_ERRORS_PER_RULE):
+        """
+        The report to_dict returned.
+        """
+        report = cls(max_errors_per_rule)
+        report.row_count = data["row_count"]
+        for rule in data["rules"]:
+            report.counts[rule["rule"]] = rule["count"]
+            report.examples[rule["rule"]] = list(rule["examples"])
+        return report
+
+    def to_dict(self):
+        return {
+            "valid": self.valid,
+            "row_count": self.row_count,
+            "error_count": self.error_count,
+            "truncated": any(count > len(self.examples[rule]) for rule, count in self.counts.items()),
+            "rules": [
+                {"rule": rule, "count": count, "examples": self.examples[rule]} for rule, count in self.counts.items()
+            ],
+        }
+
+
+class CsvValidator:
+    """
+    Checks a players CSV one row at a time. Used by ColumnarCsvValidator for the files it cannot split by
+    itself, such as those with quoted fields. The errors go to `report`, which also counts the non blank data rows.
+    """
+
+    def __init__(self, report=None):
+        self.report = report if report is not None else ValidationReport()
+
+    @property
+    def errors(self):
+        return self.report.messages()
+
+    @property
+    def row_count(self):
+        return self.report.row_count
+
+    def check_header(self, header):
+        header = [h.strip() for h in header]
+        if len(header) < len(EXPECTED_CSV_HEADER) or header[: len(EXPECTED_CSV_HEADER)] != EXPECTED_CSV_HEADER:
+            self.report.add(
+                "header", f"Header mismatch. Expected: {', '.join(EXPECTED_CSV_HEADER)}. Found: {', '.join(header)}"
+            )
+
+    def check_row(self, line_no, row):
+        if not any(cell.strip() for cell in row):
+            return
+        self.report.row_count += 1
+
+        if len(row) < len(EXPECTED_CSV_HEADER):
+            self.report.add(
+                "columns", f"Line {line_no}: expected {len(EXPECTED_CSV_HEADER)} columns, found {len(row)}", line_no
+            )
+            return
+
+        for column, (rule, check), cell in zip(EXPECTED_CSV_HEADER, COLUMN_CHECKS, row):
+            self.check_cell(rule, check, line_no, column, cell.strip())
+
+    def check_cell(self, rule, check, line_no, column, value):
+        error = check(value)
+        if error:
+            self.report.add(rule, f"Line {line_no}: {error}", line_no, column, value)
+        return error
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    Reads `prefix` and then the rest of `source`.
+    """
+
+    def __init__(self, prefix, source):
+        self.prefix = prefix
+        self.source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            chunk, self.prefix = self.prefix[: len(buffer)], self.prefix[len(buffer):]
+        else:
+            chunk = self.source.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+
+def is_text(characters):
+    """
+    ASCII bytes other than blanks and commas: a cell with one of them is not empty once stripped.
+    """
+    return (characters > 32) & (characters < 0x80) & (characters != COMMA)
+
+
+# Classes of the bytes a strict check looks at, one bit each
+DIGIT_CLASS, DOT_CLASS, MINUS_CLASS, OTHER_CLASS, METER_CLASS = 1, 2, 4, 8, 16
+
+BYTE_CLASSES = np.full(256, OTHER_CLASS, dtype=np.uint8)
+BYTE_CLASSES[ord("0"):ord("9") + 1] = DIGIT_CLASS
+BYTE_CLASSES[DOT], BYTE_CLASSES[MINUS], BYTE_CLASSES[LETTER_M] = DOT_CLASS, MINUS_CLASS, METER_CLASS
+
+
+def in_every_byte(byte_class):
+    return np.uint64(int.from_bytes(bytes([byte_class]) * FIELD_WIDTH, "little"))
+
+
+def get_words(values):
+    """
+    For every offset of the uint8 array values, the FIELD_WIDTH values starting there packed in an integer, the
+    first one in the lowest bits. Values past the end of the array are 0.
+    """
+    padded = np.concatenate((values, np.zeros(FIELD_WIDTH, dtype=np.uint8)))
+    return np.ndarray((len(values),), dtype="<u8", buffer=padded, strides=(1,))
+
+
+def get_class_words(buffer):
+    """
+    For every offset of buffer, the classes of the FIELD_WIDTH bytes starting there. Bytes past the end of buffer
+    have no class.
+    """
+    return get_words(BYTE_CLASSES[buffer])
+
+
+def get_field_words(words, starts, lengths):
+    """
+    The words of the first FIELD_WIDTH bytes of each field, without the bytes after the field.
+    """
+    shifts = np.minimum(lengths, FIELD_WIDTH - 1).astype(np.uint64) * np.uint64(8)
+    masks = np.where(lengths >= FIELD_WIDTH, ~np.uint64(0), (np.uint64(1) << shifts) - np.uint64(1))
+    return words[starts] & masks
+
+
+def get_class_union(words):
+    """
+    The classes found in any byte of each word.
+    """
+    words = words | (words >> np.uint64(32))
+    words = words | (words >> np.uint64(16))
+    words = words | (words >> np.uint64(8))
+    return words & np.uint64(0xFF)
+
+
+def at_most_one_bit(words):
+    return (words & (words - np.uint64(1))) == 0
+
+
+# Strict forms of the column checks, over the class words of the fields: a field they accept is valid
+def strict_name(buffer, words, starts, lengths):
+    return (lengths > 0) & is_text(buffer[np.minimum(starts, len(buffer) - 1)])
+
+
+def strict_height(buffer, words, starts, lengths):
+    meters = words & in_every_byte(METER_CLASS)
+    meters_shift = np.maximum(lengths - 3, 0).astype(np.uint64) * np.uint64(8)
+    return (
+        (lengths >= 4)
+        & (lengths <= FIELD_WIDTH)
+        & (get_class_union(words) == DIGIT_CLASS | METER_CLASS)
+        & at_most_one_bit(meters)
+        & ((words >> meters_shift) & np.uint64(0xFF) == METER_CLASS)
+    )
+
+
+def strict_integer(buffer, words, starts, lengths):
+    return (lengths > 0) & (lengths <= FIELD_WIDTH) & (get_class_union(words) == DIGIT_CLASS)
+
+
+def strict_optional_integer(buffer, words, starts, lengths):
+    return (lengths == 0) | strict_integer(buffer, words, starts, lengths)
+
+
+def strict_number(buffer, words, starts, lengths):
+    classes = get_class_union(words)
+    # A minus sign anywhere but in the first byte
+    inner_minus = words & (in_every_byte(MINUS_CLASS) << np.uint64(8))
+    return (
+        (lengths <= FIELD_WIDTH)
+        & (classes & DIGIT_CLASS > 0)
+        & (classes & ~np.uint64(DIGIT_CLASS | DOT_CLASS | MINUS_CLASS) == 0)
+        & at_most_one_bit(words & in_every_byte(DOT_CLASS))
+        & (inner_minus == 0)
+    )
+
+
+STRICT_CHECKS = [
+    strict_name,
+    strict_height,
+    strict_optional_integer,
+    strict_integer,
+    strict_number,
+    strict_number,
+    strict_number,
+]
+
+
+def parse_height(value):
+    """
+    Centimeters of a valid height, 2m14 being 214.
+    """
+    return int(value[:-3]) * 100 + int(value[-2:])
+
+
+# Parsers of the valid values of the numeric columns, which ColumnarCsvValidator collects when asked to
+NUMERIC_COLUMNS = {
+    "Height": parse_height,
+    "Age": int,
+    "Games": int,
+    "Points per game": float,
+    "Assists per game": float,
+    "Rebounds per game": float,
+}
+
+
+POWERS_OF_TEN = 10 ** np.arange(FIELD_WIDTH, dtype=np.int64)
+
+
+def parse_value(column, value):
+    try:
+        return float(NUMERIC_COLUMNS[column](value))
+    except OverflowError:
+        return np.nan
+
+
+def parse_strict_fields(fields, classes, lengths, height=False):
+    """
+    Values of non empty fields accepted by the strict check of a numeric column, given the words of their bytes
+    and of their classes. The fields are aligned to the end of the word and every byte but the digits becomes a
+    0, so the digits are read as an 8 digit integer, two, four and then eight digits at a time, where the dot (or
+    the m of a height) adds a 0 that is taken out. Divided by the power of ten of its decimals, the integer
+    rounds as float() does since both are exact. A height is its integer in centimeters.
+    """
+    shifts = (FIELD_WIDTH - lengths).astype(np.uint64) * np.uint64(8)
+    fields, classes = fields << shifts, classes << shifts
+    digits = (classes & in_every_byte(DIGIT_CLASS)) * np.uint64(0xFF)
+    zeros = in_every_byte(ord("0"))
+    integers = ((fields & digits) | (zeros & ~digits)) - zeros
+    integers = (integers * np.uint64(10) + (integers >> np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    integers = (integers * np.uint64(100) + (integers >> np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    integers = ((integers * np.uint64(10000) + (integers >> np.uint64(32))) & np.uint64(0xFFFFFFFF)).astype(np.int64)
+
+    if height:
+        decimals = np.full(len(integers), 2)
+    else:
+        dots = (classes & in_every_byte(DOT_CLASS)).astype(np.float64)
+        # The dot is a single bit, 8 * position + 1
+        positions = np.log2(np.where(dots > 0, dots, 1)).astype(np.int64) // 8
+        decimals = np.where(dots > 0, FIELD_WIDTH - 1 - positions, -1)
+    has_separator = decimals >= 0
+    decimals = np.maximum(decimals, 0)
+    fractions = integers % POWERS_OF_TEN[decimals]
+    integers = np.where(has_separator, (integers - fractions) // 10 + fractions, integers)
+    if height:
+        return integers.astype(np.float64)
+
+    values = integers / POWERS_OF_TEN[decimals]
+    negative = (classes & in_every_byte(MINUS_CLASS)) > 0
+    return np.where(negative, -values, values)
+
+
+class ColumnarCsvValidator:
+    """
+    Validates a players CSV read from a binary stream, `chunk_size` bytes at a time. The lines of a chunk are
+    split into fields with NumPy, and each column is checked against a strict form of its rule (digits only for
+    an integer, digits with a dot and a leading minus for a number...), which only accepts values the rule
+    accepts too. The few cells left are checked with the rule itself. `columns` is the stripped header.
+
+    With `collect_values`, the values of the numeric columns are parsed along the way, the fields the strict
+    checks accept all at once, and get_values returns them. get_names returns the names.
+    """
+
+    def __init__(self, chunk_size=VALIDATION_CHUNK_SIZE, max_errors_per_rule=MAX_ERRORS_PER_RULE, collect_values=False):
+        self.chunk_size = chunk_size
+        self.report = ValidationReport(max_errors_per_rule)
+        self.row_validator = CsvValidator(self.report)
+        self.columns = []
+        self.values = {column: [] for column in NUMERIC_COLUMNS} if collect_values else None
+        self.names = [] if collect_values else None
+
+    def validate(self, source) -> ValidationReport:
+        try:
+            self._validate(source)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            self.report.add("encoding", f"File could not be read as CSV: {exc}")
+        return self.report
+
+    def get_values(self) -> dict:
+        """
+        {column: float array} of the numeric columns, with a value per non blank data row, NaN where it is empty
+        or invalid. Heights are in centimeters.
+        """
+        return {
+            column: np.concatenate(chunks) if chunks else np.zeros(0) for column, chunks in self.values.items()
+        }
+
+    def get_names(self) -> list[str]:
+        """
+        The stripped name of each non blank data row, empty for the rows without every expected column.
+        """
+        return [name for chunk_names in self.names for name in chunk_names]
+
+    def _validate(self, source):
+        data = b""
+        while b"\n" not in data[-self.chunk_size:]:
+            chunk = source.read(self.chunk_size)
+            if not chunk:
+                break
+            data += chunk
+        if not data:
+            self.report.add("empty", "Empty file")
+            return
+
+        header_end = data.find(b"\n") + 1 or len(data)
+        if b'"' in data[:header_end]:
+            # A quoted header may span several lines
+            self._validate_rows(data, source, 1)
+            return
+        header = data[:header_end].decode("utf-8").rstrip("\r\n")
+        self.columns = [column.strip() for column in next(csv.reader([header]), [])]
+        self.row_validator.check_header(next(csv.reader([header]), []))
+
+        line_no, data = 2, data[header_end:]
+        while True:
+            chunk = source.read(self.chunk_size)
+            data += chunk
+            # Whole lines only, but the last line of the file may not end with a line break
+            end = data.rfind(b"\n") + 1 if chunk else len(data)
+            lines, data = data[:end], data[end:]
+            if lines:
+                if not self._is_splittable(lines):
+                    self._validate_rows(lines + data, source, line_no)
+                    return
+                line_no = self._check_chunk(lines if lines.endswith(b"\n") else lines + b"\n", line_no)
+            if not chunk:
+                return
+
+    @staticmethod
+    def _is_splittable(lines):
+        """
+        Whether the lines can be split into fields at every comma: no quotes, no NUL bytes (which the csv module
+        rejects) and no carriage return other than before a line feed.
+        """
+        if b'"' in lines or b"\0" in lines:
+            return False
+        return lines.count(b"\r") == lines.count(b"\r\n")
+
+    def _validate_rows(self, data, source, line_no):
+        text = io.TextIOWrapper(io.BufferedReader(_PrefixedReader(data, source)), encoding="utf-8", newline="")
+        row_values = {column: [] for column in self.values} if self.values is not None else None
+        row_names = []
+        try:
+            rows = csv.reader(text)
+            if line_no == 1:
+                header = next(rows, [])
+                self.columns = [column.strip() for column in header]
+                self.row_validator.check_header(header)
+                line_no = 2
+            for line_no, row in enumerate(rows, start=line_no):
+                self.row_validator.check_row(line_no, row)
+                if row_values is not None and any(cell.strip() for cell in row):
+                    self._collect_row(row, row_values, row_names)
+        finally:
+            if row_values is not None:
+                for column, values in row_values.items():
+                    self.values[column].append(np.array(values, dtype=np.float64))
+                self.names.append(row_names)
+            text.detach().detach()
+
+    @staticmethod
+    def _collect_row(row, row_values, row_names):
+        complete = len(row) >= len(EXPECTED_CSV_HEADER)
+        row_names.append(row[0].strip() if complete else "")
+        for index, (column, (rule, check)) in enumerate(zip(EXPECTED_CSV_HEADER, COLUMN_CHECKS)):
+            if column in row_values:
+                value = row[index].strip() if complete else ""
+                row_values[column].append(parse_value(column, value) if value and not check(value) else np.nan)
+
+    def _check_chunk(self, chunk, first_line_no):
+        """
+        Checks the complete lines of chunk, the first one being line `first_line_no` of the file. Returns the
+        number of the line after the chunk.
+        """
+        buffer = np.frombuffer(chunk, dtype=np.uint8)
+        if (buffer >= 0x80).any():
+            chunk.decode("utf-8")
+
+        ends = np.flatnonzero(buffer == NEWLINE)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        ends = ends - ((buffer[ends - 1] == CARRIAGE_RETURN) & (ends > starts))
+        line_nos = np.arange(first_line_no, first_line_no + len(ends))
+
+        commas = np.flatnonzero(buffer == COMMA)
+        first_commas = np.searchsorted(commas, starts)
+        field_counts = np.searchsorted(commas, ends) - first_commas + 1
+
+        # A line starting with text is not blank, the others are parsed to know
+        has_text = (ends > starts) & is_text(buffer[np.minimum(starts, len(buffer) - 1)])
+        for row in np.flatnonzero(~has_text & (ends > starts)):
+            cells = next(csv.reader([chunk[starts[row]:ends[row]].decode("utf-8")]), [])
+            has_text[row] = any(cell.strip() for cell in cells)
+        self.report.row_count += int(has_text.sum())
+
+        chunk_values = {}
+        if self.values is not None:
+            # Filled below, NaN where there is no valid value
+            chunk_values = {column: np.full(int(has_text.sum()), np.nan) for column in NUMERIC_COLUMNS}
+            for column, values in chunk_values.items():
+                self.values[column].append(values)
+            chunk_names = [""] * int(has_text.sum())
+            self.names.append(chunk_names)
+            # Position of each line among the non blank ones
+            positions = np.cumsum(has_text) - 1
+
+        expected = len(EXPECTED_CSV_HEADER)
+        for row in np.flatnonzero(has_text & (field_counts < expected)):
+            self.report.add(
+                "columns",
+                f"Line {line_nos[row]}: expected {expected} columns, found {field_counts[row]}",
+                int(line_nos[row]),
+            )
+
+        rows = np.flatnonzero(has_text & (field_counts >= expected))
+        if not len(rows):
+            return first_line_no + len(ends)
+
+        # Boundaries of the expected fields of each complete row
+        row_commas = first_commas[rows]
+        field_starts = [starts[rows]] + [commas[row_commas + i] + 1 for i in range(expected - 1)]
+        last_ends = np.where(
+            field_counts[rows] > expected, commas[np.minimum(row_commas + expected - 1, len(commas) - 1)], ends[rows]
+        )
+        field_ends = [commas[row_commas + i] for i in range(expected - 1)] + [last_ends]
+
+        if chunk_values:
+            for position, start, end in zip(positions[rows].tolist(), field_starts[0].tolist(), field_ends[0].tolist()):
+                chunk_names[position] = chunk[start:end].decode("utf-8").strip()
+
+        class_words = get_class_words(buffer)
+        byte_words = get_words(buffer) if chunk_values else None
+        for column, (rule, check), strict_check, column_starts, column_ends in zip(
+            EXPECTED_CSV_HEADER, COLUMN_CHECKS, STRICT_CHECKS, field_starts, field_ends
+        ):
+            lengths = column_ends - column_starts
+            words = get_field_words(class_words, column_starts, lengths)
+            strict = strict_check(buffer, words, column_starts, lengths)
+            values = chunk_values.get(column)
+            if values is not None:
+                parsed = strict & (lengths > 0)
+                values[positions[rows[parsed]]] = parse_strict_fields(
+                    get_field_words(byte_words, column_starts[parsed], lengths[parsed]),
+                    words[parsed],
+                    lengths[parsed],
+                    height=column == "Height",
+                )
+            for index in np.flatnonzero(~strict):
+                value = chunk[column_starts[index]:column_ends[index]].decode("utf-8").strip()
+                error = self.row_validator.check_cell(rule, check, int(line_nos[rows[index]]), column, value)
+                if values is not None and value and not error:
+                    values[positions[rows[index]]] = parse_value(column, value)
+
+        return first_line_no + len(ends)
+
+
+def validate_file(path):
+    """
+    (report as a dict, None) for the file at path, or (None, error) when it cannot be read. Top level so that
+    process pools can run it.
+    """
+    try:
+        with open(path, "rb") as csv_file:
+            return ColumnarCsvValidator().validate(csv_file).to_dict(), None
+    except OSError as exc:
+        return None, str(exc)
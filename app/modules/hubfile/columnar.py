@@ -0,0 +1,198 @@
+"""
+Columnar sidecars of the players CSV files, so analytical reads map typed arrays into memory instead of parsing
+the text again. A sidecar is laid out as
+
+    magic (8 bytes) | header size (uint32) | JSON header | arrays, each starting at a multiple of 64 bytes
+
+The header has the checksum and size of the CSV it was built from, the row count and, for every array, its
+offset, dtype and length. Each non blank data row of the CSV is a row of the sidecar. Names are dictionary
+encoded: a uint32 code per row into the distinct names, stored as UTF-8 bytes with their offsets. Heights (in
+centimeters), ages and games are int32 with INTEGER_NULL for a missing or invalid value, unless a value does not
+fit, and the other numeric columns are float64 with NaN.
+"""
+import json
+import mmap
+import os
+
+import numpy as np
+
+from app.modules.flamapy.validation import NUMERIC_COLUMNS, ColumnarCsvValidator
+
+SIDECAR_MAGIC = b"NBACOL\x00\x01"
+SIDECAR_VERSION = 1
+ALIGNMENT = 64
+
+INTEGER_COLUMNS = ("Height", "Age", "Games")
+INTEGER_NULL = np.iinfo(np.int32).min
+
+
+def get_sidecar_path(sidecar_dir, checksum):
+    return os.path.join(sidecar_dir, f"{checksum}.columns")
+
+
+def read_columns(path):
+    """
+    (names, {column: float array}) of the CSV file at path, one entry per non blank data row.
+    """
+    validator = ColumnarCsvValidator(collect_values=True)
+    with open(path, "rb") as csv_file:
+        validator.validate(csv_file)
+    return validator.get_names(), validator.get_values()
+
+
+def encode_names(names):
+    """
+    (codes, offsets, data): the distinct names, in order of appearance, are data[offsets[i]:offsets[i + 1]].
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(name, len(index)) for name in names), dtype="<u4", count=len(names))
+    encoded = [name.encode("utf-8") for name in index]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(name) for name in encoded], out=offsets[1:])
+    return codes, offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def to_column_array(column, values):
+    """
+    The typed array a numeric column is stored as.
+    """
+    if column in INTEGER_COLUMNS:
+        present = values[~np.isnan(values)]
+        limits = np.iinfo(np.int32)
+        if (present == np.round(present)).all() and ((present > limits.min) & (present <= limits.max)).all():
+            return np.where(np.isnan(values), INTEGER_NULL, values).astype("<i4")
+    return values.astype("<f8")
+
+
+def write_sidecar(sidecar_path, checksum, source_size, names, values):
+    """
+    Writes the sidecar of a CSV with the given names and numeric values, under a temporary name first so
+    readers never see half a sidecar.
+    """
+    codes, offsets, data = encode_names(names)
+    arrays = [("Name", codes), ("Name.offsets", offsets), ("Name.data", data)]
+    arrays += [(column, to_column_array(column, values[column])) for column in NUMERIC_COLUMNS]
+
+    entries, position = [], 0
+    for name, array in arrays:
+        entries.append({"name": name, "dtype": array.dtype.str, "offset": position, "length": len(array)})
+        position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = {
+        "version": SIDECAR_VERSION,
+        "checksum": checksum,
+        "source_size": source_size,
+        "row_count": len(codes),
+        "arrays": entries,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(SIDECAR_MAGIC) + 4 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(sidecar_path) or ".", exist_ok=True)
+    temporary_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as sidecar:
+        sidecar.write(SIDECAR_MAGIC + len(header_bytes).to_bytes(4, "little") + header_bytes)
+        for entry, (_, array) in zip(entries, arrays):
+            sidecar.seek(data_start + entry["offset"])
+            sidecar.write(array.tobytes())
+        sidecar.truncate(data_start + position)
+    os.replace(temporary_path, sidecar_path)
+
+
+def build_sidecar(csv_path, sidecar_path, checksum):
+    """
+    Builds the sidecar of the CSV file at csv_path. Top level so that process pools can run it.
+    """
+    names, values = read_columns(csv_path)
+    write_sidecar(sidecar_path, checksum, os.path.getsize(csv_path), names, values)
+
+
+def try_build_sidecar(csv_path, sidecar_path, checksum):
+    """
+    build_sidecar, returning the error instead of raising it, so one unreadable file does not stop a backfill.
+    """
+    try:
+        build_sidecar(csv_path, sidecar_path, checksum)
+    except (OSError, UnicodeDecodeError) as e:
+        return str(e)
+    return None
+
+
+class ColumnarFile:
+    """
+    A sidecar mapped into memory. Columns are read-only arrays over the mapping, so nothing is copied or parsed
+    until they are used, and the mapping stays open while any of them is alive.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as sidecar:
+            self.mapping = mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping[: len(SIDECAR_MAGIC)] != SIDECAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar sidecar")
+        header_size = int.from_bytes(self.mapping[len(SIDECAR_MAGIC):len(SIDECAR_MAGIC) + 4], "little")
+        header_end = len(SIDECAR_MAGIC) + 4 + header_size
+        self.header = json.loads(self.mapping[len(SIDECAR_MAGIC) + 4:header_end])
+        if self.header.get("version") != SIDECAR_VERSION:
+            raise ValueError(f"{path} has an unknown version")
+        self.data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+        self.arrays = {entry["name"]: entry for entry in self.header["arrays"]}
+        self._dictionary = None
+
+    @property
+    def checksum(self) -> str:
+        return self.header["checksum"]
+
+    @property
+    def source_size(self) -> int:
+        return self.header["source_size"]
+
+    @property
+    def row_count(self) -> int:
+        return self.header["row_count"]
+
+    @property
+    def columns(self) -> list[str]:
+        return ["Name"] + [column for column in NUMERIC_COLUMNS if column in self.arrays]
+
+    def array(self, name) -> np.ndarray:
+        """
+        The stored array, without copying it: the name codes for "Name".
+        """
+        entry = self.arrays[name]
+        return np.frombuffer(
+            self.mapping, dtype=entry["dtype"], count=entry["length"], offset=self.data_start + entry["offset"]
+        )
+
+    def values(self, column) -> np.ndarray:
+        """
+        A numeric column as floats with NaN for missing values, a copy only for the int32 columns.
+        """
+        array = self.array(column)
+        if array.dtype.kind == "i":
+            return np.where(array == INTEGER_NULL, np.nan, array)
+        return array
+
+    def dictionary(self) -> list[str]:
+        """
+        The distinct names, which the codes of the "Name" array point to.
+        """
+        if self._dictionary is None:
+            offsets, data = self.array("Name.offsets"), self.array("Name.data").tobytes()
+            self._dictionary = [
+                data[start:end].decode("utf-8") for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+            ]
+        return self._dictionary
+
+    def names(self, rows=None) -> list[str]:
+        codes = self.array("Name") if rows is None else self.array("Name")[rows]
+        if self._dictionary is not None or len(codes) * 2 >= self.arrays["Name.offsets"]["length"]:
+            dictionary = self.dictionary()
+            return [dictionary[code] for code in codes.tolist()]
+
+        # A few rows of a large dictionary: only their names are decoded
+        distinct, positions = np.unique(codes, return_inverse=True)
+        offsets, base = self.array("Name.offsets"), self.data_start + self.arrays["Name.data"]["offset"]
+        decoded = [
+            self.mapping[base + start:base + end].decode("utf-8")
+            for start, end in zip(offsets[distinct].tolist(), offsets[distinct + 1].tolist())
+        ]
+        return [decoded[position] for position in positions.tolist()]
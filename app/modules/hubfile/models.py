@@ -13,6 +13,8 @@ class Hubfile(db.Model):
     name = db.Column(db.String(120), nullable=False)
     checksum = db.Column(db.String(120), nullable=False)
     size = db.Column(db.Integer, nullable=False)
+    # Non blank data rows, counted when the file was uploaded
+    row_count = db.Column(db.Integer, nullable=True)
     feature_model_id = db.Column(db.Integer, db.ForeignKey("feature_model.id"), nullable=False)
 
     def get_formatted_size(self):
@@ -42,6 +44,7 @@ class Hubfile(db.Model):
             "checksum": self.checksum,
             "size_in_bytes": self.size,
             "size_in_human_format": self.get_formatted_size(),
+            "row_count": self.row_count,
             "url": f'{request.host_url.rstrip("/")}/file/download/{self.id}',
         }
 
@@ -49,6 +52,59 @@ class Hubfile(db.Model):
         return f"File<{self.id}>"
 
 
+class HubfileBlob(db.Model):
+    """
+    A file content stored once in the blob store, shared by every Hubfile with the same checksum.
+    """
+
+    __tablename__ = "file_blob"
+    checksum = db.Column(db.String(120), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    # Hubfiles with this checksum, the blob can be removed once it drops to 0
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"FileBlob<{self.checksum} refs={self.ref_count}>"
+
+
+class HubfileColumnStatistics(db.Model):
+    """
+    Statistics of a numeric column of a file content, shared by every Hubfile with the same checksum. The
+    quantiles and the histogram are packed arrays, see app.modules.hubfile.statistics.
+    """
+
+    __tablename__ = "file_column_statistics"
+    checksum = db.Column(db.String(120), primary_key=True)
+    column_name = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    nulls = db.Column(db.Integer, nullable=False)
+    minimum = db.Column(db.Double, nullable=True)
+    maximum = db.Column(db.Double, nullable=True)
+    mean = db.Column(db.Double, nullable=True)
+    std = db.Column(db.Double, nullable=True)
+    quantiles = db.Column(db.LargeBinary, nullable=False)
+    histogram = db.Column(db.LargeBinary, nullable=False)
+
+    def to_dict(self):
+        from app.modules.hubfile.statistics import format_column_statistics, unpack_histogram, unpack_quantiles
+
+        return format_column_statistics(
+            {
+                "count": self.count,
+                "nulls": self.nulls,
+                "min": self.minimum,
+                "max": self.maximum,
+                "mean": self.mean,
+                "std": self.std,
+                "quantiles": unpack_quantiles(self.quantiles),
+                "histogram": unpack_histogram(self.histogram),
+            }
+        )
+
+    def __repr__(self):
+        return f"FileColumnStatistics<{self.checksum} {self.column_name}>"
+
+
 class HubfileViewRecord(db.Model):
     __tablename__ = "file_view_record"
     id = db.Column(db.Integer, primary_key=True)
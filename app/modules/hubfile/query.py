@@ -0,0 +1,170 @@
+"""
+Player queries over the columnar sidecars of the CSV files: filters such as "Points per game > 25", the columns to
+return and a column to sort by. Filters are evaluated a whole column at a time, and a file whose statistics show
+that no row can pass them is not opened at all. Heights are compared in centimeters, 2m01 being 201, and rows
+with a missing value never pass a filter on that column.
+"""
+import re
+
+import numpy as np
+
+from app.modules.flamapy.validation import NUMERIC_COLUMNS, parse_value
+from app.modules.hubfile.columnar import INTEGER_NULL
+
+QUERY_COLUMNS = ["Name", *NUMERIC_COLUMNS]
+
+NUMERIC_OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "=": np.equal,
+    "!=": np.not_equal,
+}
+# "~" matches the names that contain the value, ignoring case
+NAME_OPERATORS = ("=", "!=", "~")
+
+FILTER_PATTERN = re.compile(r"\s*(.+?)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*")
+
+
+def make_filter(column, operator, value):
+    """
+    (column, operator, value) with the value of a numeric column as a float, or ValueError when it is not valid.
+    """
+    if column not in QUERY_COLUMNS:
+        raise ValueError(f"Unknown column '{column}'")
+    if column == "Name":
+        if operator not in NAME_OPERATORS:
+            raise ValueError(f"Name does not support '{operator}'")
+        return column, operator, str(value)
+    if operator not in NUMERIC_OPERATORS:
+        raise ValueError(f"{column} does not support '{operator}'")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        # Heights may also be written as in the files
+        try:
+            number = parse_value(column, value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column} '{value}' is not a valid number")
+    if np.isnan(number):
+        raise ValueError(f"{column} '{value}' is not a valid number")
+    return column, operator, number
+
+
+def parse_filter(text):
+    """
+    A filter written as "<column> <operator> <value>", such as "Points per game>25" or "Name~jordan".
+    """
+    match = FILTER_PATTERN.fullmatch(text)
+    if match is None:
+        raise ValueError(f"Filter '{text}' is not of the form <column> <operator> <value>")
+    return make_filter(*match.groups())
+
+
+class PlayerQuery:
+    """
+    Filters, written as strings or as (column, operator, value), that a row must all pass, the columns of the rows
+    returned, a column to sort by ("-" first for a descending sort, missing values always last) and the maximum
+    number of rows. Invalid queries raise ValueError.
+    """
+
+    def __init__(self, filters=(), columns=None, sort=None, limit=None):
+        self.filters = [parse_filter(item) if isinstance(item, str) else make_filter(*item) for item in filters]
+        self.columns = list(columns) if columns else list(QUERY_COLUMNS)
+        for column in self.columns:
+            if column not in QUERY_COLUMNS:
+                raise ValueError(f"Unknown column '{column}'")
+
+        self.sort_column, self.descending = None, False
+        if sort:
+            self.descending = sort.startswith("-")
+            self.sort_column = sort[1:] if self.descending else sort
+            if self.sort_column not in QUERY_COLUMNS:
+                raise ValueError(f"Unknown column '{self.sort_column}'")
+
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be greater than 0")
+        self.limit = limit
+
+    @property
+    def numeric_columns(self) -> list[str]:
+        """
+        The numeric columns filtered on, the ones whose statistics can rule files out.
+        """
+        return sorted({column for column, _, _ in self.filters if column != "Name"})
+
+
+def can_match(filters, ranges) -> bool:
+    """
+    Whether a file with the given {column: (minimum, maximum)} of its values may have rows that pass the filters.
+    A column with a None minimum has no values at all, and nothing is known of the columns missing from ranges.
+    """
+    for column, operator, value in filters:
+        if column not in ranges:
+            continue
+        minimum, maximum = ranges[column]
+        if minimum is None:
+            return False
+        if (
+            (operator == "<" and minimum >= value)
+            or (operator == "<=" and minimum > value)
+            or (operator == ">" and maximum <= value)
+            or (operator == ">=" and maximum < value)
+            or (operator == "=" and not minimum <= value <= maximum)
+            or (operator == "!=" and minimum == maximum == value)
+        ):
+            return False
+    return True
+
+
+def get_mask(columnar, filters) -> np.ndarray:
+    """
+    The rows of the ColumnarFile that pass every filter. Name filters are evaluated once per distinct name.
+    """
+    mask = np.ones(columnar.row_count, dtype=bool)
+    for column, operator, value in filters:
+        if column == "Name":
+            dictionary = columnar.dictionary()
+            if operator == "~":
+                value = value.casefold()
+                passing = [value in name.casefold() for name in dictionary]
+            else:
+                passing = [(name == value) == (operator == "=") for name in dictionary]
+            mask &= np.array(passing, dtype=bool)[columnar.array("Name")]
+        else:
+            values = columnar.values(column)
+            mask &= NUMERIC_OPERATORS[operator](values, value)
+            if operator == "!=":
+                mask &= ~np.isnan(values)
+        if not mask.any():
+            break
+    return mask
+
+
+def get_column(columnar, column, rows) -> list:
+    """
+    The values of a column at the given rows, None for missing ones.
+    """
+    if column == "Name":
+        return columnar.names(rows)
+    values = columnar.array(column)[rows]
+    if values.dtype.kind == "i":
+        return [None if value == INTEGER_NULL else value for value in values.tolist()]
+    return [None if value != value else value for value in values.tolist()]
+
+
+def get_sort_keys(columnar, column, rows) -> np.ndarray:
+    if column == "Name":
+        return np.array(columnar.names(rows), dtype=str)
+    return columnar.values(column)[rows]
+
+
+def get_order(keys, descending=False) -> np.ndarray:
+    """
+    The positions of the keys in sorted order, missing values last. Ties keep their order.
+    """
+    if keys.dtype.kind in "UO":
+        keys = np.unique(keys, return_inverse=True)[1].astype(float)
+    missing = np.isnan(keys)
+    return np.lexsort((-keys if descending else keys, missing))
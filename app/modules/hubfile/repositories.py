@@ -1,10 +1,20 @@
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app import db
 from app.modules.auth.models import User
-from app.modules.dataset.models import DataSet
+from app.modules.dataset.models import DataSet, DSMetaData
 from app.modules.featuremodel.models import FeatureModel
-from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
+from app.modules.hubfile.models import (
+    Hubfile,
+    HubfileBlob,
+    HubfileColumnStatistics,
+    HubfileDownloadRecord,
+    HubfileViewRecord,
+)
+from app.modules.hubfile.statistics import pack_histogram, pack_quantiles
 from core.repositories.BaseRepository import BaseRepository
 
 
@@ -25,14 +35,37 @@ class HubfileRepository(BaseRepository):
     def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
         return db.session.query(DataSet).join(FeatureModel).join(Hubfile).filter(Hubfile.id == hubfile.id).first()
 
+    def get_locations(self, published: bool = False):
+        """
+        (id, name, checksum, size, user_id, dataset_id, dataset_doi) of every file, or of the files of published
+        datasets, in a single query.
+        """
+        statement = (
+            select(
+                Hubfile.id,
+                Hubfile.name,
+                Hubfile.checksum,
+                Hubfile.size,
+                DataSet.user_id,
+                DataSet.id,
+                DSMetaData.dataset_doi,
+            )
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .join(DataSet, FeatureModel.data_set_id == DataSet.id)
+            .outerjoin(DSMetaData, DataSet.ds_meta_data_id == DSMetaData.id)
+            .order_by(Hubfile.id)
+        )
+        if published:
+            statement = statement.where(DSMetaData.dataset_doi.isnot(None))
+        return self.session.execute(statement).all()
+
 
 class HubfileViewRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(HubfileViewRecord)
 
     def total_hubfile_views(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
 
 
 class HubfileDownloadRecordRepository(BaseRepository):
@@ -40,5 +73,150 @@ class HubfileDownloadRecordRepository(BaseRepository):
         super().__init__(HubfileDownloadRecord)
 
     def total_hubfile_downloads(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
+
+
+class HubfileBlobRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(HubfileBlob)
+
+    def add_references(self, deltas: dict[str, tuple[int, int]], connection=None):
+        """
+        Adds the reference count deltas, given as {checksum: (delta, size)}, creating the blobs not seen yet.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        rows = [
+            {"checksum": checksum, "size": size, "ref_count": delta}
+            for checksum, (delta, size) in deltas.items()
+            if delta
+        ]
+        if not rows:
+            return
+
+        if connection.dialect.name == "mysql":
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update(ref_count=table.c.ref_count + statement.inserted.ref_count)
+            connection.execute(statement, rows)
+            return
+
+        if connection.dialect.name in ("sqlite", "postgresql"):
+            statement = (sqlite_insert if connection.dialect.name == "sqlite" else postgresql_insert)(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.checksum], set_={"ref_count": table.c.ref_count + statement.excluded.ref_count}
+            )
+            connection.execute(statement, rows)
+            return
+
+        # Backends without upserts
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(table.c.checksum == row["checksum"])
+                .values(ref_count=table.c.ref_count + row["ref_count"])
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table), row)
+
+    def recount(self, connection=None) -> int:
+        """
+        Rebuilds every reference count from the files table. Returns the number of blobs.
+        """
+        connection = connection or self.session.connection()
+        table, files = self.model.__table__, Hubfile.__table__
+        connection.execute(delete(table))
+        connection.execute(
+            insert(table).from_select(
+                ["checksum", "size", "ref_count"],
+                select(files.c.checksum, func.max(files.c.size), func.count()).group_by(files.c.checksum),
+            )
+        )
+        return connection.execute(select(func.count()).select_from(table)).scalar()
+
+    def get_unreferenced(self) -> list[str]:
+        return list(self.session.execute(select(self.model.checksum).where(self.model.ref_count <= 0)).scalars())
+
+    def lock_unreferenced(self, checksum: str) -> bool:
+        """
+        Locks the row of the blob until the end of the transaction and tells whether it is still unreferenced.
+        """
+        statement = (
+            select(self.model.checksum)
+            .where(self.model.checksum == checksum, self.model.ref_count <= 0)
+            .with_for_update()
+        )
+        return self.session.execute(statement).first() is not None
+
+    def exists(self, checksum: str) -> bool:
+        statement = select(self.model.checksum).where(self.model.checksum == checksum)
+        return self.session.execute(statement).first() is not None
+
+    def remove(self, checksums):
+        self.session.execute(
+            delete(self.model).where(self.model.checksum.in_(checksums), self.model.ref_count <= 0)
+        )
+
+
+class HubfileColumnStatisticsRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(HubfileColumnStatistics)
+
+    def get_by_checksum(self, checksum: str) -> list[HubfileColumnStatistics]:
+        return list(self.session.execute(select(self.model).where(self.model.checksum == checksum)).scalars())
+
+    def get_ranges(self, columns: list[str]) -> dict[str, dict[str, tuple]]:
+        """
+        {checksum: {column: (minimum, maximum)}} of the given columns of every content with statistics.
+        """
+        ranges = {}
+        rows = self.session.execute(
+            select(self.model.checksum, self.model.column_name, self.model.minimum, self.model.maximum).where(
+                self.model.column_name.in_(columns)
+            )
+        )
+        for checksum, column, minimum, maximum in rows:
+            ranges.setdefault(checksum, {})[column] = (minimum, maximum)
+        return ranges
+
+    def add_statistics(self, statistics: dict[str, dict[str, dict]], connection=None):
+        """
+        Saves {checksum: {column: statistics}}, leaving the checksums that already have statistics as they are:
+        the same content always has the same ones.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        rows = [
+            {
+                "checksum": checksum,
+                "column_name": column,
+                "count": column_statistics["count"],
+                "nulls": column_statistics["nulls"],
+                "minimum": column_statistics["min"],
+                "maximum": column_statistics["max"],
+                "mean": column_statistics["mean"],
+                "std": column_statistics["std"],
+                "quantiles": pack_quantiles(column_statistics["quantiles"]),
+                "histogram": pack_histogram(column_statistics["histogram"]),
+            }
+            for checksum, columns in statistics.items()
+            for column, column_statistics in columns.items()
+        ]
+        if not rows:
+            return
+
+        if connection.dialect.name == "mysql":
+            connection.execute(insert(table).prefix_with("IGNORE"), rows)
+            return
+
+        if connection.dialect.name in ("sqlite", "postgresql"):
+            statement = (sqlite_insert if connection.dialect.name == "sqlite" else postgresql_insert)(table)
+            connection.execute(statement.on_conflict_do_nothing(), rows)
+            return
+
+        # Backends without upserts
+        existing = set(
+            connection.execute(select(table.c.checksum).where(table.c.checksum.in_(list(statistics)))).scalars()
+        )
+        rows = [row for row in rows if row["checksum"] not in existing]
+        if rows:
+            connection.execute(insert(table), rows)
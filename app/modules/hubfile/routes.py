@@ -1,89 +1,79 @@
+import json
 import os
 import uuid
-from datetime import datetime, timezone
 
-from flask import current_app, jsonify, make_response, request, send_from_directory
-from flask_login import current_user
+from flask import Response, jsonify, make_response, request, stream_with_context
 
-from app import db
 from app.modules.hubfile import hubfile_bp
-from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
-from app.modules.hubfile.services import HubfileDownloadRecordService, HubfileService
+from app.modules.hubfile.services import (
+    PREVIEW_DEFAULT_ROWS,
+    QUERY_DEFAULT_ROWS,
+    QUERY_MAX_ROWS,
+    CsvPreviewService,
+    HubfileDownloadRecordService,
+    HubfileService,
+    HubfileStatisticsService,
+    HubfileViewRecordService,
+    PlayerQueryService,
+)
+from app.modules.hubfile.query import PlayerQuery
+from core.services.FileDeliveryService import FileDeliveryService
 
 
 @hubfile_bp.route("/file/download/<int:file_id>", methods=["GET"])
 def download_file(file_id):
-    file = HubfileService().get_or_404(file_id)
+    hubfile_service = HubfileService()
+    file = hubfile_service.get_or_404(file_id)
     filename = file.name
-
-    directory_path = f"uploads/user_{file.feature_model.data_set.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path)
+    file_path = hubfile_service.get_path_by_hubfile(file)
 
     # Get the cookie from the request or generate a new one if it does not exist
     user_cookie = request.cookies.get("file_download_cookie")
     if not user_cookie:
         user_cookie = str(uuid.uuid4())
 
-    # Check if the download record already exists for this cookie
-    existing_record = HubfileDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None, file_id=file_id, download_cookie=user_cookie
-    ).first()
-
-    if not existing_record:
-        # Record the download in your database
-        HubfileDownloadRecordService().create(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            file_id=file_id,
-            download_date=datetime.now(timezone.utc),
-            download_cookie=user_cookie,
-        )
-
     # Save the cookie to the user's browser
-    resp = make_response(send_from_directory(directory=file_path, path=filename, as_attachment=True))
+    # The checksum is a strong ETag, so clients can revalidate (304) and resume (206) downloads
+    resp = make_response(
+        FileDeliveryService().send(file_path, download_name=filename, etag=file.checksum)
+    )
     resp.set_cookie("file_download_cookie", user_cookie)
 
+    # Queued in the analytics buffer, which skips downloads already recorded for this cookie
+    if FileDeliveryService.is_download(resp):
+        HubfileDownloadRecordService().record_download(file, user_cookie)
+
     return resp
 
 
 @hubfile_bp.route("/file/view/<int:file_id>", methods=["GET"])
 def view_file(file_id):
-    file = HubfileService().get_or_404(file_id)
-    filename = file.name
+    hubfile_service = HubfileService()
+    file = hubfile_service.get_or_404(file_id)
+    file_path = hubfile_service.get_path_by_hubfile(file)
 
-    directory_path = f"uploads/user_{file.feature_model.data_set.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path, filename)
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", PREVIEW_DEFAULT_ROWS))
+    except ValueError:
+        return jsonify({"success": False, "error": "offset and limit must be integers"}), 400
 
     try:
         if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                content = f.read()
+            try:
+                preview = CsvPreviewService().get_preview(file_path, file.checksum, offset=offset, limit=limit)
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
 
             user_cookie = request.cookies.get("view_cookie")
             if not user_cookie:
                 user_cookie = str(uuid.uuid4())
 
-            # Check if the view record already exists for this cookie
-            existing_record = HubfileViewRecord.query.filter_by(
-                user_id=current_user.id if current_user.is_authenticated else None,
-                file_id=file_id,
-                view_cookie=user_cookie,
-            ).first()
-
-            if not existing_record:
-                # Register file view
-                new_view_record = HubfileViewRecord(
-                    user_id=current_user.id if current_user.is_authenticated else None,
-                    file_id=file_id,
-                    view_date=datetime.now(),
-                    view_cookie=user_cookie,
-                )
-                db.session.add(new_view_record)
-                db.session.commit()
+            # Queued in the analytics buffer, which skips views already recorded for this cookie
+            HubfileViewRecordService().record_view(file, user_cookie)
 
             # Prepare response
-            response = jsonify({"success": True, "content": content})
+            response = jsonify({"success": True, **preview})
             if not request.cookies.get("view_cookie"):
                 response = make_response(response)
                 response.set_cookie("view_cookie", user_cookie, max_age=60 * 60 * 24 * 365 * 2)
@@ -93,3 +83,45 @@ def view_file(file_id):
             return jsonify({"success": False, "error": "File not found"}), 404
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
+
+
+@hubfile_bp.route("/file/statistics/<int:file_id>", methods=["GET"])
+def file_statistics(file_id):
+    file = HubfileService().get_or_404(file_id)
+    try:
+        statistics = HubfileStatisticsService().get_statistics(file)
+    except FileNotFoundError:
+        return jsonify({"success": False, "error": "File not found"}), 404
+    # A list, since JSON objects are sorted by key
+    columns = [{"column": column, **column_statistics} for column, column_statistics in statistics.items()]
+    return jsonify({"success": True, "file_id": file.id, "columns": columns})
+
+
+@hubfile_bp.route("/file/query", methods=["GET"])
+def query_players():
+    """
+    The rows of the files of every published dataset that pass all the `filter` arguments, such as
+    "Points per game>25", as a line of JSON each, streamed as they are found. `columns` (comma separated) picks
+    the columns, `sort` the column to sort by ("-" first for a descending sort) and `limit` the number of rows.
+    Files that cannot be read get a line with an "error" instead, and files not indexed yet are listed in a last
+    line with "unindexed_files".
+    """
+    columns = request.args.get("columns")
+    try:
+        limit = int(request.args.get("limit", QUERY_DEFAULT_ROWS))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit must be an integer"}), 400
+    try:
+        query = PlayerQuery(
+            filters=request.args.getlist("filter"),
+            columns=[column.strip() for column in columns.split(",")] if columns else None,
+            sort=request.args.get("sort"),
+            limit=min(limit, QUERY_MAX_ROWS),
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    rows = PlayerQueryService().run(query)
+    return Response(
+        stream_with_context(json.dumps(row) + "\n" for row in rows), mimetype="application/x-ndjson"
+    )
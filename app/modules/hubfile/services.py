@@ -1,15 +1,57 @@
+import csv
+import filecmp
+import hashlib
+import io
+import logging
+import mmap
 import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
 
 from app.modules.auth.models import User
 from app.modules.dataset.models import DataSet
-from app.modules.hubfile.models import Hubfile
+from app.modules.flamapy.validation import NUMERIC_COLUMNS
+from app.modules.hubfile.columnar import ColumnarFile, build_sidecar, get_sidecar_path, try_build_sidecar
+from app.modules.hubfile.query import PlayerQuery, can_match, get_column, get_mask, get_order, get_sort_keys
+from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
 from app.modules.hubfile.repositories import (
+    HubfileBlobRepository,
+    HubfileColumnStatisticsRepository,
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository,
 )
+from app.modules.hubfile.statistics import compute_file_statistics, format_column_statistics
+from core.managers.analytics_manager import AnalyticsManager, get_analytics
+from core.managers.job_manager import JobManager, get_jobs
 from core.services.BaseService import BaseService
 
+logger = logging.getLogger(__name__)
+
+AnalyticsManager.register_stream("file_view", HubfileViewRecord, ("user_id", "file_id", "view_cookie"))
+AnalyticsManager.register_stream("file_download", HubfileDownloadRecord, ("user_id", "file_id", "download_cookie"))
+
+
+def is_digest(checksum: Optional[str]) -> bool:
+    """
+    Whether checksum is a real digest of the content, which seeded files used not to have.
+    """
+    return bool(checksum) and re.fullmatch(r"[0-9a-f]{32,128}", checksum) is not None
+
 
 class HubfileService(BaseService):
     def __init__(self):
@@ -27,13 +69,34 @@ class HubfileService(BaseService):
 
         hubfile_user = self.get_owner_user_by_hubfile(hubfile)
         hubfile_dataset = self.get_dataset_by_hubfile(hubfile)
-        working_dir = os.getenv("WORKING_DIR")
 
-        path = os.path.join(
-            working_dir, "uploads", f"user_{hubfile_user.id}", f"dataset_{hubfile_dataset.id}", hubfile.name
-        )
+        return self.get_path(hubfile_user.id, hubfile_dataset.id, hubfile.name, hubfile.checksum)
 
-        return path
+    def get_path(self, user_id: int, dataset_id: int, name: str, checksum: str, blob_service=None) -> str:
+        working_dir = os.getenv("WORKING_DIR")
+        path = os.path.join(working_dir, "uploads", f"user_{user_id}", f"dataset_{dataset_id}", name)
+        return (blob_service or HubfileBlobService()).resolve(path, checksum)
+
+    def get_locations(self, published: bool = False) -> list[dict]:
+        """
+        id, name, checksum, size, path, dataset_id and dataset_doi of every file, or of the files of published
+        datasets, without the two queries per file of get_path_by_hubfile.
+        """
+        blob_service = HubfileBlobService()
+        return [
+            {
+                "id": file_id,
+                "name": name,
+                "checksum": checksum,
+                "size": size,
+                "path": self.get_path(user_id, dataset_id, name, checksum, blob_service),
+                "dataset_id": dataset_id,
+                "dataset_doi": dataset_doi,
+            }
+            for file_id, name, checksum, size, user_id, dataset_id, dataset_doi in self.repository.get_locations(
+                published
+            )
+        ]
 
     def total_hubfile_views(self) -> int:
         return self.hubfile_view_record_repository.total_hubfile_views()
@@ -43,6 +106,635 @@ class HubfileService(BaseService):
         return hubfile_download_record_repository.total_hubfile_downloads()
 
 
+class HubfileBlobService(BaseService):
+    """
+    Content addressed store for uploaded files. Every content is kept once under BLOB_STORE_DIR, named after its
+    checksum, and the file of each dataset is a hardlink to it, so a CSV uploaded to several datasets only takes
+    disk and page cache space once. Where a hardlink is not possible the file of the dataset stays a copy, and a
+    file missing from its dataset folder is looked up in the store.
+    """
+
+    def __init__(self):
+        super().__init__(HubfileBlobRepository())
+        self.blobs_dir = current_app.config["BLOB_STORE_DIR"]
+
+    def get_blob_path(self, checksum: str) -> Optional[str]:
+        if not is_digest(checksum):
+            return None
+        return os.path.join(self.blobs_dir, checksum[:2], checksum)
+
+    def store(self, path, checksum: str) -> bool:
+        """
+        Turns the file at path into a hardlink to the blob of its content, which it becomes itself when it is the
+        first copy. Returns False, leaving the file as it is, when it cannot be shared: the checksum is not a
+        digest, a different content has the same checksum or the filesystem has no hardlinks.
+        """
+        blob_path = self.get_blob_path(checksum)
+        if blob_path is None:
+            return False
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(path, blob_path)
+            return True
+        except FileExistsError:
+            pass
+        except OSError:
+            return False
+
+        if os.path.samefile(path, blob_path):
+            return True
+        # MD5 collisions can be crafted, so the content is compared before sharing it
+        if not filecmp.cmp(path, blob_path, shallow=False):
+            return False
+
+        # Unique per call, threads of the same process may be storing the same file
+        temporary_path = f"{path}.{uuid.uuid4().hex}.link"
+        try:
+            os.link(blob_path, temporary_path)
+        except OSError:
+            return False
+        os.replace(temporary_path, path)
+        return True
+
+    def copy(self, source, path, checksum: str):
+        """
+        Copies source to path through the store: when its content is already stored, path becomes a hardlink to
+        the blob and nothing is written.
+        """
+        blob_path = self.get_blob_path(checksum)
+        if blob_path is not None and os.path.exists(blob_path) and filecmp.cmp(source, blob_path, shallow=False):
+            try:
+                os.link(blob_path, path)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source, path)
+        self.store(path, checksum)
+
+    def discard(self, path, checksum: str):
+        """
+        Removes a file copied through the store by a transaction that was rolled back, along with its blob when
+        the file was its first copy.
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._remove_if_orphaned(checksum)
+
+    def _remove_if_orphaned(self, checksum: str) -> bool:
+        """
+        Removes the blob of a content when no file links to it and no row refers to it. Returns whether it did.
+        """
+        blob_path = self.get_blob_path(checksum)
+        if blob_path is None:
+            return False
+        try:
+            # Blobs whose dataset file is gone are still read through their row
+            if os.stat(blob_path).st_nlink > 1 or self.repository.exists(checksum):
+                return False
+            os.remove(blob_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def resolve(self, path, checksum: str) -> str:
+        """
+        The file of a dataset, or its blob when the dataset folder does not have it.
+        """
+        if os.path.exists(path):
+            return path
+        blob_path = self.get_blob_path(checksum)
+        if blob_path is not None and os.path.exists(blob_path):
+            return blob_path
+        return path
+
+    def deduplicate(self) -> dict[str, int]:
+        """
+        Moves the files stored before the blob store into it, computing the checksum of the ones that do not have
+        a real digest (as seeded files used to), then recounts every reference and removes unreferenced blobs.
+        """
+        from app.modules.dataset.services import calculate_checksum_and_size
+
+        hubfile_service = HubfileService()
+        result = {"files": 0, "linked": 0, "missing": 0}
+        for hubfile in Hubfile.query.order_by(Hubfile.id).all():
+            result["files"] += 1
+            path = hubfile_service.get_path_by_hubfile(hubfile)
+            if not os.path.exists(path):
+                result["missing"] += 1
+                continue
+            if self.get_blob_path(hubfile.checksum) is None:
+                hubfile.checksum, hubfile.size = calculate_checksum_and_size(path)
+            if self.store(path, hubfile.checksum):
+                result["linked"] += 1
+
+        result["blobs"] = self.repository.recount()
+        self.repository.session.commit()
+        result["removed"] = self.collect_garbage()
+        return result
+
+    def collect_garbage(self) -> int:
+        """
+        Removes the blobs no file refers to anymore, and the blob files left without a row by an interrupted
+        write. Returns how many were removed.
+
+        Each blob is removed in its own transaction, holding the lock of its row: a flush adding a reference to it
+        meanwhile waits for the removal, and one committed since the list was read leaves the blob in place.
+        """
+        removed = 0
+        for checksum in self.repository.get_unreferenced():
+            try:
+                if not self.repository.lock_unreferenced(checksum):
+                    self.repository.session.rollback()
+                    continue
+                blob_path = self.get_blob_path(checksum)
+                if blob_path is not None:
+                    try:
+                        os.remove(blob_path)
+                    except FileNotFoundError:
+                        pass
+                self.repository.remove([checksum])
+                self.repository.session.commit()
+            except Exception:
+                self.repository.session.rollback()
+                raise
+            removed += 1
+
+        # A blob being shared by a transaction in progress is already linked from its dataset file
+        for directory, _, names in os.walk(self.blobs_dir):
+            for name in names:
+                if self.get_blob_path(name) == os.path.join(directory, name) and self._remove_if_orphaned(name):
+                    removed += 1
+        return removed
+
+
+def get_blob_reference_deltas(session) -> dict[str, tuple[int, int]]:
+    deltas = {}
+
+    def add(checksum, delta, size):
+        previous_delta, previous_size = deltas.get(checksum, (0, 0))
+        deltas[checksum] = (previous_delta + delta, size or previous_size)
+
+    for instance in session.new:
+        if isinstance(instance, Hubfile):
+            add(instance.checksum, 1, instance.size)
+    for instance in session.deleted:
+        if isinstance(instance, Hubfile):
+            add(instance.checksum, -1, instance.size)
+    for instance in session.dirty:
+        if not isinstance(instance, Hubfile):
+            continue
+        history = get_history(instance, "checksum")
+        for checksum in history.deleted:
+            add(checksum, -1, instance.size)
+        for checksum in history.added:
+            add(checksum, 1, instance.size)
+
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def count_blob_references(session, flush_context):
+    """
+    Keeps the reference count of every blob in step with the files created, removed or changed by a flush.
+    """
+    deltas = get_blob_reference_deltas(session)
+    if any(delta for delta, _ in deltas.values()):
+        HubfileBlobRepository().add_references(deltas, connection=session.connection())
+
+
+class HubfileStatisticsService(BaseService):
+    """
+    Statistics of the numeric columns of the files, computed once per content: at ingest for uploaded files, and
+    the first time they are asked for for the files stored before.
+    """
+
+    def __init__(self):
+        super().__init__(HubfileColumnStatisticsRepository())
+
+    def get_statistics(self, hubfile: Hubfile) -> dict[str, dict]:
+        """
+        {column: statistics} of the numeric columns of the file, in the order of the file.
+        """
+        if is_digest(hubfile.checksum):
+            rows = self.repository.get_by_checksum(hubfile.checksum)
+            if rows:
+                statistics = {row.column_name: row.to_dict() for row in rows}
+                return {column: statistics[column] for column in NUMERIC_COLUMNS if column in statistics}
+
+        statistics = compute_file_statistics(hubfile.get_path())
+        # Files seeded without a real checksum may share it with a different content
+        if is_digest(hubfile.checksum):
+            self.add_statistics({hubfile.checksum: statistics})
+            self.repository.session.commit()
+        return {column: format_column_statistics(values) for column, values in statistics.items()}
+
+    def add_statistics(self, statistics: dict[str, dict[str, dict]]):
+        """
+        Saves {checksum: {column: statistics}} in the current transaction.
+        """
+        self.repository.add_statistics(
+            {checksum: columns for checksum, columns in statistics.items() if is_digest(checksum) and columns}
+        )
+
+
 class HubfileDownloadRecordService(BaseService):
     def __init__(self):
         super().__init__(HubfileDownloadRecordRepository())
+
+    def record_download(self, hubfile: Hubfile, user_cookie: str) -> bool:
+        return get_analytics().record(
+            "file_download",
+            user_id=current_user.id if current_user.is_authenticated else None,
+            file_id=hubfile.id,
+            download_date=datetime.now(timezone.utc),
+            download_cookie=user_cookie,
+        )
+
+
+class HubfileViewRecordService(BaseService):
+    def __init__(self):
+        super().__init__(HubfileViewRecordRepository())
+
+    def record_view(self, hubfile: Hubfile, user_cookie: str) -> bool:
+        return get_analytics().record(
+            "file_view",
+            user_id=current_user.id if current_user.is_authenticated else None,
+            file_id=hubfile.id,
+            view_date=datetime.now(timezone.utc),
+            view_cookie=user_cookie,
+        )
+
+
+PREVIEW_DEFAULT_ROWS = 100
+PREVIEW_MAX_ROWS = 1000
+
+QUERY_DEFAULT_ROWS = 1000
+QUERY_MAX_ROWS = 100000
+# Seconds before a query queues again the sidecar of a file it found without one
+SIDECAR_REQUEUE_AFTER = 600
+
+# Bytes scanned at once when indexing the rows of a file
+ROW_INDEX_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def build_row_offsets(file_path) -> np.ndarray:
+    """
+    Byte offset where every row of a CSV file starts, followed by the size of the file, so row i is
+    offsets[i]:offsets[i + 1]. Line breaks inside quoted fields do not end a row.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return np.zeros(1, dtype=np.int64)
+
+    row_starts, quotes_before = [np.zeros(1, dtype=np.int64)], 0
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        for start in range(0, size, ROW_INDEX_CHUNK_SIZE):
+            chunk = np.frombuffer(content[start:start + ROW_INDEX_CHUNK_SIZE], dtype=np.uint8)
+            quotes = np.flatnonzero(chunk == ord('"'))
+            line_breaks = np.flatnonzero(chunk == ord("\n"))
+            # A line break ends a row when an even number of quotes comes before it
+            quoted = (np.searchsorted(quotes, line_breaks) + quotes_before) % 2 == 1
+            row_starts.append(line_breaks[~quoted].astype(np.int64) + start + 1)
+            quotes_before += len(quotes)
+
+    offsets = np.concatenate(row_starts)
+    if offsets[-1] != size:
+        offsets = np.append(offsets, size)
+    return offsets
+
+
+class CsvPreviewService:
+    """
+    Pages through CSV files by rows. The row offsets of each file are computed once and kept in a sidecar
+    under PREVIEW_INDEX_DIR, named after the checksum of the file, so a page only reads its own bytes.
+    """
+
+    def __init__(self):
+        self.index_dir = current_app.config["PREVIEW_INDEX_DIR"]
+
+    def get_row_index_path(self, checksum: str) -> str:
+        return os.path.join(self.index_dir, f"{checksum}.rowidx.npy")
+
+    def get_row_offsets(self, file_path, checksum: str) -> np.ndarray:
+        path = self.get_row_index_path(checksum)
+        try:
+            offsets = np.load(path, mmap_mode="r")
+            if offsets[-1] == os.path.getsize(file_path):
+                return offsets
+        except (FileNotFoundError, ValueError):
+            pass
+
+        offsets = build_row_offsets(file_path)
+        os.makedirs(self.index_dir, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as index_file:
+            np.save(index_file, offsets)
+        os.replace(temporary_path, path)
+        return offsets
+
+    def get_preview(self, file_path, checksum: str, offset: int = 0, limit: int = PREVIEW_DEFAULT_ROWS) -> dict:
+        """
+        The header and rows offset to offset + limit (data rows, the header not included). content is the raw
+        text of those rows, preceded by the header on the first page, so consecutive pages can be concatenated.
+        """
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        if limit < 1:
+            raise ValueError("limit must be greater than 0")
+        limit = min(limit, PREVIEW_MAX_ROWS)
+
+        offsets = self.get_row_offsets(file_path, checksum)
+        total_rows = max(len(offsets) - 2, 0)
+        first, last = min(offset, total_rows) + 1, min(offset + limit, total_rows) + 1
+
+        header, rows, content = [], [], ""
+        if len(offsets) > 1:
+            with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                header_text = mapped[offsets[0]:offsets[1]].decode("utf-8", errors="replace")
+                rows_text = mapped[offsets[first]:offsets[last]].decode("utf-8", errors="replace")
+            header = next(csv.reader(io.StringIO(header_text)), [])
+            rows = list(csv.reader(io.StringIO(rows_text)))
+            content = header_text + rows_text if offset == 0 else rows_text
+
+        return {
+            "header": header,
+            "rows": rows,
+            "offset": offset,
+            "limit": limit,
+            "total_rows": total_rows,
+            "next_offset": offset + limit if offset + limit < total_rows else None,
+            "content": content,
+        }
+
+
+class ColumnarSidecarService:
+    """
+    Columnar sidecars of the CSV files (see app.modules.hubfile.columnar), kept under COLUMNAR_DIR and named
+    after the checksum of the file, so files with the same content share one. Ingestion writes them; a sidecar
+    that is missing, or was built from another content, is built again by get_columnar, by the backfill or by
+    the background job queued by a query that skipped the file.
+    """
+
+    def __init__(self):
+        self.sidecar_dir = current_app.config["COLUMNAR_DIR"]
+
+    def get_sidecar_path(self, file_path, checksum: str) -> str:
+        # Checksums that are not real digests may be shared by different contents
+        key = checksum if is_digest(checksum) else "path-" + hashlib.md5(file_path.encode("utf-8")).hexdigest()
+        return get_sidecar_path(self.sidecar_dir, key)
+
+    def load(self, file_path, checksum: str) -> Optional[ColumnarFile]:
+        """
+        The sidecar of the file, or None when there is none or it does not match the file.
+        """
+        try:
+            columnar = ColumnarFile(self.get_sidecar_path(file_path, checksum))
+        except (FileNotFoundError, ValueError):
+            return None
+        if columnar.checksum != checksum or columnar.source_size != os.path.getsize(file_path):
+            return None
+        return columnar
+
+    def get_columnar(self, file_path, checksum: str) -> ColumnarFile:
+        columnar = self.load(file_path, checksum)
+        if columnar is None:
+            sidecar_path = self.get_sidecar_path(file_path, checksum)
+            build_sidecar(file_path, sidecar_path, checksum)
+            columnar = ColumnarFile(sidecar_path)
+        return columnar
+
+    def backfill(self, workers: Optional[int] = None, force: bool = False, progress=None) -> dict:
+        """
+        Builds the sidecars of the stored files that have none, or every sidecar with `force`, each content once
+        with a pool of `workers` processes. `progress(result)` is called with the running totals after each
+        content. Returns the totals: files, built, current (already up to date), missing, bytes and seconds.
+        """
+        start = time.perf_counter()
+        workers = workers or os.cpu_count() or 1
+        locations = HubfileService().get_locations()
+        result = {"files": 0, "built": 0, "current": 0, "missing": 0, "bytes": 0, "seconds": 0.0}
+        result["total_files"] = len(locations)
+
+        contents = {}
+        for location in locations:
+            contents.setdefault(self.get_sidecar_path(location["path"], location["checksum"]), []).append(location)
+
+        def report(files):
+            result["files"] += len(files)
+            result["seconds"] = time.perf_counter() - start
+            if progress:
+                progress(result)
+
+        pending = []
+        for sidecar_path, files in contents.items():
+            path, checksum = files[0]["path"], files[0]["checksum"]
+            if not os.path.exists(path):
+                result["missing"] += len(files)
+                report(files)
+            elif not force and self.load(path, checksum) is not None:
+                result["current"] += len(files)
+                report(files)
+            else:
+                pending.append((sidecar_path, files))
+
+        with ProcessPoolExecutor(workers) as executor:
+            chunksize = max(1, min(64, len(pending) // (workers * 4)))
+            errors = executor.map(
+                try_build_sidecar,
+                [files[0]["path"] for _, files in pending],
+                [sidecar_path for sidecar_path, _ in pending],
+                [files[0]["checksum"] for _, files in pending],
+                chunksize=chunksize,
+            )
+            for (_, files), error in zip(pending, errors):
+                if error is None:
+                    result["built"] += 1
+                    result["bytes"] += os.path.getsize(files[0]["path"])
+                else:
+                    result["missing"] += len(files)
+                report(files)
+
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+
+class PlayerQueryService:
+    """
+    Runs a PlayerQuery over the files of every published dataset, through their columnar sidecars. The files whose
+    statistics rule out every row are not opened, and files with the same content are scanned once. Files without
+    an up to date sidecar are skipped and their sidecar is built by a background job, so a query never parses a
+    CSV file itself.
+    """
+
+    # Sidecar paths by the time their build was queued, oldest first
+    _queued_sidecars = OrderedDict()
+    _queued_sidecars_lock = threading.Lock()
+
+    def __init__(self):
+        self.hubfile_service = HubfileService()
+        self.statistics_repository = HubfileColumnStatisticsRepository()
+        self.sidecar_service = ColumnarSidecarService()
+
+    def get_contents(self, query: PlayerQuery) -> list[list[dict]]:
+        """
+        The locations of the files that may have matching rows, grouped by content.
+        """
+        columns = query.numeric_columns
+        ranges = self.statistics_repository.get_ranges(columns) if columns else {}
+        contents = {}
+        for location in self.hubfile_service.get_locations(published=True):
+            checksum = location["checksum"]
+            if is_digest(checksum) and not can_match(query.filters, ranges.get(checksum, {})):
+                continue
+            contents.setdefault(self.sidecar_service.get_sidecar_path(location["path"], checksum), []).append(location)
+        return list(contents.values())
+
+    def get_matches(self, query: PlayerQuery, unindexed: list):
+        """
+        Yields (locations, columnar file, matching rows, None) for every content with matching rows, and
+        (locations, None, None, error message) for the contents that could not be read. The locations of the
+        contents without a sidecar are added to `unindexed` instead.
+        """
+        for locations in self.get_contents(query):
+            path, checksum = locations[0]["path"], locations[0]["checksum"]
+            try:
+                columnar = self.sidecar_service.load(path, checksum)
+                if columnar is None:
+                    unindexed.extend(locations)
+                    self.queue_sidecar(path, checksum)
+                    continue
+                rows = np.flatnonzero(get_mask(columnar, query.filters))
+            except Exception as e:
+                logger.exception("Error querying %s", path)
+                yield locations, None, None, "File not found" if isinstance(e, FileNotFoundError) else str(e)
+                continue
+            if len(rows):
+                yield locations, columnar, rows, None
+
+    def queue_sidecar(self, file_path, checksum: str):
+        """
+        Queues the build of the sidecar of a file, at most once every SIDECAR_REQUEUE_AFTER seconds per process.
+        """
+        sidecar_path = self.sidecar_service.get_sidecar_path(file_path, checksum)
+        now = time.monotonic()
+        queued = PlayerQueryService._queued_sidecars
+        with PlayerQueryService._queued_sidecars_lock:
+            while queued and now - next(iter(queued.values())) >= SIDECAR_REQUEUE_AFTER:
+                queued.popitem(last=False)
+            if sidecar_path in queued:
+                return
+            queued[sidecar_path] = now
+        get_jobs().enqueue("build_columnar_sidecar", file_path, checksum)
+
+    def run(self, query: PlayerQuery):
+        """
+        Yields the matching rows as dicts: dataset_id, dataset_doi, file_id, file, row (the position of the row
+        among the non blank rows of the file) and the columns of the query. Unsorted rows come out file by file
+        as they are found, sorted ones once every file has been scanned. A file that could not be read yields a
+        record with its error instead of rows, and when files were skipped for having no sidecar yet a last
+        record lists them under "unindexed_files".
+        """
+        unindexed = []
+        yield from self._run(query, unindexed)
+        if unindexed:
+            yield {
+                "unindexed_files": [
+                    {"dataset_id": location["dataset_id"], "file_id": location["id"], "file": location["name"]}
+                    for location in unindexed
+                ]
+            }
+
+    def _run(self, query: PlayerQuery, unindexed: list):
+        if query.sort_column is None:
+            remaining = query.limit
+            for locations, columnar, rows, error in self.get_matches(query, unindexed):
+                if error is not None:
+                    yield from iter_errors(locations, error)
+                    continue
+                if remaining is not None:
+                    rows = rows[:remaining]
+                for row in iter_rows(locations, rows, get_columns(columnar, query.columns, rows), remaining):
+                    yield row
+                    if remaining is not None:
+                        remaining -= 1
+                if remaining == 0:
+                    return
+            return
+
+        # Only the first `limit` rows of each content can make it to the first `limit` of all of them
+        blocks = []
+        for locations, columnar, rows, error in self.get_matches(query, unindexed):
+            if error is not None:
+                yield from iter_errors(locations, error)
+                continue
+            keys = get_sort_keys(columnar, query.sort_column, rows)
+            if query.limit is not None and len(rows) > query.limit:
+                order = get_order(keys, query.descending)[: query.limit]
+                rows, keys = rows[order], keys[order]
+            blocks.append((locations, rows, keys, get_columns(columnar, query.columns, rows)))
+        if not blocks:
+            return
+
+        block_index = np.concatenate([np.full(len(rows), index) for index, (_, rows, _, _) in enumerate(blocks)])
+        positions = np.concatenate([np.arange(len(rows)) for _, rows, _, _ in blocks])
+        order = get_order(np.concatenate([keys for _, _, keys, _ in blocks]), query.descending)
+        remaining = query.limit
+        for index, position in zip(block_index[order].tolist(), positions[order].tolist()):
+            locations, rows, _, columns = blocks[index]
+            values = {column: column_values[position : position + 1] for column, column_values in columns.items()}
+            for row in iter_rows(locations, rows[position : position + 1], values, remaining):
+                yield row
+                if remaining is not None:
+                    remaining -= 1
+            if remaining == 0:
+                return
+
+
+def build_columnar_sidecar(file_path, checksum: str):
+    """
+    Background job building the sidecar of a file that a query found without one.
+    """
+    service = ColumnarSidecarService()
+    if service.load(file_path, checksum) is None:
+        build_sidecar(file_path, service.get_sidecar_path(file_path, checksum), checksum)
+
+
+JobManager.register_task("build_columnar_sidecar", build_columnar_sidecar)
+
+
+def iter_errors(locations, error):
+    for location in locations:
+        yield {
+            "dataset_id": location["dataset_id"],
+            "dataset_doi": location["dataset_doi"],
+            "file_id": location["id"],
+            "file": location["name"],
+            "error": error,
+        }
+
+
+def get_columns(columnar, columns, rows) -> dict[str, list]:
+    return {column: get_column(columnar, column, rows) for column in columns}
+
+
+def iter_rows(locations, rows, columns, limit=None):
+    """
+    The rows, with the values of `columns` at the same positions, of each of the files with that content.
+    """
+    count = 0
+    for location in locations:
+        for position, row in enumerate(rows.tolist()):
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield {
+                "dataset_id": location["dataset_id"],
+                "dataset_doi": location["dataset_doi"],
+                "file_id": location["id"],
+                "file": location["name"],
+                "row": row,
+                **{column: values[position] for column, values in columns.items()},
+            }
@@ -0,0 +1,86 @@
+"""
+Statistics of the numeric columns of the players CSV files: count, nulls, min, max, mean, standard deviation,
+a few quantiles and a histogram of HISTOGRAM_BINS bins of equal width between min and max. They are computed
+from the values ColumnarCsvValidator parses at ingest (heights in centimeters), once per content, and stored
+with the quantiles and histogram packed as little endian arrays.
+"""
+import numpy as np
+
+from app.modules.flamapy.validation import ColumnarCsvValidator
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+HISTOGRAM_BINS = 20
+
+
+def compute_column_statistics(values: np.ndarray) -> dict:
+    """
+    Statistics of a column given as a float array, NaN standing for a missing or invalid value.
+    """
+    present = values[np.isfinite(values)]
+    statistics = {"count": int(len(values)), "nulls": int(len(values) - len(present))}
+    if not len(present):
+        return {**statistics, "min": None, "max": None, "mean": None, "std": None, "quantiles": [], "histogram": []}
+
+    minimum, maximum = float(present.min()), float(present.max())
+    if minimum == maximum:
+        histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        histogram[0] = len(present)
+    else:
+        histogram = np.histogram(present, bins=HISTOGRAM_BINS, range=(minimum, maximum))[0]
+    return {
+        **statistics,
+        "min": minimum,
+        "max": maximum,
+        "mean": float(present.mean()),
+        "std": float(present.std()),
+        "quantiles": np.quantile(present, QUANTILES).tolist(),
+        "histogram": histogram.tolist(),
+    }
+
+
+def compute_statistics(columns: dict) -> dict:
+    return {column: compute_column_statistics(values) for column, values in columns.items()}
+
+
+def compute_file_statistics(path) -> dict:
+    validator = ColumnarCsvValidator(collect_values=True)
+    with open(path, "rb") as csv_file:
+        validator.validate(csv_file)
+    return compute_statistics(validator.get_values())
+
+
+def get_histogram_edges(minimum, maximum) -> list:
+    if minimum is None:
+        return []
+    return np.linspace(minimum, maximum, HISTOGRAM_BINS + 1).tolist()
+
+
+def format_column_statistics(statistics: dict) -> dict:
+    """
+    The statistics of a column as the API shows them, with the quantiles labelled and the edges of the bins.
+    """
+    return {
+        **statistics,
+        "quantiles": [{"q": q, "value": value} for q, value in zip(QUANTILES, statistics["quantiles"])],
+        "histogram": {
+            "edges": get_histogram_edges(statistics["min"], statistics["max"]),
+            "counts": statistics["histogram"],
+        },
+    }
+
+
+def pack_quantiles(quantiles) -> bytes:
+    return np.asarray(quantiles, dtype="<f8").tobytes()
+
+
+def unpack_quantiles(packed) -> list:
+    return np.frombuffer(packed or b"", dtype="<f8").tolist()
+
+
+def pack_histogram(histogram) -> bytes:
+    return np.asarray(histogram, dtype="<u4").tobytes()
+
+
+def unpack_histogram(packed) -> list:
+    return np.frombuffer(packed or b"", dtype="<u4").tolist()
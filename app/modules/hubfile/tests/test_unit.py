@@ -1,5 +1,28 @@
+import hashlib
+import json
+import os
+
+import numpy as np
 import pytest
 
+from app import db
+from app.modules.auth.models import User
+from app.modules.dataset.models import DataSet, DSMetaData
+from app.modules.featuremodel.models import FeatureModel, FMMetaData
+from app.modules.hubfile import services as hubfile_services
+from app.modules.hubfile.columnar import INTEGER_NULL, ColumnarFile, build_sidecar
+from app.modules.hubfile.models import Hubfile, HubfileBlob, HubfileDownloadRecord
+from app.modules.hubfile.query import PlayerQuery, can_match
+from app.modules.hubfile.repositories import HubfileColumnStatisticsRepository
+from app.modules.hubfile.services import (
+    ColumnarSidecarService,
+    HubfileBlobService,
+    HubfileService,
+    HubfileStatisticsService,
+)
+from app.modules.hubfile.statistics import HISTOGRAM_BINS, QUANTILES, compute_file_statistics, compute_statistics
+from core.managers.job_manager import get_jobs
+
 
 @pytest.fixture(scope="module")
 def test_client(test_client):
@@ -22,3 +45,510 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+@pytest.fixture
+def uploaded_file(test_client, tmp_path, monkeypatch):
+    with test_client.application.app_context():
+        user = User(email=f"hubfile_download_{tmp_path.name}@example.com", password="1234")
+        db.session.add(user)
+        db.session.commit()
+
+        meta = DSMetaData(title="Files", description="Files", publication_type="NONE", dataset_doi="10.1234/files")
+        dataset = DataSet(user_id=user.id, ds_meta_data=meta)
+        fm_meta = FMMetaData(csv_filename="players.csv", title="FM", description="FM", publication_type="NONE")
+        feature_model = FeatureModel(data_set=dataset, fm_meta_data=fm_meta)
+        hubfile = Hubfile(name="players.csv", checksum="5f1ad0", size=20, feature_model=feature_model)
+        db.session.add_all([dataset, feature_model, hubfile])
+        db.session.commit()
+
+        dataset_folder = tmp_path / "uploads" / f"user_{user.id}" / f"dataset_{dataset.id}"
+        dataset_folder.mkdir(parents=True)
+        (dataset_folder / "players.csv").write_bytes(b"Name,Age\nPlayer,25\n\n")
+        file_id = hubfile.id
+
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    monkeypatch.setattr(test_client.application, "root_path", str(tmp_path / "app"))
+    return file_id, f"user_{user.id}/dataset_{dataset.id}/players.csv"
+
+
+def test_download_file_supports_conditional_and_range_requests(test_client, uploaded_file):
+    file_id, _ = uploaded_file
+
+    response = test_client.get(f"/file/download/{file_id}")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"5f1ad0"'
+
+    not_modified = test_client.get(f"/file/download/{file_id}", headers={"If-None-Match": '"5f1ad0"'})
+    assert not_modified.status_code == 304
+
+    partial = test_client.get(f"/file/download/{file_id}", headers={"Range": "bytes=0-3"})
+    assert partial.status_code == 206
+    assert partial.data == b"Name"
+
+
+def test_download_file_records_only_downloads_from_the_first_byte(test_client, uploaded_file, monkeypatch):
+    file_id, _ = uploaded_file
+
+    def is_recorded(cookie, **headers):
+        test_client.set_cookie("file_download_cookie", cookie)
+        test_client.get(f"/file/download/{file_id}", headers=headers)
+        with test_client.application.app_context():
+            return HubfileDownloadRecord.query.filter_by(download_cookie=cookie).count() == 1
+
+    assert is_recorded("full")
+    assert is_recorded("first-range", Range="bytes=0-3")
+    assert not is_recorded("revalidation", **{"If-None-Match": '"5f1ad0"'})
+    assert not is_recorded("resumed", Range="bytes=4-")
+
+    monkeypatch.setitem(test_client.application.config, "DOWNLOAD_DELIVERY", "x-accel")
+    assert is_recorded("nginx-full")
+    assert not is_recorded("nginx-resumed", Range="bytes=4-")
+    test_client.delete_cookie("file_download_cookie")
+
+
+def test_download_file_delegates_body_to_nginx(test_client, uploaded_file, monkeypatch):
+    file_id, relative_path = uploaded_file
+    monkeypatch.setitem(test_client.application.config, "DOWNLOAD_DELIVERY", "x-accel")
+
+    response = test_client.get(f"/file/download/{file_id}")
+
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == f"/protected-uploads/{relative_path}"
+    assert response.headers["Content-Disposition"] == "attachment; filename=players.csv"
+    assert "file_download_cookie" in response.headers["Set-Cookie"]
+    assert response.data == b""
+    assert response.headers["ETag"] == '"5f1ad0"'
+    assert response.headers["Last-Modified"]
+
+
+def test_download_file_delegated_to_nginx_answers_conditional_requests(test_client, uploaded_file, monkeypatch):
+    file_id, _ = uploaded_file
+    monkeypatch.setitem(test_client.application.config, "DOWNLOAD_DELIVERY", "x-accel")
+
+    response = test_client.get(f"/file/download/{file_id}", headers={"If-None-Match": '"5f1ad0"'})
+    assert response.status_code == 304
+    assert "X-Accel-Redirect" not in response.headers
+
+    last_modified = test_client.get(f"/file/download/{file_id}").headers["Last-Modified"]
+    response = test_client.get(f"/file/download/{file_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    response = test_client.get(f"/file/download/{file_id}", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"]
+
+
+def test_row_offsets_skip_line_breaks_inside_quotes(tmp_path, monkeypatch):
+    path = tmp_path / "players.csv"
+    path.write_bytes(b'Name,Notes\nJordan,"Six\nrings"\nBird,"Say ""hi"""\nMagic,last')
+    # Small chunks so quoted fields span several of them
+    monkeypatch.setattr(hubfile_services, "ROW_INDEX_CHUNK_SIZE", 4)
+
+    offsets = hubfile_services.build_row_offsets(path)
+
+    assert offsets.tolist() == [0, 11, 30, 48, 58]
+
+    (tmp_path / "empty.csv").write_bytes(b"")
+    assert hubfile_services.build_row_offsets(tmp_path / "empty.csv").tolist() == [0]
+
+
+def test_view_file_pages_rows_from_sidecar(test_client, uploaded_file, tmp_path, monkeypatch):
+    file_id, relative_path = uploaded_file
+    monkeypatch.setitem(test_client.application.config, "PREVIEW_INDEX_DIR", str(tmp_path / "preview_index"))
+    rows = "".join(f"Player {i},{20 + i}\n" for i in range(5))
+    (tmp_path / "uploads" / relative_path).write_text("Name,Age\n" + rows)
+
+    response = test_client.get(f"/file/view/{file_id}?limit=2")
+
+    assert response.status_code == 200
+    assert response.json["header"] == ["Name", "Age"]
+    assert response.json["rows"] == [["Player 0", "20"], ["Player 1", "21"]]
+    assert response.json["total_rows"] == 5
+    assert response.json["next_offset"] == 2
+    assert response.json["content"] == "Name,Age\nPlayer 0,20\nPlayer 1,21\n"
+    assert os.path.exists(tmp_path / "preview_index" / "5f1ad0.rowidx.npy")
+
+    response = test_client.get(f"/file/view/{file_id}?offset=4&limit=2")
+
+    assert response.json["rows"] == [["Player 4", "24"]]
+    assert response.json["next_offset"] is None
+    assert response.json["content"] == "Player 4,24\n"
+
+    assert test_client.get(f"/file/view/{file_id}?offset=-1").status_code == 400
+    assert test_client.get(f"/file/view/{file_id}?limit=abc").status_code == 400
+
+
+def test_blob_store_hardlinks_duplicates_and_counts_references(test_client, uploaded_file, tmp_path, monkeypatch):
+    file_id, relative_path = uploaded_file
+    monkeypatch.setitem(test_client.application.config, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    content = b"Name,Age\nJordan,60\n"
+    checksum = hashlib.md5(content).hexdigest()
+
+    with test_client.application.app_context():
+        hubfile = db.session.get(Hubfile, file_id)
+        feature_model = hubfile.feature_model
+        copy = Hubfile(name="copy.csv", checksum=checksum, size=len(content), feature_model=feature_model)
+        db.session.add(copy)
+        hubfile.checksum, hubfile.size = checksum, len(content)
+        db.session.commit()
+        assert db.session.get(HubfileBlob, checksum).ref_count == 2
+
+        original_path = tmp_path / "uploads" / relative_path
+        copy_path = original_path.with_name("copy.csv")
+        original_path.write_bytes(content)
+        copy_path.write_bytes(content)
+
+        blob_service = HubfileBlobService()
+        assert blob_service.store(str(original_path), checksum)
+        assert blob_service.store(str(copy_path), checksum)
+        assert os.path.samefile(original_path, copy_path)
+        assert os.path.samefile(copy_path, blob_service.get_blob_path(checksum))
+
+        # A different content under the same checksum is never shared
+        colliding_path = tmp_path / "colliding.csv"
+        colliding_path.write_bytes(b"Name,Age\nBird,67\n")
+        assert not blob_service.store(str(colliding_path), checksum)
+
+        # Files missing from the dataset folder are read from the store
+        copy_path.unlink()
+        assert HubfileService().get_path_by_hubfile(copy) == blob_service.get_blob_path(checksum)
+
+        db.session.delete(copy)
+        db.session.delete(hubfile)
+        db.session.commit()
+        assert db.session.get(HubfileBlob, checksum).ref_count == 0
+
+        # A reference committed after the unreferenced blobs were listed keeps the blob
+        get_unreferenced = blob_service.repository.get_unreferenced
+
+        def get_unreferenced_then_reference():
+            checksums = get_unreferenced()
+            blob_service.repository.add_references({checksum: (1, len(content))})
+            db.session.commit()
+            return checksums
+
+        monkeypatch.setattr(blob_service.repository, "get_unreferenced", get_unreferenced_then_reference)
+        assert blob_service.collect_garbage() == 0
+        assert os.path.exists(blob_service.get_blob_path(checksum))
+        monkeypatch.setattr(blob_service.repository, "get_unreferenced", get_unreferenced)
+        blob_service.repository.add_references({checksum: (-1, len(content))})
+        db.session.commit()
+
+        assert blob_service.collect_garbage() == 1
+        assert not os.path.exists(blob_service.get_blob_path(checksum))
+        assert db.session.get(HubfileBlob, checksum) is None
+
+
+def test_blob_store_removes_blobs_left_without_a_row(test_client, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_client.application.config, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    content = b"Name,Age\nRodman,62\n"
+    checksum = hashlib.md5(content).hexdigest()
+    source = tmp_path / "source.csv"
+    source.write_bytes(content)
+
+    with test_client.application.app_context():
+        blob_service = HubfileBlobService()
+        blob_path = blob_service.get_blob_path(checksum)
+
+        # The first copy of a content made by a rolled back import takes its blob with it
+        dest_path = tmp_path / "dataset" / "rodman.csv"
+        dest_path.parent.mkdir()
+        blob_service.copy(str(source), str(dest_path), checksum)
+        assert os.path.samefile(dest_path, blob_path)
+        blob_service.discard(str(dest_path), checksum)
+        assert not dest_path.exists() and not os.path.exists(blob_path)
+
+        # Blobs without a row or a dataset file are swept, the ones still linked or with a row are kept
+        orphaned = tmp_path / "orphaned.csv"
+        orphaned.write_bytes(content)
+        assert blob_service.store(str(orphaned), checksum)
+        assert blob_service.collect_garbage() == 0
+        orphaned.unlink()
+        blob_service.repository.add_references({checksum: (1, len(content))})
+        db.session.commit()
+        assert blob_service.collect_garbage() == 0
+        assert os.path.exists(blob_path)
+
+        db.session.delete(db.session.get(HubfileBlob, checksum))
+        db.session.commit()
+        assert blob_service.collect_garbage() == 1
+        assert not os.path.exists(blob_path)
+
+
+def test_column_statistics_normalize_heights_and_skip_nulls():
+    values = {
+        "Height": np.array([198.0, 206.0, np.nan, 214.0]),
+        "Age": np.array([np.nan, np.nan]),
+        "Games": np.array([82.0, 82.0]),
+    }
+
+    statistics = compute_statistics(values)
+
+    height = statistics["Height"]
+    assert (height["count"], height["nulls"], height["min"], height["max"]) == (4, 1, 198.0, 214.0)
+    assert height["mean"] == pytest.approx(206.0)
+    assert height["quantiles"][QUANTILES.index(0.5)] == 206.0
+    assert len(height["histogram"]) == HISTOGRAM_BINS and sum(height["histogram"]) == 3
+    assert (height["histogram"][0], height["histogram"][-1]) == (1, 1)
+    assert statistics["Age"] == {
+        "count": 2, "nulls": 2, "min": None, "max": None, "mean": None, "std": None, "quantiles": [], "histogram": []
+    }
+    assert statistics["Games"]["histogram"][0] == 2
+
+
+def test_file_statistics_are_computed_once_per_content(test_client, uploaded_file, tmp_path):
+    file_id, relative_path = uploaded_file
+    content = (
+        b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+        b"Jordan,1m98,40,82,30.1,5.3,6.2\n"
+        b'"Pippen, Scottie",2m03,,82,16.1,5.2,6.4\n'
+        b"Kerr,1m91,31,82,x,1.2,1.1\n"
+    )
+    (tmp_path / "uploads" / relative_path).write_bytes(content)
+    checksum = hashlib.md5(content).hexdigest()
+    with test_client.application.app_context():
+        db.session.get(Hubfile, file_id).checksum = checksum
+        db.session.commit()
+
+    response = test_client.get(f"/file/statistics/{file_id}")
+    assert response.status_code == 200
+    columns = {column.pop("column"): column for column in response.get_json()["columns"]}
+    assert list(columns) == ["Height", "Age", "Games", "Points per game", "Assists per game", "Rebounds per game"]
+    assert (columns["Height"]["min"], columns["Height"]["max"]) == (191.0, 203.0)
+    assert (columns["Age"]["count"], columns["Age"]["nulls"]) == (3, 1)
+    assert columns["Points per game"]["nulls"] == 1
+    assert columns["Points per game"]["mean"] == pytest.approx(23.1)
+    assert columns["Height"]["histogram"]["edges"][0] == 191.0
+    assert len(columns["Height"]["histogram"]["counts"]) == HISTOGRAM_BINS
+
+    with test_client.application.app_context():
+        assert len(HubfileColumnStatisticsRepository().get_by_checksum(checksum)) == 6
+
+    # Stored statistics are served without reading the file
+    (tmp_path / "uploads" / relative_path).unlink()
+    response = test_client.get(f"/file/statistics/{file_id}")
+    assert {column.pop("column"): column for column in response.get_json()["columns"]} == columns
+
+
+def test_columnar_sidecar_maps_typed_columns(tmp_path):
+    csv_path = tmp_path / "players.csv"
+    csv_path.write_bytes(
+        b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+        b"Jordan,1m98,40,82,30.1,5.3,6.2\n"
+        b"\n"
+        b'"Pippen, Scottie",2m03,,82,16.1,5.2,6.4\n'
+        b"Jordan,1m98,41,x,x,5.3,6.2\n"
+    )
+    build_sidecar(str(csv_path), str(tmp_path / "players.columns"), "abc")
+
+    # Before the whole dictionary is decoded, only the names of the rows asked for are
+    assert ColumnarFile(str(tmp_path / "players.columns")).names([1]) == ["Pippen, Scottie"]
+    columnar = ColumnarFile(str(tmp_path / "players.columns"))
+    assert (columnar.checksum, columnar.source_size, columnar.row_count) == ("abc", csv_path.stat().st_size, 3)
+    assert columnar.dictionary() == ["Jordan", "Pippen, Scottie"]
+    assert columnar.array("Name").tolist() == [0, 1, 0]
+    assert columnar.names([1, 2]) == ["Pippen, Scottie", "Jordan"]
+
+    # Arrays are views over the mapping, not copies
+    ages = columnar.array("Age")
+    assert ages.dtype == np.dtype("<i4") and not ages.flags.writeable and ages.base.obj is columnar.mapping
+    assert ages.tolist() == [40, INTEGER_NULL, 41]
+    assert np.isnan(columnar.values("Age")).tolist() == [False, True, False]
+    assert columnar.values("Height").tolist() == [198.0, 203.0, 198.0]
+    assert columnar.array("Points per game").dtype == np.dtype("<f8")
+    assert np.isnan(columnar.values("Points per game")[2])
+
+
+def test_columnar_sidecar_is_rebuilt_when_the_content_changes(test_client, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_client.application.config, "COLUMNAR_DIR", str(tmp_path / "columnar"))
+    csv_path = tmp_path / "players.csv"
+    content = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\nKerr,1m91,31,82,8.2,1.2,1.1\n"
+    csv_path.write_bytes(content)
+    checksum = hashlib.md5(content).hexdigest()
+
+    with test_client.application.app_context():
+        service = ColumnarSidecarService()
+        assert service.load(str(csv_path), checksum) is None
+        assert service.get_columnar(str(csv_path), checksum).names() == ["Kerr"]
+        assert os.path.exists(tmp_path / "columnar" / f"{checksum}.columns")
+
+        # A sidecar built from another content does not match the file
+        csv_path.write_bytes(content + b"Rodman,2m01,37,80,4.7,1.8,15.0\n")
+        assert service.load(str(csv_path), checksum) is None
+        assert service.get_columnar(str(csv_path), checksum).names() == ["Kerr", "Rodman"]
+        other_checksum = "0" * 32
+        os.replace(service.get_sidecar_path(str(csv_path), checksum), service.get_sidecar_path("", other_checksum))
+        assert service.load(str(csv_path), other_checksum) is None
+
+
+def test_columnar_backfill_builds_missing_sidecars_once(test_client, uploaded_file, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_client.application.config, "COLUMNAR_DIR", str(tmp_path / "columnar"))
+    file_path = str(tmp_path / "uploads" / uploaded_file[1])
+    with open(file_path, "wb") as csv_file:
+        csv_file.write(b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n")
+        csv_file.write(b"Player,2m01,25,10,1.0,2.0,3.0\n")
+
+    with test_client.application.app_context():
+        service = ColumnarSidecarService()
+        result = service.backfill(workers=1)
+        assert result["built"] >= 1
+        assert service.load(file_path, "5f1ad0").names() == ["Player"]
+
+        result = service.backfill(workers=1)
+        assert result["built"] == 0
+        assert result["current"] >= 1
+
+
+def test_player_query_parses_filters_and_prunes_by_range():
+    query = PlayerQuery(["Points per game>25", "Height >= 2m01", "Name~jordan"], sort="-Age", limit=5)
+    assert query.filters == [("Points per game", ">", 25.0), ("Height", ">=", 201.0), ("Name", "~", "jordan")]
+    assert (query.sort_column, query.descending) == ("Age", True)
+    assert query.numeric_columns == ["Height", "Points per game"]
+
+    for arguments in ({"filters": ["Weight>100"]}, {"filters": ["Age~2"]}, {"filters": ["Age>old"]},
+                      {"filters": ["Age"]}, {"columns": ["Team"]}, {"sort": "-Team"}, {"limit": 0}):
+        with pytest.raises(ValueError):
+            PlayerQuery(**arguments)
+
+    assert can_match(query.filters, {"Points per game": (10.0, 30.0), "Height": (190.0, 201.0)})
+    assert not can_match(query.filters, {"Points per game": (10.0, 25.0)})
+    assert not can_match(query.filters, {"Height": (None, None)})
+    assert not can_match([("Age", "!=", 30.0)], {"Age": (30.0, 30.0)})
+    assert can_match(query.filters, {})
+
+
+def test_sidecar_builds_are_queued_once_per_window_and_forgotten_after_it(test_client, monkeypatch):
+    from collections import OrderedDict
+    from types import SimpleNamespace
+
+    from app.modules.hubfile.services import SIDECAR_REQUEUE_AFTER, PlayerQueryService
+
+    clock = [1000.0]
+    queued = []
+    monkeypatch.setattr(hubfile_services, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    monkeypatch.setattr(
+        hubfile_services, "get_jobs", lambda: SimpleNamespace(enqueue=lambda name, *args: queued.append(args[0]))
+    )
+    monkeypatch.setattr(PlayerQueryService, "_queued_sidecars", OrderedDict())
+
+    with test_client.application.app_context():
+        service = PlayerQueryService()
+        service.queue_sidecar("/data/a.csv", "a" * 64)
+        service.queue_sidecar("/data/a.csv", "a" * 64)
+        clock[0] += SIDECAR_REQUEUE_AFTER / 2
+        service.queue_sidecar("/data/b.csv", "b" * 64)
+        assert queued == ["/data/a.csv", "/data/b.csv"]
+
+        # Entries older than the window are dropped when a new build is queued
+        clock[0] += SIDECAR_REQUEUE_AFTER / 2
+        service.queue_sidecar("/data/c.csv", "c" * 64)
+        assert len(PlayerQueryService._queued_sidecars) == 2
+        service.queue_sidecar("/data/a.csv", "a" * 64)
+        assert queued == ["/data/a.csv", "/data/b.csv", "/data/c.csv", "/data/a.csv"]
+
+
+def test_player_query_scans_published_files_column_wise(test_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    monkeypatch.setitem(test_client.application.config, "COLUMNAR_DIR", str(tmp_path / "columnar"))
+    header = b"Name,Height,Age,Games,Points per game,Assists per game,Rebounds per game\n"
+    stars = b"Doncic,2m01,24,66,33.9,9.8,9.2\nJames,2m06,39,71,25.7,8.3,7.3\nWemby,2m24,20,71,21.4,3.9,10.6\n"
+    contents = {
+        "stars.csv": header + stars,
+        "same.csv": header + stars,
+        "bench.csv": header + b"Bench,1m90,23,10,2.0,0.5,1.0\n",
+        "draft.csv": header + b"Rookie,2m00,19,82,26.0,2.0,5.0\n",
+    }
+    with test_client.application.app_context():
+        user = User(email=f"query_{tmp_path.name}@example.com", password="1234")
+        db.session.add(user)
+        db.session.commit()
+        file_ids = {}
+        for name, content in contents.items():
+            doi = None if name == "draft.csv" else f"10.1234/query-{name}"
+            meta = DSMetaData(title=name, description=name, publication_type="NONE", dataset_doi=doi)
+            dataset = DataSet(user_id=user.id, ds_meta_data=meta)
+            fm_meta = FMMetaData(csv_filename=name, title="FM", description="FM", publication_type="NONE")
+            feature_model = FeatureModel(data_set=dataset, fm_meta_data=fm_meta)
+            checksum = hashlib.md5(content).hexdigest()
+            hubfile = Hubfile(name=name, checksum=checksum, size=len(content), feature_model=feature_model)
+            db.session.add_all([dataset, feature_model, hubfile])
+            db.session.commit()
+            folder = tmp_path / "uploads" / f"user_{user.id}" / f"dataset_{dataset.id}"
+            folder.mkdir(parents=True)
+            (folder / name).write_bytes(content)
+            file_ids[name] = hubfile.id
+            if name == "bench.csv":
+                HubfileStatisticsService().add_statistics({checksum: compute_file_statistics(str(folder / name))})
+                db.session.commit()
+
+    query_string = {"filter": ["Points per game>25", "Age<30"], "columns": "Name,Height,Points per game"}
+
+    # Files without a sidecar are skipped, reported in the last line and indexed in the background
+    response = test_client.get("/file/query", query_string=query_string)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert not [line for line in lines if line.get("file_id") in file_ids.values()]
+    unindexed = {file["file_id"] for file in lines[-1]["unindexed_files"]}
+    assert {file_ids["stars.csv"], file_ids["same.csv"]} <= unindexed
+    assert file_ids["bench.csv"] not in unindexed and file_ids["draft.csv"] not in unindexed
+    assert get_jobs().wait(timeout=10)
+
+    opened = []
+    load = ColumnarSidecarService.load
+    monkeypatch.setattr(
+        ColumnarSidecarService,
+        "load",
+        lambda self, file_path, checksum: opened.append(os.path.basename(file_path)) or load(
+            self, file_path, checksum
+        ),
+    )
+
+    response = test_client.get("/file/query", query_string=query_string)
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    rows = [row for row in rows if row.get("file_id") in file_ids.values()]
+    assert rows == [
+        {
+            "dataset_id": row["dataset_id"],
+            "dataset_doi": f"10.1234/query-{name}",
+            "file_id": file_ids[name],
+            "file": name,
+            "row": 0,
+            "Name": "Doncic",
+            "Height": 201,
+            "Points per game": 33.9,
+        }
+        for row, name in zip(rows, ["stars.csv", "same.csv"])
+    ]
+    # The same content is read once, and the statistics of the bench rule it out without opening it
+    assert opened.count("stars.csv") + opened.count("same.csv") == 1
+    assert "bench.csv" not in opened and "draft.csv" not in opened
+
+    # A file that cannot be read gets an error record, and the other files are still scanned
+    def failing_load(self, file_path, checksum):
+        if os.path.basename(file_path) in ("stars.csv", "same.csv"):
+            raise OSError("Disk error")
+        return load(self, file_path, checksum)
+
+    monkeypatch.setattr(ColumnarSidecarService, "load", failing_load)
+    response = test_client.get("/file/query", query_string={"filter": "Games>=66", "columns": "Name"})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    lines = [line for line in lines if line.get("file_id") in file_ids.values()]
+    errors = {(line["file"], line.get("error")) for line in lines}
+    assert errors == {("stars.csv", "Disk error"), ("same.csv", "Disk error")}
+    monkeypatch.setattr(ColumnarSidecarService, "load", load)
+
+    def get_rows(response):
+        return [row for row in map(json.loads, response.get_data(as_text=True).splitlines()) if "row" in row]
+
+    response = test_client.get("/file/query", query_string={"filter": "Games>=66", "sort": "-Height", "limit": 3})
+    rows = get_rows(response)
+    assert [(row["Name"], row["Height"]) for row in rows] == [("Wemby", 224), ("Wemby", 224), ("James", 206)]
+
+    response = test_client.get("/file/query", query_string={"filter": "Name~wem", "sort": "Name", "limit": 1})
+    assert [row["Rebounds per game"] for row in get_rows(response)] == [10.6]
+
+    response = test_client.get("/file/query", query_string={"filter": "Team=CHI"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Unknown column 'Team'"
@@ -0,0 +1,12 @@
+from app import db
+
+
+class PlatformStatistic(db.Model):
+    __tablename__ = "platform_statistic"
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"PlatformStatistic<{self.name}={self.value}>"
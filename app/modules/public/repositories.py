@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app.modules.comment.models import Comment
+from app.modules.dataset.models import DataSet, DSDownloadRecord, DSMetaData, DSViewRecord
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
+from app.modules.public.models import PlatformStatistic
+from core.repositories.BaseRepository import BaseRepository
+
+
+def _count(model, *conditions, join=None):
+    statement = select(func.count()).select_from(model)
+    if join is not None:
+        statement = statement.join(join)
+    return statement.where(*conditions).scalar_subquery()
+
+
+class PlatformStatisticRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(PlatformStatistic)
+
+    def get_snapshot(self):
+        """
+        Every stored statistic as {name: (value, reconciled_at)}, read with a single query.
+        """
+        rows = self.session.execute(select(self.model.name, self.model.value, self.model.reconciled_at))
+        return {name: (value, reconciled_at) for name, value, reconciled_at in rows}
+
+    def add_values(self, deltas: dict[str, int], connection=None):
+        """
+        Adds deltas[name] to the matching statistics, creating the ones that do not exist yet.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        rows = [{"name": name, "value": delta} for name, delta in deltas.items() if delta]
+        if not rows:
+            return
+
+        if connection.dialect.name == "mysql":
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update(value=table.c.value + statement.inserted.value)
+            connection.execute(statement, rows)
+            return
+
+        # Backends without INSERT ... ON DUPLICATE KEY UPDATE
+        for row in rows:
+            result = connection.execute(
+                update(table).where(table.c.name == row["name"]).values(value=table.c.value + row["value"])
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table), row)
+
+    def count_exact(self, connection=None) -> dict[str, int]:
+        """
+        Counts every statistic from the source tables with a single query.
+        """
+        connection = connection or self.session.connection()
+        counts = {
+            "datasets": _count(DataSet, DSMetaData.dataset_doi.isnot(None), join=DSMetaData),
+            "feature_models": _count(FeatureModel),
+            "parent_comments": _count(Comment, Comment.parent_id.is_(None)),
+            "replies": _count(Comment, Comment.parent_id.isnot(None)),
+            "dataset_downloads": _count(DSDownloadRecord),
+            "dataset_views": _count(DSViewRecord),
+            "feature_model_downloads": _count(HubfileDownloadRecord),
+            "feature_model_views": _count(HubfileViewRecord),
+        }
+        row = connection.execute(select(*[count.label(name) for name, count in counts.items()])).one()
+        return dict(row._mapping)
+
+    def reconcile(self, connection=None) -> dict[str, int]:
+        """
+        Overwrites every statistic with its exact count. The statistic rows are locked before counting, so
+        increments committed meanwhile wait for the new values instead of being lost.
+        """
+        connection = connection or self.session.connection()
+        table = self.model.__table__
+        connection.execute(select(table.c.name).with_for_update()).all()
+
+        counts = self.count_exact(connection=connection)
+        reconciled_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        for name, value in counts.items():
+            result = connection.execute(
+                update(table).where(table.c.name == name).values(value=value, reconciled_at=reconciled_at)
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table), {"name": name, "value": value, "reconciled_at": reconciled_at})
+        return counts
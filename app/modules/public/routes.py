@@ -2,10 +2,8 @@ import logging
 
 from flask import render_template
 
-from app.modules.dataset.services import DataSetService
-from app.modules.featuremodel.services import FeatureModelService
-from app.modules.comment.services import CommentService
 from app.modules.public import public_bp
+from app.modules.public.services import LatestDataSetsService, PlatformStatisticsService
 
 logger = logging.getLogger(__name__)
 
@@ -13,35 +11,18 @@ logger = logging.getLogger(__name__)
 @public_bp.route("/")
 def index():
     logger.info("Access index")
-    dataset_service = DataSetService()
-    feature_model_service = FeatureModelService()
-    comment_service = CommentService()
-
-    # Statistics: total datasets and feature models
-    datasets_counter = dataset_service.count_synchronized_datasets()
-    feature_models_counter = feature_model_service.count_feature_models()
-    
-    # Statistics: total comments
-    parent_comments_counter = comment_service.count_total_parent_comments()
-    replies_counter = comment_service.count_total_replies()
-
-    # Statistics: total downloads
-    total_dataset_downloads = dataset_service.total_dataset_downloads()
-    total_feature_model_downloads = feature_model_service.total_feature_model_downloads()
-
-    # Statistics: total views
-    total_dataset_views = dataset_service.total_dataset_views()
-    total_feature_model_views = feature_model_service.total_feature_model_views()
+    # Statistics: datasets, feature models, comments, downloads and views
+    statistics = PlatformStatisticsService().get_snapshot()
 
     return render_template(
         "public/index.html",
-        datasets=dataset_service.latest_synchronized(),
-        datasets_counter=datasets_counter,
-        parent_comments_counter=parent_comments_counter,
-        replies_counter=replies_counter,
-        feature_models_counter=feature_models_counter,
-        total_dataset_downloads=total_dataset_downloads,
-        total_feature_model_downloads=total_feature_model_downloads,
-        total_dataset_views=total_dataset_views,
-        total_feature_model_views=total_feature_model_views,
+        latest_datasets=LatestDataSetsService().get_html(),
+        datasets_counter=statistics["datasets"],
+        parent_comments_counter=statistics["parent_comments"],
+        replies_counter=statistics["replies"],
+        feature_models_counter=statistics["feature_models"],
+        total_dataset_downloads=statistics["dataset_downloads"],
+        total_feature_model_downloads=statistics["feature_model_downloads"],
+        total_dataset_views=statistics["dataset_views"],
+        total_feature_model_views=statistics["feature_model_views"],
     )
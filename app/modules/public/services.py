@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.modules.comment.models import Comment
+from app.modules.dataset.models import DSDownloadRecord, DSMetaData, DSViewRecord
+from app.modules.dataset.services import DataSetService
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
+from app.modules.public.repositories import PlatformStatisticRepository
+from core.managers.analytics_manager import AnalyticsManager
+from core.managers.job_manager import JobManager, get_jobs
+from core.services.BaseService import BaseService
+
+STATISTICS = (
+    "datasets",
+    "feature_models",
+    "parent_comments",
+    "replies",
+    "dataset_downloads",
+    "dataset_views",
+    "feature_model_downloads",
+    "feature_model_views",
+)
+
+# Statistic counting the rows of each record model
+RECORD_STATISTICS = {
+    FeatureModel: "feature_models",
+    DSDownloadRecord: "dataset_downloads",
+    DSViewRecord: "dataset_views",
+    HubfileDownloadRecord: "feature_model_downloads",
+    HubfileViewRecord: "feature_model_views",
+}
+
+# Statistic counting the rows written by each analytics stream
+STREAM_STATISTICS = {
+    "dataset_download": "dataset_downloads",
+    "dataset_view": "dataset_views",
+    "file_download": "feature_model_downloads",
+    "file_view": "feature_model_views",
+}
+
+
+class PlatformStatisticsService(BaseService):
+    """
+    Platform-wide counters shown on the homepage. They are stored in platform_statistic and updated in the same
+    transaction as the records they count, so reading them is a single small query. Each process keeps the
+    last snapshot in memory for STATS_CACHE_TTL seconds. When the counters are older than
+    STATS_RECONCILE_INTERVAL seconds, a background job recomputes them from the source tables, which fixes any
+    drift (rows removed by ON DELETE CASCADE or by hand, for instance); `rosemary stats:reconcile` does the same
+    on demand.
+    """
+
+    _snapshot = None
+    _snapshot_expires_at = 0.0
+    _snapshot_lock = threading.Lock()
+    _reconcile_queued_at = None
+
+    def __init__(self):
+        super().__init__(PlatformStatisticRepository())
+
+    def get_snapshot(self) -> dict[str, int]:
+        cls = PlatformStatisticsService
+        with cls._snapshot_lock:
+            if cls._snapshot is not None and time.monotonic() < cls._snapshot_expires_at:
+                return cls._snapshot
+
+            stored = self.repository.get_snapshot()
+            if self.needs_reconcile(stored):
+                self.queue_reconcile()
+            # Until the job runs, the stored counters are served as they are
+            snapshot = {name: stored[name][0] if name in stored else 0 for name in STATISTICS}
+
+            cls._snapshot = snapshot
+            cls._snapshot_expires_at = time.monotonic() + current_app.config["STATS_CACHE_TTL"]
+            return snapshot
+
+    def needs_reconcile(self, stored) -> bool:
+        if any(name not in stored for name in STATISTICS):
+            return True
+        interval = current_app.config["STATS_RECONCILE_INTERVAL"]
+        oldest = min((stored[name][1] for name in STATISTICS), key=lambda value: value or datetime.min)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return oldest is None or now - oldest > timedelta(seconds=interval)
+
+    def queue_reconcile(self):
+        """
+        Queues the reconcile job, at most once every STATS_RECONCILE_INTERVAL seconds per process.
+        """
+        cls = PlatformStatisticsService
+        now = time.monotonic()
+        interval = current_app.config["STATS_RECONCILE_INTERVAL"]
+        if cls._reconcile_queued_at is not None and now - cls._reconcile_queued_at < interval:
+            return
+        cls._reconcile_queued_at = now
+        get_jobs().enqueue("reconcile_platform_statistics")
+
+    def reconcile(self) -> dict[str, int]:
+        try:
+            counts = self.repository.reconcile()
+            self.repository.session.commit()
+        except Exception:
+            self.repository.session.rollback()
+            raise
+        PlatformStatisticsService.clear_cache()
+        return counts
+
+    @classmethod
+    def clear_cache(cls):
+        cls._snapshot = None
+        cls._snapshot_expires_at = 0.0
+
+    def get_flush_deltas(self, session) -> Counter:
+        deltas = Counter()
+
+        for sign, instances in ((1, session.new), (-1, session.deleted)):
+            for instance in instances:
+                statistic = RECORD_STATISTICS.get(type(instance))
+                if statistic:
+                    deltas[statistic] += sign
+                elif isinstance(instance, Comment):
+                    deltas["parent_comments" if instance.parent_id is None else "replies"] += sign
+                elif isinstance(instance, DSMetaData) and instance.dataset_doi is not None:
+                    deltas["datasets"] += sign
+
+        # A dataset counts once it is synchronized, that is, once its metadata gets a DOI
+        for instance in session.dirty:
+            if not isinstance(instance, DSMetaData):
+                continue
+            history = get_history(instance, "dataset_doi")
+            if not history.has_changes():
+                continue
+            was_synchronized = any(value is not None for value in history.deleted)
+            is_synchronized = instance.dataset_doi is not None
+            deltas["datasets"] += int(is_synchronized) - int(was_synchronized)
+
+        return deltas
+
+
+class LatestDataSetsService:
+    """
+    The latest synchronized datasets shown on the homepage. The block is rendered once and kept in memory for
+    STATS_CACHE_TTL seconds, like the statistics next to it, and each process drops its copy when it commits a
+    newly synchronized dataset.
+    """
+
+    _html = None
+    _html_expires_at = 0.0
+    _html_lock = threading.Lock()
+
+    def get_html(self) -> Markup:
+        cls = LatestDataSetsService
+        with cls._html_lock:
+            if cls._html is not None and time.monotonic() < cls._html_expires_at:
+                return cls._html
+
+            datasets = DataSetService().latest_synchronized()
+            cls._html = Markup(render_template("public/latest_datasets.html", datasets=datasets))
+            cls._html_expires_at = time.monotonic() + current_app.config["STATS_CACHE_TTL"]
+            return cls._html
+
+    @classmethod
+    def clear_cache(cls):
+        cls._html = None
+        cls._html_expires_at = 0.0
+
+
+def reconcile_platform_statistics():
+    PlatformStatisticsService().reconcile()
+
+
+JobManager.register_task("reconcile_platform_statistics", reconcile_platform_statistics)
+
+
+@event.listens_for(Session, "after_flush")
+def update_platform_statistics(session, flush_context):
+    """
+    Applies the records created or removed by a flush to the platform statistics, in the same transaction.
+    """
+    service = PlatformStatisticsService()
+    deltas = service.get_flush_deltas(session)
+    if any(deltas.values()):
+        service.repository.add_values(deltas, connection=session.connection())
+    if deltas["datasets"]:
+        session.info["latest_datasets_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def clear_latest_datasets(session):
+    if session.info.pop("latest_datasets_changed", False):
+        LatestDataSetsService.clear_cache()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_latest_datasets_change(session):
+    session.info.pop("latest_datasets_changed", None)
+
+
+def count_stream_inserts(statistic):
+    def on_insert(connection, rows):
+        PlatformStatisticRepository().add_values({statistic: len(rows)}, connection=connection)
+
+    return on_insert
+
+
+# The analytics buffer writes its records with plain INSERTs, which do not go through a flush
+for stream_name, statistic_name in STREAM_STATISTICS.items():
+    AnalyticsManager.listen_insert(stream_name, count_stream_inserts(statistic_name))
@@ -0,0 +1,174 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, event, update
+
+from app import db
+from app.modules.auth.models import User
+from app.modules.comment.models import Comment
+from app.modules.dataset.models import DataSet, DSMetaData, DSViewRecord
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.public.models import PlatformStatistic
+from app.modules.public.services import LatestDataSetsService, PlatformStatisticsService
+from core.managers.analytics_manager import get_analytics
+from core.managers.job_manager import get_jobs
+
+
+@pytest.fixture(scope="module")
+def test_client(test_client):
+    with test_client.application.app_context():
+        user = User(email="stats@example.com", password="stats1234")
+        db.session.add(user)
+        db.session.commit()
+        test_client.user_id = user.id
+    yield test_client
+
+
+@pytest.fixture(autouse=True)
+def reconciled_statistics(test_client):
+    PlatformStatisticsService.clear_cache()
+    PlatformStatisticsService().reconcile()
+    yield
+    PlatformStatisticsService.clear_cache()
+
+
+def create_dataset(user_id, title, dataset_doi=None):
+    meta = DSMetaData(
+        title=title,
+        description=f"Description for {title}",
+        publication_type="NONE",
+        publication_doi="",
+        dataset_doi=dataset_doi,
+        tags="stats",
+    )
+    dataset = DataSet(user_id=user_id, ds_meta_data=meta, created_at=datetime.now())
+    db.session.add(dataset)
+    db.session.commit()
+    return dataset
+
+
+def test_statistics_follow_the_records_created(test_client):
+    service = PlatformStatisticsService()
+    before = service.get_snapshot()
+
+    synchronized = create_dataset(test_client.user_id, "Synchronized stats", dataset_doi="10.1234/stats-1")
+    create_dataset(test_client.user_id, "Unsynchronized stats")
+    db.session.add(FeatureModel(data_set_id=synchronized.id))
+    parent = Comment(content="Parent", dataset_id=synchronized.id, user_id=test_client.user_id)
+    db.session.add(parent)
+    db.session.flush()
+    db.session.add(
+        Comment(content="Reply", dataset_id=synchronized.id, user_id=test_client.user_id, parent_id=parent.id)
+    )
+    db.session.add(DSViewRecord(dataset_id=synchronized.id, view_cookie="stats-view"))
+    db.session.commit()
+
+    after = service.get_snapshot()
+    assert after["datasets"] == before["datasets"] + 1
+    assert after["feature_models"] == before["feature_models"] + 1
+    assert after["parent_comments"] == before["parent_comments"] + 1
+    assert after["replies"] == before["replies"] + 1
+    assert after["dataset_views"] == before["dataset_views"] + 1
+    assert after == service.repository.count_exact()
+
+
+def test_dataset_is_counted_once_synchronized(test_client):
+    service = PlatformStatisticsService()
+    dataset = create_dataset(test_client.user_id, "Synchronized later")
+    before = service.get_snapshot()["datasets"]
+
+    dataset.ds_meta_data.dataset_doi = "10.1234/stats-2"
+    db.session.commit()
+
+    assert service.get_snapshot()["datasets"] == before + 1
+
+
+def test_buffered_analytics_records_update_statistics(test_client):
+    service = PlatformStatisticsService()
+    dataset = create_dataset(test_client.user_id, "Viewed stats", dataset_doi="10.1234/stats-3")
+    before = service.get_snapshot()["dataset_views"]
+
+    get_analytics().record(
+        "dataset_view", user_id=None, dataset_id=dataset.id, view_date=datetime.now(), view_cookie="buffered-view"
+    )
+
+    assert service.get_snapshot()["dataset_views"] == before + 1
+
+
+def test_reconcile_fixes_drift(test_client):
+    service = PlatformStatisticsService()
+    dataset = create_dataset(test_client.user_id, "Drifting stats", dataset_doi="10.1234/stats-4")
+    db.session.add(DSViewRecord(dataset_id=dataset.id, view_cookie="drift-view"))
+    db.session.commit()
+
+    # Bulk deletes do not go through a flush, so the counters drift until the next reconcile
+    db.session.execute(delete(DSViewRecord).where(DSViewRecord.view_cookie == "drift-view"))
+    db.session.commit()
+    assert service.get_snapshot()["dataset_views"] == service.repository.count_exact()["dataset_views"] + 1
+
+    assert service.reconcile() == service.repository.count_exact()
+    assert service.get_snapshot() == service.repository.count_exact()
+
+
+def test_snapshot_is_served_from_memory_until_it_expires(test_client, monkeypatch):
+    monkeypatch.setitem(test_client.application.config, "STATS_CACHE_TTL", 3600)
+    service = PlatformStatisticsService()
+    snapshot = service.get_snapshot()
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert service.get_snapshot() == snapshot
+        response = test_client.get("/")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response.status_code == 200
+    assert f"{snapshot['datasets']} datasets".encode() in response.data
+    assert not [statement for statement in statements if "platform_statistic" in statement]
+
+
+def test_stale_statistics_are_reconciled_by_a_job(test_client):
+    service = PlatformStatisticsService()
+    dataset = create_dataset(test_client.user_id, "Reconciled by a job", dataset_doi="10.1234/stats-5")
+    db.session.add(DSViewRecord(dataset_id=dataset.id, view_cookie="job-view"))
+    db.session.commit()
+    db.session.execute(delete(DSViewRecord).where(DSViewRecord.view_cookie == "job-view"))
+    db.session.execute(update(PlatformStatistic).values(reconciled_at=datetime(2000, 1, 1)))
+    db.session.commit()
+    drifted = service.repository.count_exact()["dataset_views"] + 1
+
+    PlatformStatisticsService._reconcile_queued_at = None
+    # The request serves the stored counters and leaves the counting to the job
+    assert service.get_snapshot()["dataset_views"] == drifted
+    assert get_jobs().wait(timeout=10)
+
+    PlatformStatisticsService.clear_cache()
+    assert service.get_snapshot() == service.repository.count_exact()
+
+
+def test_latest_datasets_are_rendered_once_until_a_dataset_is_synchronized(test_client, monkeypatch):
+    monkeypatch.setitem(test_client.application.config, "STATS_CACHE_TTL", 3600)
+    LatestDataSetsService.clear_cache()
+    test_client.get("/")
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = test_client.get("/")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    assert not [statement for statement in statements if "ds_meta_data" in statement]
+
+    create_dataset(test_client.user_id, "Newly synchronized", dataset_doi="10.1234/stats-6")
+    assert b"Newly synchronized" in test_client.get("/").data
+    LatestDataSetsService.clear_cache()
@@ -0,0 +1,190 @@
+import atexit
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import insert, or_, select
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsStream:
+    """
+    A kind of analytics event (a dataset view, a file download...) stored as rows of `model`. Two events with the
+    same values in `key_columns` are the same event and are only stored once. Every `on_insert(connection, rows)`
+    listener runs in the same transaction as the insert, with the rows that were actually new.
+    """
+
+    def __init__(self, model, key_columns):
+        self.model = model
+        self.key_columns = key_columns
+
+    def key(self, row):
+        return tuple(row[column] for column in self.key_columns)
+
+    def existing_keys(self, connection, rows):
+        """
+        Keys of the given rows already stored, looked up with a single query for the whole batch.
+        """
+        conditions = []
+        for column in self.key_columns:
+            values = {row[column] for row in rows}
+            model_column = getattr(self.model, column)
+            condition = model_column.in_(values - {None})
+            if None in values:
+                condition = or_(condition, model_column.is_(None))
+            conditions.append(condition)
+
+        key_attributes = [getattr(self.model, column) for column in self.key_columns]
+        return {tuple(stored) for stored in connection.execute(select(*key_attributes).where(*conditions))}
+
+
+class AnalyticsManager:
+    """
+    Write-behind buffer for view and download records. Events are deduplicated in memory and written by a
+    background thread with one multi-row INSERT per stream, every ANALYTICS_FLUSH_INTERVAL seconds or as soon
+    as ANALYTICS_FLUSH_SIZE events are pending, and once more when the process exits. With
+    ANALYTICS_WRITE_BEHIND disabled every event is written right away, in the request that records it. Events
+    are written through their own connection, never the session of the request, and the events of a failed
+    write are kept for the next flush, up to ANALYTICS_MAX_PENDING events.
+    """
+
+    streams = {}
+    insert_listeners = {}
+
+    def __init__(self, app):
+        self.app = app
+        self.write_behind = app.config["ANALYTICS_WRITE_BEHIND"]
+        self.flush_interval = app.config["ANALYTICS_FLUSH_INTERVAL"]
+        self.flush_size = app.config["ANALYTICS_FLUSH_SIZE"]
+        self.recent_keys_size = app.config["ANALYTICS_RECENT_KEYS"]
+        self.max_pending = app.config["ANALYTICS_MAX_PENDING"]
+
+        self._pending = {}
+        self._pending_count = 0
+        self._recent_keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+
+    @classmethod
+    def register_stream(cls, name, model, key_columns, on_insert=None):
+        cls.streams[name] = AnalyticsStream(model, key_columns)
+        if on_insert:
+            cls.listen_insert(name, on_insert)
+
+    @classmethod
+    def listen_insert(cls, name, on_insert):
+        """
+        Adds a listener for the rows inserted in a stream. The stream does not need to be registered yet.
+        """
+        cls.insert_listeners.setdefault(name, []).append(on_insert)
+
+    def setup_analytics(self):
+        self.app.extensions["analytics"] = self
+        atexit.register(self.flush)
+
+    def record(self, name, **row) -> bool:
+        """
+        Queues an event. Returns False when the same event is already pending or was recently written.
+        """
+        key = (name, AnalyticsManager.streams[name].key(row))
+
+        with self._lock:
+            if key in self._recent_keys or key in self._pending.get(name, {}):
+                return False
+            self._pending.setdefault(name, {})[key] = row
+            self._pending_count += 1
+            pending_count = self._pending_count
+
+        if not self.write_behind:
+            self.flush()
+        else:
+            self._ensure_worker()
+            if pending_count >= self.flush_size:
+                self._flush_requested.set()
+        return True
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_count = self._pending, {}, 0
+            if not pending:
+                return
+
+            if has_app_context() and current_app._get_current_object() is self.app:
+                self._write(pending)
+            else:
+                with self.app.app_context():
+                    self._write(pending)
+
+    def _write(self, pending):
+        from app import db
+
+        try:
+            with db.engine.begin() as connection:
+                for name, rows_by_key in pending.items():
+                    stream = AnalyticsManager.streams[name]
+                    rows = list(rows_by_key.values())
+                    existing_keys = stream.existing_keys(connection, rows)
+                    new_rows = [row for row in rows if stream.key(row) not in existing_keys]
+                    if new_rows:
+                        connection.execute(insert(stream.model), new_rows)
+                        for on_insert in AnalyticsManager.insert_listeners.get(name, []):
+                            on_insert(connection, new_rows)
+        except Exception:
+            logger.exception("Error writing %s analytics events", sum(len(rows) for rows in pending.values()))
+            self._requeue(pending)
+            return
+
+        with self._lock:
+            for rows_by_key in pending.values():
+                for key in rows_by_key:
+                    self._recent_keys[key] = None
+            while len(self._recent_keys) > self.recent_keys_size:
+                self._recent_keys.popitem(last=False)
+
+    def _requeue(self, pending):
+        """
+        Puts the events of a failed write back in the buffer, behind the ones recorded since, so the next flush
+        retries them. Events that do not fit in ANALYTICS_MAX_PENDING are dropped.
+        """
+        dropped = 0
+        with self._lock:
+            for name, rows_by_key in pending.items():
+                stream_pending = self._pending.setdefault(name, {})
+                for key, row in rows_by_key.items():
+                    if key in stream_pending:
+                        continue
+                    if self._pending_count >= self.max_pending:
+                        dropped += 1
+                        continue
+                    stream_pending[key] = row
+                    self._pending_count += 1
+        if dropped:
+            logger.warning("Dropped %s analytics events, the buffer is full", dropped)
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(timeout=self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+
+def get_analytics() -> AnalyticsManager:
+    return current_app.extensions["analytics"]
@@ -1,5 +1,6 @@
 import os
 import secrets
+import tempfile
 
 
 class ConfigManager:
@@ -33,6 +34,63 @@ class Config:
     TIMEZONE = "Europe/Madrid"
     TEMPLATES_AUTO_RELOAD = True
     UPLOAD_FOLDER = "uploads"
+    # Chunked uploads: chunk size when the client does not choose one, and limits
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024**2))
+    UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024**2))
+    UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 4 * 1024**3))
+    # Seconds without a chunk after which an unfinished upload is removed
+    UPLOAD_EXPIRY = int(os.getenv("UPLOAD_EXPIRY", 24 * 3600))
+    ARCHIVE_CACHE_DIR = os.getenv(
+        "ARCHIVE_CACHE_DIR",
+        os.path.join(os.getenv("WORKING_DIR", ""), os.getenv("UPLOADS_DIR", "uploads"), "archive_cache"),
+    )
+    ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("ARCHIVE_CACHE_MAX_BYTES", 2 * 1024**3))
+    SIMILARITY_INDEX_DIR = os.getenv(
+        "SIMILARITY_INDEX_DIR",
+        os.path.join(os.getenv("WORKING_DIR", ""), os.getenv("UPLOADS_DIR", "uploads"), "similarity_index"),
+    )
+    # Content addressed store the files of every dataset are hardlinked to
+    BLOB_STORE_DIR = os.getenv(
+        "BLOB_STORE_DIR", os.path.join(os.getenv("WORKING_DIR", ""), os.getenv("UPLOADS_DIR", "uploads"), "blobs")
+    )
+    # Row offsets of the CSV files shown in the file viewer, one sidecar per checksum
+    PREVIEW_INDEX_DIR = os.getenv(
+        "PREVIEW_INDEX_DIR",
+        os.path.join(os.getenv("WORKING_DIR", ""), os.getenv("UPLOADS_DIR", "uploads"), "preview_index"),
+    )
+    # Columnar copies of the CSV files for analytical reads, one sidecar per checksum
+    COLUMNAR_DIR = os.getenv(
+        "COLUMNAR_DIR",
+        os.path.join(os.getenv("WORKING_DIR", ""), os.getenv("UPLOADS_DIR", "uploads"), "columnar"),
+    )
+    # Add newly published datasets to the "more like this" index right after the commit that publishes them
+    SIMILARITY_INDEX_INCREMENTAL = os.getenv("SIMILARITY_INDEX_INCREMENTAL", "true").lower() == "true"
+    # Segments the added datasets may be spread over before they are merged into a new version of the index
+    SIMILARITY_MAX_SEGMENTS = int(os.getenv("SIMILARITY_MAX_SEGMENTS", 16))
+    # "local" sends download bodies from the worker, "x-accel" hands them over to nginx
+    DOWNLOAD_DELIVERY = os.getenv("DOWNLOAD_DELIVERY", "local")
+    X_ACCEL_UPLOADS_LOCATION = os.getenv("X_ACCEL_UPLOADS_LOCATION", "/protected-uploads/")
+    ANALYTICS_WRITE_BEHIND = os.getenv("ANALYTICS_WRITE_BEHIND", "true").lower() == "true"
+    ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 5))
+    ANALYTICS_FLUSH_SIZE = int(os.getenv("ANALYTICS_FLUSH_SIZE", 500))
+    ANALYTICS_RECENT_KEYS = int(os.getenv("ANALYTICS_RECENT_KEYS", 100000))
+    # Events kept for a retry when writing them fails
+    ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", 10000))
+    STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", 60))
+    # "thread" runs background jobs in the web process, which loses them on a restart, so it is only the default
+    # for development. "rq" sends them to Redis for a job worker
+    JOB_QUEUE_BACKEND = os.getenv(
+        "JOB_QUEUE_BACKEND", "thread" if os.getenv("FLASK_ENV", "development") in ("development", "testing") else "rq"
+    )
+    JOB_QUEUE_NAME = os.getenv("JOB_QUEUE_NAME", "nbahub")
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+    JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 5))
+    # Jobs queued, running or retrying for longer than this many seconds were lost and are queued again, by the
+    # job worker when it starts and then every JOB_SWEEP_INTERVAL seconds
+    JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 900))
+    JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", 300))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", 3600))
 
 
 class DevelopmentConfig(Config):
@@ -49,6 +107,16 @@ class TestingConfig(Config):
         f"{os.getenv('MARIADB_TEST_DATABASE', 'default_db')}"
     )
     WTF_CSRF_ENABLED = False
+    ARCHIVE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "nbahub_test_archive_cache")
+    SIMILARITY_INDEX_DIR = os.path.join(tempfile.gettempdir(), "nbahub_test_similarity_index")
+    PREVIEW_INDEX_DIR = os.path.join(tempfile.gettempdir(), "nbahub_test_preview_index")
+    BLOB_STORE_DIR = os.path.join(tempfile.gettempdir(), "nbahub_test_blobs")
+    COLUMNAR_DIR = os.path.join(tempfile.gettempdir(), "nbahub_test_columnar")
+    ANALYTICS_WRITE_BEHIND = False
+    ANALYTICS_RECENT_KEYS = 0
+    STATS_CACHE_TTL = 0
+    JOB_QUEUE_BACKEND = "thread"
+    JOB_RETRY_BACKOFF = 0
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,225 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two looks at the rq queue while waiting for it to empty
+RQ_WAIT_POLL_INTERVAL = 0.2
+
+
+class ThreadJobBackend:
+    """
+    Runs the jobs in a worker thread of the same process. Meant for tests and development: queued jobs are
+    lost when the process exits.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def enqueue(self, name, args):
+        with self._idle:
+            self._pending += 1
+        self._ensure_worker()
+        self._queue.put((name, args, 1))
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Waits until every queued job, retries included, has finished. Returns False on timeout.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="job-worker", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            name, args, attempt = self._queue.get()
+            try:
+                self.manager.run(name, args)
+            except Exception:
+                delays = self.manager.get_retry_delays()
+                if attempt <= len(delays):
+                    logger.warning("Job %s%s failed, retry %s in %ss", name, args, attempt, delays[attempt - 1])
+                    timer = threading.Timer(delays[attempt - 1], self._queue.put, args=((name, args, attempt + 1),))
+                    timer.daemon = True
+                    timer.start()
+                    continue
+                logger.exception("Job %s%s failed after %s attempts", name, args, attempt)
+
+            with self._idle:
+                self._pending -= 1
+                self._idle.notify_all()
+
+
+class RqJobBackend:
+    """
+    Sends the jobs to an rq queue in Redis, run by `rosemary jobs:worker`. Retries are scheduled by rq, so the
+    worker has to run with its scheduler.
+    """
+
+    def __init__(self, manager):
+        from redis import Redis
+        from rq import Queue
+
+        self.manager = manager
+        self.queue = Queue(
+            manager.app.config["JOB_QUEUE_NAME"], connection=Redis.from_url(manager.app.config["REDIS_URL"])
+        )
+
+    def enqueue(self, name, args):
+        from rq import Retry
+
+        delays = self.manager.get_retry_delays()
+        retry = Retry(max=len(delays), interval=delays) if delays else None
+        self.queue.enqueue(run_rq_job, name, list(args), retry=retry)
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Waits until the queue has no job waiting, running or scheduled for a retry, polling Redis since the jobs
+        run in other processes. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.count or self.queue.started_job_registry.count or self.queue.scheduled_job_registry.count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(RQ_WAIT_POLL_INTERVAL)
+        return True
+
+
+JOB_BACKENDS = {
+    "thread": ThreadJobBackend,
+    "rq": RqJobBackend,
+}
+
+
+class JobManager:
+    """
+    Background jobs, for work that does not have to finish before the response is sent. Tasks are registered by
+    name with `register_task` and queued with `enqueue(name, *args)`, so only the name and the (JSON friendly)
+    arguments travel through the queue. A task that raises is run again up to JOB_MAX_ATTEMPTS times in total,
+    waiting JOB_RETRY_BACKOFF seconds before the first retry and twice as long before each of the next ones, so
+    tasks must be safe to run more than once. JOB_QUEUE_BACKEND selects where the jobs run.
+
+    Tasks that keep the state of their jobs in the database can also register a recovery, which queues again
+    the jobs that a restart left queued, running or retrying for longer than JOB_STALE_AFTER seconds.
+    """
+
+    tasks = {}
+    recoveries = {}
+
+    def __init__(self, app):
+        self.app = app
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.retry_backoff = app.config["JOB_RETRY_BACKOFF"]
+        self.stale_after = app.config["JOB_STALE_AFTER"]
+        self.backend = JOB_BACKENDS[app.config["JOB_QUEUE_BACKEND"]](self)
+
+    @classmethod
+    def register_task(cls, name, task):
+        cls.tasks[name] = task
+
+    @classmethod
+    def register_recovery(cls, name, recover):
+        """
+        `recover(stale_after)` queues again the lost jobs of task `name` and returns how many.
+        """
+        cls.recoveries[name] = recover
+
+    def setup_jobs(self):
+        self.app.extensions["jobs"] = self
+
+    def enqueue(self, name, *args):
+        if name not in JobManager.tasks:
+            raise KeyError(f"Unknown task: {name}")
+        self.backend.enqueue(name, args)
+
+    def wait(self, timeout=None) -> bool:
+        return self.backend.wait(timeout)
+
+    def recover_stale(self) -> int:
+        """
+        Queues again the jobs lost by a restart, for every task with a recovery, and returns how many.
+        """
+        recovered = 0
+        with self.app.app_context():
+            for name, recover in JobManager.recoveries.items():
+                try:
+                    recovered += recover(self.stale_after)
+                except Exception:
+                    logger.exception("Recovering the stale %s jobs failed", name)
+        if recovered:
+            logger.warning("Queued %s stale jobs again", recovered)
+        return recovered
+
+    def get_retry_delays(self) -> list[float]:
+        return [self.retry_backoff * 2**retry for retry in range(self.max_attempts - 1)]
+
+    def run(self, name, args):
+        if has_app_context() and current_app._get_current_object() is self.app:
+            JobManager.tasks[name](*args)
+        else:
+            with self.app.app_context():
+                JobManager.tasks[name](*args)
+
+
+def run_rq_job(name, args):
+    """
+    Entry point of the jobs run by rq workers.
+    """
+    if has_app_context():
+        get_jobs().run(name, args)
+        return
+
+    from app import app
+
+    app.extensions["jobs"].run(name, args)
+
+
+def run_worker(app, burst=False):
+    """
+    Runs the jobs queued in Redis until stopped, or until the queue is empty with `burst`. The jobs lost by a
+    restart are queued again first and, while the worker runs, every JOB_SWEEP_INTERVAL seconds.
+    """
+    from redis import Redis
+    from rq import Queue, Worker
+
+    manager = app.extensions["jobs"]
+    connection = Redis.from_url(app.config["REDIS_URL"])
+    queue = Queue(app.config["JOB_QUEUE_NAME"], connection=connection)
+
+    manager.recover_stale()
+    if not burst:
+
+        def sweep():
+            while True:
+                time.sleep(app.config["JOB_SWEEP_INTERVAL"])
+                manager.recover_stale()
+
+        threading.Thread(target=sweep, name="job-sweeper", daemon=True).start()
+
+    # The scheduler moves the retried jobs back to the queue once their backoff expires
+    Worker([queue], connection=connection).work(burst=burst, with_scheduler=True)
+
+
+def get_jobs() -> JobManager:
+    return current_app.extensions["jobs"]
@@ -0,0 +1,77 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_file
+from werkzeug.http import dump_options_header
+
+from core.configuration.configuration import uploads_folder_name
+
+
+class FileDeliveryService:
+    """
+    Sends files stored under the uploads folder. With DOWNLOAD_DELIVERY set to "x-accel" the route only returns
+    the headers and nginx sends the body from its internal location, ranges and conditional requests included.
+    Otherwise (the default) the worker sends the file itself.
+    """
+
+    def __init__(self):
+        self.delivery = current_app.config["DOWNLOAD_DELIVERY"]
+        self.x_accel_location = current_app.config["X_ACCEL_UPLOADS_LOCATION"]
+
+    def send(self, path, download_name, mimetype=None, etag=None, last_modified=None):
+        relative_path = self.get_relative_upload_path(path)
+
+        if self.delivery == "x-accel" and relative_path is not None:
+            response = Response(mimetype=mimetype or mimetypes.guess_type(download_name)[0])
+            response.headers["X-Accel-Redirect"] = self.x_accel_location.rstrip("/") + "/" + quote(relative_path)
+            response.headers["Content-Disposition"] = self.get_content_disposition(download_name)
+            # The validators the worker would have sent, so revalidation does not depend on the nginx config
+            if etag is not None:
+                response.set_etag(etag)
+            response.last_modified = last_modified or os.path.getmtime(path)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                del response.headers["X-Accel-Redirect"]
+            return response
+
+        return send_file(
+            os.path.abspath(path),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            etag=etag if etag is not None else True,
+            last_modified=last_modified,
+        )
+
+    @staticmethod
+    def is_download(response) -> bool:
+        """
+        Whether the response sends the file from its first byte: a full 200 or a range that starts at byte 0.
+        Revalidations (304) and ranges resuming an interrupted download are not new downloads.
+        """
+        if response.status_code not in (200, 206):
+            return False
+        byte_range = request.range
+        # nginx answers the ranges of the responses it is handed over
+        if response.status_code == 200 and "X-Accel-Redirect" not in response.headers:
+            return True
+        return byte_range is None or byte_range.ranges[0][0] == 0
+
+    def get_relative_upload_path(self, path):
+        """
+        Path of the file relative to the uploads folder, or None when it lives somewhere else.
+        """
+        uploads_dir = os.path.abspath(os.path.join(os.getenv("WORKING_DIR", ""), uploads_folder_name()))
+        relative_path = os.path.relpath(os.path.abspath(path), uploads_dir)
+        if relative_path.startswith(os.pardir):
+            return None
+        return relative_path.replace(os.sep, "/")
+
+    @staticmethod
+    def get_content_disposition(download_name):
+        try:
+            download_name.encode("ascii")
+            return dump_options_header("attachment", {"filename": download_name})
+        except UnicodeEncodeError:
+            return dump_options_header("attachment", {"filename*": f"UTF-8''{quote(download_name)}"})
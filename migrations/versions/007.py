@@ -0,0 +1,42 @@
+"""add inverted search index for explore
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_index_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('dataset_id', sa.Integer(), nullable=False),
+    sa.Column('field', sa.String(length=32), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['dataset_id'], ['data_set.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('search_index_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_search_index_entry_token_dataset', ['token', 'dataset_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_search_index_entry_dataset_id'), ['dataset_id'], unique=False)
+
+    # The index is maintained on every flush from now on. The datasets that already exist are indexed by
+    # `rosemary explore:reindex`, which has to be run once after this upgrade on a non-empty database.
+
+
+def downgrade():
+    with op.batch_alter_table('search_index_entry', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_index_entry_dataset_id'))
+        batch_op.drop_index('ix_search_index_entry_token_dataset')
+
+    op.drop_table('search_index_entry')
@@ -0,0 +1,42 @@
+"""add daily download counters for trending
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ds_download_daily_count',
+    sa.Column('dataset_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['dataset_id'], ['data_set.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('dataset_id', 'day')
+    )
+    with op.batch_alter_table('ds_download_daily_count', schema=None) as batch_op:
+        batch_op.create_index('ix_ds_download_daily_count_day_dataset', ['day', 'dataset_id'], unique=False)
+
+    # Backfill from the download records recorded so far
+    op.execute(
+        "INSERT INTO ds_download_daily_count (dataset_id, day, count) "
+        "SELECT dataset_id, DATE(download_date), COUNT(id) FROM ds_download_record "
+        "WHERE dataset_id IS NOT NULL GROUP BY dataset_id, DATE(download_date)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('ds_download_daily_count', schema=None) as batch_op:
+        batch_op.drop_index('ix_ds_download_daily_count_day_dataset')
+
+    op.drop_table('ds_download_daily_count')
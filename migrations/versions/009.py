@@ -0,0 +1,43 @@
+"""add materialized platform statistics
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('platform_statistic',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Backfill with the exact counts
+    op.execute(
+        "INSERT INTO platform_statistic (name, value, reconciled_at) "
+        "SELECT 'datasets', COUNT(data_set.id), UTC_TIMESTAMP() FROM data_set "
+        "JOIN ds_meta_data ON ds_meta_data.id = data_set.ds_meta_data_id WHERE ds_meta_data.dataset_doi IS NOT NULL "
+        "UNION ALL SELECT 'feature_models', COUNT(id), UTC_TIMESTAMP() FROM feature_model "
+        "UNION ALL SELECT 'parent_comments', COUNT(id), UTC_TIMESTAMP() FROM comment WHERE parent_id IS NULL "
+        "UNION ALL SELECT 'replies', COUNT(id), UTC_TIMESTAMP() FROM comment WHERE parent_id IS NOT NULL "
+        "UNION ALL SELECT 'dataset_downloads', COUNT(id), UTC_TIMESTAMP() FROM ds_download_record "
+        "UNION ALL SELECT 'dataset_views', COUNT(id), UTC_TIMESTAMP() FROM ds_view_record "
+        "UNION ALL SELECT 'feature_model_downloads', COUNT(id), UTC_TIMESTAMP() FROM file_download_record "
+        "UNION ALL SELECT 'feature_model_views', COUNT(id), UTC_TIMESTAMP() FROM file_view_record"
+    )
+
+
+def downgrade():
+    op.drop_table('platform_statistic')
@@ -0,0 +1,55 @@
+"""add precomputed related datasets
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ds_related_feature',
+    sa.Column('dataset_id', sa.Integer(), nullable=False),
+    sa.Column('feature', sa.String(length=128), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['dataset_id'], ['data_set.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('dataset_id', 'feature')
+    )
+    with op.batch_alter_table('ds_related_feature', schema=None) as batch_op:
+        batch_op.create_index('ix_ds_related_feature_feature_dataset', ['feature', 'dataset_id'], unique=False)
+
+    op.create_table('ds_neighbor',
+    sa.Column('dataset_id', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['dataset_id'], ['data_set.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['data_set.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('dataset_id', 'neighbor_id')
+    )
+    with op.batch_alter_table('ds_neighbor', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ds_neighbor_neighbor_id'), ['neighbor_id'], unique=False)
+
+    # The neighbors are maintained on every flush from now on. The ones of the datasets that already exist are
+    # computed by `rosemary dataset:rebuild-related`, which has to be run once after this upgrade on a non-empty
+    # database.
+
+
+def downgrade():
+    with op.batch_alter_table('ds_neighbor', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ds_neighbor_neighbor_id'))
+
+    op.drop_table('ds_neighbor')
+
+    with op.batch_alter_table('ds_related_feature', schema=None) as batch_op:
+        batch_op.drop_index('ix_ds_related_feature_feature_dataset')
+
+    op.drop_table('ds_related_feature')
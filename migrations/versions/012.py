@@ -0,0 +1,35 @@
+"""add content addressed file blobs
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_blob',
+    sa.Column('checksum', sa.String(length=120), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum')
+    )
+
+    # The files themselves are moved into the store by `rosemary hubfile:dedup`
+    op.execute(
+        "INSERT INTO file_blob (checksum, size, ref_count) "
+        "SELECT checksum, MAX(size), COUNT(*) FROM file GROUP BY checksum"
+    )
+
+
+def downgrade():
+    op.drop_table('file_blob')
@@ -0,0 +1,33 @@
+"""add csv validation results
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('csv_validation_result',
+    sa.Column('checksum', sa.String(length=120), nullable=False),
+    sa.Column('validator_version', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('valid', sa.Boolean(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('error_count', sa.Integer(), nullable=False),
+    sa.Column('report', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum', 'validator_version')
+    )
+
+
+def downgrade():
+    op.drop_table('csv_validation_result')
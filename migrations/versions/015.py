@@ -0,0 +1,36 @@
+"""add file column statistics
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_column_statistics',
+    sa.Column('checksum', sa.String(length=120), nullable=False),
+    sa.Column('column_name', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('nulls', sa.Integer(), nullable=False),
+    sa.Column('minimum', sa.Double(), nullable=True),
+    sa.Column('maximum', sa.Double(), nullable=True),
+    sa.Column('mean', sa.Double(), nullable=True),
+    sa.Column('std', sa.Double(), nullable=True),
+    sa.Column('quantiles', sa.LargeBinary(), nullable=False),
+    sa.Column('histogram', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum', 'column_name')
+    )
+
+
+def downgrade():
+    op.drop_table('file_column_statistics')
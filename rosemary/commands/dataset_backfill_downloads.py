@@ -0,0 +1,19 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "dataset:backfill-downloads",
+    help="Rebuilds the daily download counters used by trending from the raw download records.",
+)
+@with_appcontext
+def dataset_backfill_downloads():
+    from app.modules.dataset.repositories import DSDownloadDailyCountRepository
+
+    click.echo(click.style("Rebuilding the daily download counters...", fg="yellow"))
+    try:
+        buckets = DSDownloadDailyCountRepository().rebuild()
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the daily download counters: {e}", fg="red"))
+        return
+    click.echo(click.style(f"Daily download counters rebuilt: {buckets} buckets.", fg="green"))
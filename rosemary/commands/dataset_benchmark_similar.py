@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+
+def synthetic_documents(count, vocabulary_size, rng):
+    """
+    Tokenized documents whose words follow a Zipf distribution, like titles and descriptions do.
+    """
+    lengths = rng.integers(20, 80, size=count)
+    words = (rng.zipf(1.3, size=int(lengths.sum())) - 1) % vocabulary_size
+    documents, start = [], 0
+    for length in lengths:
+        documents.append([f"w{word}" for word in words[start:start + length]])
+        start += length
+    return documents
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+@click.command(
+    "dataset:benchmark-similar",
+    help="Measures build time and memory of the 'more like this' index on synthetic datasets.",
+)
+@click.option("--sizes", default="10000,100000", show_default=True, help="Comma separated numbers of datasets.")
+@click.option("--vocabulary", default=50000, show_default=True, help="Number of distinct words.")
+@click.option("--added", default=100, show_default=True, help="Datasets appended incrementally after the build.")
+@click.option("--seed", default=0, show_default=True)
+def dataset_benchmark_similar(sizes, vocabulary, added, seed):
+    import numpy as np
+
+    from app.modules.dataset.similarity import ContentSimilarityIndex
+
+    rng = np.random.default_rng(seed)
+    for size in [int(size) for size in sizes.split(",")]:
+        click.echo(click.style(f"{size} datasets", fg="yellow"))
+        documents = synthetic_documents(size + added, vocabulary, rng)
+        dataset_ids = list(range(1, size + added + 1))
+
+        index, elapsed, peak = measure(lambda: ContentSimilarityIndex.build(dataset_ids[:size], documents[:size]))
+        click.echo(f"  build: {elapsed:.2f}s, peak memory {peak / 1024**2:.1f} MiB")
+
+        index, elapsed, peak = measure(lambda: index.add(dataset_ids[size:], documents[size:]))
+        click.echo(f"  add {added}: {elapsed:.2f}s, peak memory {peak / 1024**2:.1f} MiB")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = index.save(directory)
+            on_disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            segment = ContentSimilarityIndex.load(path).segments[0]
+            served = segment.neighbors.nbytes + segment.scores.nbytes + segment.dataset_ids.nbytes
+            loaded = ContentSimilarityIndex.load(path)
+            start = time.perf_counter()
+            for dataset_id in dataset_ids[:1000]:
+                loaded.similar(dataset_id)
+            lookup = (time.perf_counter() - start) / min(size, 1000)
+        click.echo(
+            f"  index: {on_disk / 1024**2:.1f} MiB on disk, {served / 1024**2:.1f} MiB read when serving, "
+            f"{lookup * 1e6:.1f}us per lookup"
+        )
@@ -0,0 +1,23 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "dataset:build-similar",
+    help="Builds the TF-IDF index behind the 'more like this' recommendations of the dataset pages.",
+)
+@with_appcontext
+def dataset_build_similar():
+    from app.modules.dataset.services import ContentSimilarityService
+
+    click.echo(click.style("Building the similarity index...", fg="yellow"))
+    start = time.perf_counter()
+    try:
+        indexed = ContentSimilarityService().build()
+    except Exception as e:
+        click.echo(click.style(f"Error building the similarity index: {e}", fg="red"))
+        return
+    elapsed = time.perf_counter() - start
+    click.echo(click.style(f"Similarity index built for {indexed} datasets in {elapsed:.2f}s.", fg="green"))
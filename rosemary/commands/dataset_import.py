@@ -0,0 +1,65 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from rosemary.progress import format_throughput, make_progress_reporter
+
+
+@click.command(
+    "dataset:import",
+    help="Imports a directory tree of CSV files, one dataset per folder, with batched inserts.",
+)
+@click.argument("root", type=click.Path(exists=True, file_okay=False))
+@click.option("--user-email", required=True, help="Owner of the imported datasets.")
+@click.option(
+    "--publication-type",
+    type=click.Choice(["none", "player", "season", "playoffs", "other"]),
+    default="other",
+    show_default=True,
+)
+@click.option("--tags", default=None, help="Comma separated tags of the datasets and their files.")
+@click.option("--workers", type=int, default=None, help="Processes hashing and parsing files. Defaults to the CPUs.")
+@click.option("--batch-size", type=int, default=100, show_default=True, help="Datasets inserted per transaction.")
+@click.option("--publish", is_flag=True, help="Queue the publication of the imported datasets.")
+@with_appcontext
+def dataset_import(root, user_email, publication_type, tags, workers, batch_size, publish):
+    from app.modules.auth.repositories import UserRepository
+    from app.modules.dataset.models import PublicationType
+    from app.modules.dataset.services import DataSetImportService, DataSetPublishService, DataSetService
+    from core.managers.job_manager import get_jobs
+
+    user = UserRepository().get_by_email(user_email)
+    if user is None:
+        click.echo(click.style(f"No user with email {user_email}.", fg="red"))
+        return
+
+    report = make_progress_reporter()
+
+    click.echo(click.style(f"Importing datasets from {root}...", fg="yellow"))
+    try:
+        result = DataSetImportService(workers=workers, batch_size=batch_size).import_tree(
+            root, user, publication_type=PublicationType(publication_type), tags=tags, progress=report
+        )
+    except Exception as e:
+        click.echo(click.style(f"Error importing datasets: {e}", fg="red"))
+        return
+
+    if result["invalid_files"]:
+        click.echo(click.style(f"{result['invalid_files']} files do not pass the CSV validation.", fg="yellow"))
+    click.echo(
+        click.style(
+            f"{result['datasets']} datasets with {result['files']} files ({result['rows']} rows) imported in "
+            f"{result['seconds']:.2f}s: {format_throughput(result)}.",
+            fg="green",
+        )
+    )
+
+    if publish and result["dataset_ids"]:
+        publish_service, dataset_service = DataSetPublishService(), DataSetService()
+        for dataset_id in result["dataset_ids"]:
+            publish_service.enqueue(dataset_service.get_by_id(dataset_id))
+        # Jobs of the thread backend would die with this process
+        if current_app.config["JOB_QUEUE_BACKEND"] == "thread":
+            click.echo(click.style("Publishing the imported datasets...", fg="yellow"))
+            get_jobs().wait()
+        click.echo(click.style(f"Publication of {len(result['dataset_ids'])} datasets queued.", fg="green"))
@@ -0,0 +1,19 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "dataset:rebuild-related",
+    help="Recomputes the related datasets shown on every dataset page from their tags and authors.",
+)
+@with_appcontext
+def dataset_rebuild_related():
+    from app.modules.dataset.services import RelatedDataSetService
+
+    click.echo(click.style("Rebuilding the related datasets...", fg="yellow"))
+    try:
+        rebuilt = RelatedDataSetService().rebuild()
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the related datasets: {e}", fg="red"))
+        return
+    click.echo(click.style(f"Related datasets rebuilt for {rebuilt} datasets.", fg="green"))
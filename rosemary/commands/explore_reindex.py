@@ -0,0 +1,16 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command("explore:reindex", help="Rebuilds the inverted search index used by the explore page.")
+@with_appcontext
+def explore_reindex():
+    from app.modules.explore.services import SearchIndexService
+
+    click.echo(click.style("Rebuilding the search index...", fg="yellow"))
+    try:
+        indexed = SearchIndexService().rebuild()
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the search index: {e}", fg="red"))
+        return
+    click.echo(click.style(f"Search index rebuilt for {indexed} datasets.", fg="green"))
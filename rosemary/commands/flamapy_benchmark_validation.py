@@ -0,0 +1,86 @@
+import csv
+import os
+import tempfile
+import time
+
+import click
+
+
+def write_players_csv(path, rows, invalid_ratio, rng):
+    """
+    A players CSV with `rows` rows, about `invalid_ratio` of them with a wrong cell.
+    """
+    from app.modules.flamapy.validation import EXPECTED_CSV_HEADER
+
+    heights = [f"{meters}m{centimeters:02d}" for meters in (1, 2) for centimeters in range(100)]
+    bad_values = ["", "2,10", "x", "-", "1.2.3"]
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_file.write(",".join(EXPECTED_CSV_HEADER) + "\n")
+        ages, games = rng.integers(19, 41, size=rows), rng.integers(1, 83, size=rows)
+        stats = rng.uniform(0, 35, size=(rows, 3)).round(1)
+        invalid = rng.random(rows) < invalid_ratio
+        for row in range(rows):
+            cells = [
+                f"Player {row}",
+                heights[row % len(heights)],
+                str(ages[row]),
+                str(games[row]),
+                str(stats[row, 0]),
+                str(stats[row, 1]),
+                str(stats[row, 2]),
+            ]
+            if invalid[row]:
+                cells[1 + row % 6] = bad_values[row % len(bad_values)].replace(",", "")
+            csv_file.write(",".join(cells) + "\n")
+
+
+def validate_row_by_row(path):
+    """
+    The validation check_csv used to run: the csv module and a check per cell.
+    """
+    from app.modules.flamapy.validation import CsvValidator, ValidationReport
+
+    validator = CsvValidator(ValidationReport(max_errors_per_rule=float("inf")))
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        rows = csv.reader(csv_file)
+        validator.check_header(next(rows))
+        for line_no, row in enumerate(rows, start=2):
+            validator.check_row(line_no, row)
+    return validator.report
+
+
+def validate_by_column(path):
+    from app.modules.flamapy.validation import ColumnarCsvValidator
+
+    with open(path, "rb") as csv_file:
+        return ColumnarCsvValidator().validate(csv_file)
+
+
+@click.command(
+    "flamapy:benchmark-validation",
+    help="Compares the column-wise CSV validator with the row by row one on synthetic players files.",
+)
+@click.option("--rows", default="1000000", show_default=True, help="Comma separated numbers of rows.")
+@click.option("--invalid-ratio", default=0.01, show_default=True, help="Share of rows with a wrong cell.")
+@click.option("--seed", default=0, show_default=True)
+def flamapy_benchmark_validation(rows, invalid_ratio, seed):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        for row_count in [int(count) for count in rows.split(",")]:
+            path = os.path.join(directory, f"players_{row_count}.csv")
+            write_players_csv(path, row_count, invalid_ratio, rng)
+            megabytes = os.path.getsize(path) / 1024**2
+            click.echo(click.style(f"{row_count} rows, {megabytes:.1f} MB", fg="yellow"))
+
+            timings = {}
+            for name, validate in (("row by row", validate_row_by_row), ("column-wise", validate_by_column)):
+                start = time.perf_counter()
+                report = validate(path)
+                timings[name] = elapsed = time.perf_counter() - start
+                click.echo(
+                    f"  {name}: {elapsed:.2f}s, {row_count / elapsed:,.0f} rows/s, {megabytes / elapsed:.1f} MB/s, "
+                    f"{report.error_count} errors"
+                )
+            click.echo(click.style(f"  speedup: {timings['row by row'] / timings['column-wise']:.1f}x", fg="green"))
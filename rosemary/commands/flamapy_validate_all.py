@@ -0,0 +1,47 @@
+import click
+from flask.cli import with_appcontext
+
+from rosemary.progress import format_throughput, make_progress_reporter
+
+
+@click.command(
+    "flamapy:validate-all",
+    help="Validates every stored CSV file with a pool of processes, writing a JSON line per file.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default="validation_report.ndjson",
+    show_default=True,
+    help="Report to write. The files it already has are skipped, so an interrupted run can be resumed.",
+)
+@click.option("--workers", type=int, default=None, help="Processes validating files. Defaults to the CPUs.")
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Results saved per transaction.")
+@click.option("--force", is_flag=True, help="Validate again the contents with a result of the current validator.")
+@with_appcontext
+def flamapy_validate_all(output, workers, batch_size, force):
+    from app.modules.flamapy.services import CsvBulkValidationService
+
+    report = make_progress_reporter()
+
+    click.echo(click.style(f"Validating the stored CSV files into {output}...", fg="yellow"))
+    try:
+        result = CsvBulkValidationService(workers=workers, batch_size=batch_size, force=force).validate_all(
+            output, progress=report
+        )
+    except Exception as e:
+        click.echo(click.style(f"Error validating files: {e}", fg="red"))
+        return
+
+    if result["skipped"]:
+        click.echo(click.style(f"{result['skipped']} files were already in the report.", fg="yellow"))
+    if result["missing"]:
+        click.echo(click.style(f"{result['missing']} files could not be read.", fg="red"))
+    click.echo(
+        click.style(
+            f"{result['files']} files reported ({result['invalid']} invalid), {result['validated']} contents "
+            f"validated and {result['cached']} already cached in {result['seconds']:.2f}s: "
+            f"{format_throughput(result)}.",
+            fg="green",
+        )
+    )
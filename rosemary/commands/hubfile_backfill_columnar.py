@@ -0,0 +1,34 @@
+import click
+from flask.cli import with_appcontext
+
+from rosemary.progress import format_throughput, make_progress_reporter
+
+
+@click.command(
+    "hubfile:backfill-columnar",
+    help="Builds the columnar sidecars of the stored CSV files that have none, with a pool of processes.",
+)
+@click.option("--workers", type=int, default=None, help="Processes building sidecars. Defaults to the CPUs.")
+@click.option("--force", is_flag=True, help="Build again the sidecars that are up to date.")
+@with_appcontext
+def hubfile_backfill_columnar(workers, force):
+    from app.modules.hubfile.services import ColumnarSidecarService
+
+    report = make_progress_reporter()
+
+    click.echo(click.style("Building the columnar sidecars of the stored CSV files...", fg="yellow"))
+    try:
+        result = ColumnarSidecarService().backfill(workers=workers, force=force, progress=report)
+    except Exception as e:
+        click.echo(click.style(f"Error building columnar sidecars: {e}", fg="red"))
+        return
+
+    if result["missing"]:
+        click.echo(click.style(f"{result['missing']} files could not be read.", fg="red"))
+    click.echo(
+        click.style(
+            f"{result['built']} sidecars built and {result['current']} files already up to date in "
+            f"{result['seconds']:.2f}s: {format_throughput(result)}.",
+            fg="green",
+        )
+    )
@@ -0,0 +1,27 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "hubfile:dedup",
+    help="Moves the uploaded files into the blob store, hardlinking duplicates, and removes unreferenced blobs.",
+)
+@with_appcontext
+def hubfile_dedup():
+    from app.modules.hubfile.services import HubfileBlobService
+
+    click.echo(click.style("Deduplicating uploaded files...", fg="yellow"))
+    try:
+        result = HubfileBlobService().deduplicate()
+    except Exception as e:
+        click.echo(click.style(f"Error deduplicating uploaded files: {e}", fg="red"))
+        return
+    if result["missing"]:
+        click.echo(click.style(f"{result['missing']} files are not on disk.", fg="yellow"))
+    click.echo(
+        click.style(
+            f"{result['linked']} of {result['files']} files linked to {result['blobs']} blobs, "
+            f"{result['removed']} unreferenced blobs removed.",
+            fg="green",
+        )
+    )
@@ -0,0 +1,19 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "jobs:recover",
+    help="Queues again the background jobs that a restart left queued, running or retrying.",
+)
+@with_appcontext
+def jobs_recover():
+    from core.managers.job_manager import get_jobs
+
+    click.echo(click.style("Looking for stale background jobs...", fg="yellow"))
+    try:
+        recovered = get_jobs().recover_stale()
+    except Exception as e:
+        click.echo(click.style(f"Error recovering background jobs: {e}", fg="red"))
+        return
+    click.echo(click.style(f"{recovered} stale jobs queued again.", fg="green"))
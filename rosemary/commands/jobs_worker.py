@@ -0,0 +1,25 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "jobs:worker",
+    help="Runs the background jobs queued in Redis (JOB_QUEUE_BACKEND=rq), such as dataset publications.",
+)
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+@with_appcontext
+def jobs_worker(burst):
+    from core.managers.job_manager import run_worker
+
+    if current_app.config["JOB_QUEUE_BACKEND"] != "rq":
+        click.echo(click.style("JOB_QUEUE_BACKEND is not 'rq', jobs run inside the web process.", fg="yellow"))
+        return
+
+    click.echo(click.style(f"Listening for jobs on '{current_app.config['JOB_QUEUE_NAME']}'...", fg="yellow"))
+    try:
+        run_worker(current_app._get_current_object(), burst=burst)
+    except Exception as e:
+        click.echo(click.style(f"Error running the job worker: {e}", fg="red"))
+        return
+    click.echo(click.style("Job worker stopped.", fg="green"))
@@ -0,0 +1,21 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command(
+    "stats:reconcile",
+    help="Recomputes the platform statistics shown on the homepage from the source tables.",
+)
+@with_appcontext
+def stats_reconcile():
+    from app.modules.public.services import PlatformStatisticsService
+
+    click.echo(click.style("Reconciling the platform statistics...", fg="yellow"))
+    try:
+        counts = PlatformStatisticsService().reconcile()
+    except Exception as e:
+        click.echo(click.style(f"Error reconciling the platform statistics: {e}", fg="red"))
+        return
+    for name, value in counts.items():
+        click.echo(f"  {name}: {value}")
+    click.echo(click.style("Platform statistics reconciled.", fg="green"))
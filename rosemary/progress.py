@@ -0,0 +1,34 @@
+import time
+
+import click
+
+# Seconds between two progress lines of the bulk commands
+PROGRESS_INTERVAL = 1.0
+
+
+def format_throughput(result):
+    """
+    Files done out of the total and their rate, from the running totals of a bulk command.
+    """
+    seconds = max(result["seconds"], 1e-9)
+    return (
+        f"{result['files']}/{result['total_files']} files, "
+        f"{result['files'] / seconds:.1f} files/s, {result['bytes'] / seconds / 1024 / 1024:.1f} MB/s"
+    )
+
+
+def make_progress_reporter(interval=PROGRESS_INTERVAL):
+    """
+    Progress callback for the services of the bulk commands, which call it after every file: it prints the
+    throughput at most once every `interval` seconds.
+    """
+    last_report = time.perf_counter()
+
+    def report(result):
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= interval:
+            last_report = now
+            click.echo(f"  {format_throughput(result)}")
+
+    return report